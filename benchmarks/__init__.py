@@ -0,0 +1,6 @@
+"""
+Offline benchmarks for the inmydata MCP server.
+
+Run from the repository root, e.g.:
+    python -m benchmarks.run_benchmarks --rows 1000,100000 --output bench_results.json
+"""
@@ -0,0 +1,145 @@
+"""
+Cold-start measurement for the STDIO server (server.py).
+
+STDIO clients spawn server.py once per session, so the time until the first
+`list_tools` response is what users wait for. This script spawns the server under
+`python -X importtime`, performs the MCP handshake and `list_tools`, and reports:
+
+  - time to first list_tools (spawn -> response), median over --runs
+  - import cost per module (cumulative and self), from the server's importtime output
+  - whether pandas / numpy / duckdb / the inmydata SDK were imported at startup
+
+    python -m benchmarks.cold_start --runs 5 --budget-ms 1000 --output cold_start.json
+
+Exits non-zero when the median time to first list_tools exceeds --budget-ms.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ("pandas", "numpy", "duckdb", "inmydata_openedge")
+
+
+def _parse_importtime(text: str) -> List[Dict[str, Any]]:
+    """Parse `-X importtime` lines into {module, self_us, cumulative_us, depth}."""
+    entries: List[Dict[str, Any]] = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        parts = line.split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0].split(":", 1)[1].strip())
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        raw_name = parts[2].rstrip()
+        stripped = raw_name.lstrip()
+        entries.append({
+            "module": stripped,
+            "self_us": self_us,
+            "cumulative_us": cumulative_us,
+            # importtime indents nested imports by two spaces per level
+            "depth": (len(raw_name) - len(stripped) - 1) // 2,
+        })
+    return entries
+
+
+async def _measure_once(server_script: str) -> Dict[str, Any]:
+    from mcp import ClientSession
+    from mcp.client.stdio import StdioServerParameters, stdio_client
+
+    env = dict(os.environ)
+    env["MCP_DEBUG"] = "0"
+    params = StdioServerParameters(
+        command=sys.executable,
+        args=["-X", "importtime", server_script],
+        cwd=REPO_ROOT,
+        env=env,
+    )
+
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8") as errlog:
+        started = time.perf_counter()
+        async with stdio_client(params, errlog=errlog) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                initialized = time.perf_counter()
+                tools = await session.list_tools()
+                listed = time.perf_counter()
+        errlog.seek(0)
+        imports = _parse_importtime(errlog.read())
+
+    imported = {entry["module"].split(".")[0] for entry in imports}
+    return {
+        "initialize_ms": round((initialized - started) * 1000.0, 1),
+        "first_list_tools_ms": round((listed - started) * 1000.0, 1),
+        "tool_count": len(tools.tools),
+        "heavy_modules_imported": sorted(m for m in HEAVY_MODULES if m in imported),
+        "imports": imports,
+    }
+
+
+def _top(imports: List[Dict[str, Any]], key: str, limit: int, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+    selected = [e for e in imports if max_depth is None or e["depth"] <= max_depth]
+    selected.sort(key=lambda e: e[key], reverse=True)
+    return [{"module": e["module"], "ms": round(e[key] / 1000.0, 2)} for e in selected[:limit]]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Measure STDIO server cold start")
+    parser.add_argument("--server", default="server.py", help="Server script to spawn (relative to the repo root)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Budget for median time to first list_tools")
+    parser.add_argument("--top", type=int, default=15, help="Number of modules to show per ranking")
+    parser.add_argument("--output", default="", help="Optional JSON output path")
+    args = parser.parse_args(argv)
+
+    runs = [asyncio.run(_measure_once(args.server)) for _ in range(args.runs)]
+    first_list = [r["first_list_tools_ms"] for r in runs]
+    median = statistics.median(first_list)
+    last = runs[-1]
+
+    report = {
+        "server": args.server,
+        "runs": args.runs,
+        "first_list_tools_ms": {
+            "median": round(median, 1),
+            "min": min(first_list),
+            "max": max(first_list),
+            "samples": first_list,
+        },
+        "initialize_ms_median": round(statistics.median(r["initialize_ms"] for r in runs), 1),
+        "tool_count": last["tool_count"],
+        "heavy_modules_imported": last["heavy_modules_imported"],
+        "budget_ms": args.budget_ms,
+        "within_budget": median <= args.budget_ms,
+        "top_level_imports_cumulative": _top(last["imports"], "cumulative_us", args.top, max_depth=0),
+        "imports_by_self_time": _top(last["imports"], "self_us", args.top),
+    }
+
+    print(f"time to first list_tools: median {report['first_list_tools_ms']['median']} ms "
+          f"(min {report['first_list_tools_ms']['min']}, max {report['first_list_tools_ms']['max']}) "
+          f"budget {args.budget_ms} ms -> {'OK' if report['within_budget'] else 'OVER BUDGET'}", file=sys.stderr)
+    print(f"heavy modules imported at startup: {report['heavy_modules_imported'] or 'none'}", file=sys.stderr)
+    print("top-level imports (cumulative):", file=sys.stderr)
+    for entry in report["top_level_imports_cumulative"]:
+        print(f"  {entry['ms']:>9.2f} ms  {entry['module']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    return 0 if report["within_budget"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Local stand-in for a Redis server, enough for the shared cache backend (mcp_cache_backend).
+
+Speaks RESP and supports PING, AUTH, SELECT, GET, SET (with EX/PX), DEL, EXISTS, PTTL,
+DBSIZE and FLUSHDB, keeping everything in memory. Run it, then point replicas at it:
+
+    python -m benchmarks.fake_redis --port 6380
+    MCP_CACHE_BACKEND=redis MCP_CACHE_REDIS_URL=redis://127.0.0.1:6380/0 python -m benchmarks.stub_server --port 8765
+    MCP_CACHE_BACKEND=redis MCP_CACHE_REDIS_URL=redis://127.0.0.1:6380/0 python -m benchmarks.stub_server --port 8766
+
+or start one in-process with FakeRedis().start().
+"""
+import argparse
+import os
+import socketserver
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    server: "FakeRedis"
+
+    def _read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command, e.g. from redis-cli or telnet
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self) -> None:
+        authenticated = self.server.password is None
+        while True:
+            args = self._read_command()
+            if args is None:
+                return
+            if not args:
+                continue
+            name = args[0].decode().upper()
+            if name == "AUTH":
+                authenticated = args[-1].decode() == self.server.password
+                reply = b"+OK\r\n" if authenticated else b"-WRONGPASS invalid password\r\n"
+            elif not authenticated:
+                reply = b"-NOAUTH Authentication required.\r\n"
+            else:
+                reply = self.server.execute(name, args[1:])
+            self.wfile.write(reply)
+            self.wfile.flush()
+
+
+class FakeRedis(socketserver.ThreadingTCPServer):
+    """In-memory RESP server; port 0 picks a free port (see .port)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, password: Optional[str] = None):
+        super().__init__((host, port), _Handler)
+        self.password = password
+        # key: (value, time.monotonic() when it expires or None)
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.commands = 0
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def start(self) -> "FakeRedis":
+        threading.Thread(target=self.serve_forever, name="fake-redis", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def _live(self, key: bytes) -> Optional[bytes]:
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and time.monotonic() >= entry[1]:
+            del self.data[key]
+            return None
+        return entry[0]
+
+    def execute(self, name: str, args: List[bytes]) -> bytes:
+        with self._lock:
+            self.commands += 1
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name == "SELECT":
+                return b"+OK\r\n"
+            if name == "GET":
+                value = self._live(args[0])
+                return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == "SET":
+                expires = None
+                options = [a.decode().upper() for a in args[2:]]
+                for i, option in enumerate(options[:-1]):
+                    if option == "PX":
+                        expires = time.monotonic() + int(options[i + 1]) / 1000.0
+                    elif option == "EX":
+                        expires = time.monotonic() + int(options[i + 1])
+                self.data[args[0]] = (args[1], expires)
+                return b"+OK\r\n"
+            if name in ("DEL", "EXISTS"):
+                found = [k for k in args if self._live(k) is not None]
+                if name == "DEL":
+                    for key in found:
+                        del self.data[key]
+                return b":%d\r\n" % len(found)
+            if name == "PTTL":
+                if self._live(args[0]) is None:
+                    return b":-2\r\n"
+                expires = self.data[args[0]][1]
+                return b":%d\r\n" % (-1 if expires is None else int((expires - time.monotonic()) * 1000))
+            if name == "DBSIZE":
+                return b":%d\r\n" % len(self.data)
+            if name == "FLUSHDB":
+                self.data.clear()
+                return b"+OK\r\n"
+            return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="In-memory Redis protocol stand-in")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+    server = FakeRedis(args.host, args.port, args.password)
+    print(f"Fake Redis listening on redis://{args.host}:{server.port}/0 (pid {os.getpid()})", flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
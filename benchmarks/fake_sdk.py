@@ -0,0 +1,283 @@
+"""
+Synthetic stand-ins for the inmydata SDK's StructuredDataDriver and CalendarAssistant.
+
+The fakes return deterministic DataFrames (same request + same spec => same data) with
+a configurable number of rows, extra columns, per-field dtypes and injected latency, so
+mcp_utils and the MCP tools can be measured without a live inmydata tenant.
+
+Usage:
+    from benchmarks import fake_sdk
+    fake_sdk.install(fake_sdk.SyntheticSpec(rows=100_000, latency_ms=50))
+    ...  # mcp_utils / server.py now talk to the fakes
+    fake_sdk.uninstall()
+"""
+import json
+import sys
+import time
+import zlib
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from inmydata_openedge import CalendarAssistant as _calendar_module
+from inmydata_openedge import StructuredData as _structured_module
+from inmydata_openedge.CalendarAssistant import CalendarPeriodDateRange, CalendarPeriodType, FinancialPeriodDetails
+
+SUBJECT = "Sales"
+SYSTEM = "sports2000"
+
+# Dimension fields of the synthetic subject: name -> (dtype, cardinality)
+_DIMENSIONS: Dict[str, tuple] = {
+    "Region": ("string", 8),
+    "Product Category": ("string", 25),
+    "Store Code": ("string", 400),
+    "Customer Name": ("string", 5000),
+    "Financial Year": ("int", 6),
+    "Financial Week": ("int", 52),
+    "Transaction Date": ("date", 2000),
+}
+
+# Metric fields of the synthetic subject: name -> dtype
+_METRICS: Dict[str, str] = {
+    "Sales Value": "float",
+    "Quantity": "int",
+    "Profit Margin %": "float",
+    "Cost Value": "float",
+}
+
+_WORDS = ["North", "South", "East", "West", "Central", "Coastal", "Metro", "Rural",
+          "Alpha", "Bravo", "Delta", "Echo", "Falcon", "Granite", "Harbor", "Summit"]
+
+
+@dataclass
+class SyntheticSpec:
+    """
+    Shape of the synthetic data returned by the fakes.
+
+    rows: rows returned for a non-summary request (summary requests return the distinct
+          dimension combinations found in those rows).
+    extra_dimensions / extra_metrics: additional "Attribute N" / "Metric N" fields added to the schema.
+    dtypes: per-field dtype overrides ("string", "int", "float", "date", "bool").
+    latency_ms: fixed latency injected into every upstream call.
+    latency_per_1k_rows_ms: additional latency per thousand rows returned by get_data.
+    seed: base seed mixed into every request's hash.
+    """
+    rows: int = 1000
+    extra_dimensions: int = 0
+    extra_metrics: int = 0
+    dtypes: Dict[str, str] = field(default_factory=dict)
+    latency_ms: float = 0.0
+    latency_per_1k_rows_ms: float = 0.0
+    seed: int = 0
+
+    def dimensions(self) -> Dict[str, tuple]:
+        dims = dict(_DIMENSIONS)
+        for i in range(1, self.extra_dimensions + 1):
+            dims[f"Attribute {i}"] = ("string", 50)
+        return dims
+
+    def metrics(self) -> Dict[str, str]:
+        metrics = dict(_METRICS)
+        for i in range(1, self.extra_metrics + 1):
+            metrics[f"Metric {i}"] = "float"
+        return metrics
+
+
+_spec = SyntheticSpec()
+_originals: Dict[str, Any] = {}
+
+
+def _sleep(rows: int = 0) -> None:
+    delay = _spec.latency_ms + _spec.latency_per_1k_rows_ms * rows / 1000.0
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+
+
+def _request_seed(*parts: Any) -> int:
+    key = json.dumps([_spec.seed, *parts], default=str, sort_keys=True)
+    return zlib.crc32(key.encode("utf-8"))
+
+
+def _column(rng: np.random.Generator, name: str, dtype: str, cardinality: int, rows: int) -> Any:
+    if dtype == "string":
+        codes = rng.integers(0, cardinality, rows)
+        labels = np.array([f"{_WORDS[i % len(_WORDS)]} {name} {i}" for i in range(cardinality)], dtype=object)
+        return labels[codes]
+    if dtype == "int":
+        if "Year" in name:
+            return rng.integers(2020, 2020 + cardinality, rows)
+        return rng.integers(1, max(cardinality, 2) + 1, rows)
+    if dtype == "date":
+        # Upstream CSV delivers dates as ISO strings
+        start = date(2020, 1, 1)
+        days = rng.integers(0, cardinality, rows)
+        return np.array([(start + timedelta(days=int(d))).isoformat() for d in days], dtype=object)
+    if dtype == "bool":
+        return rng.integers(0, 2, rows).astype(bool)
+    return np.round(rng.gamma(2.0, 500.0, rows), 2)
+
+
+class FakeStructuredDataDriver:
+    """Drop-in replacement for inmydata_openedge.StructuredData.StructuredDataDriver."""
+
+    def __init__(self, tenant: str, server: str = "inmydata.com", user: Optional[str] = None,
+                 session_id: Optional[str] = None, api_key: Optional[str] = None,
+                 type: Optional[str] = None, *args: Any, **kwargs: Any):
+        self.tenant = tenant
+        self.server = server
+        self.user = user
+        self.session_id = session_id
+        self.api_key = api_key
+        self.type = type
+
+    def get_schema(self, source: Optional[str] = None) -> str:
+        _sleep()
+        facts = {
+            name: {"name": name, "type": dtype, "aiDescription": f"Synthetic {name}"}
+            for name, (dtype, _) in _spec.dimensions().items()
+        }
+        metrics = {
+            name: {"name": name, "type": dtype, "dimensionsUsed": [], "aiDescription": f"Synthetic {name}"}
+            for name, dtype in _spec.metrics().items()
+        }
+        subject = {
+            "name": SUBJECT,
+            "aiDescription": "Synthetic sales subject",
+            "factFieldTypes": facts,
+            "metricFieldTypes": metrics,
+            "system": SYSTEM,
+            "numDimensions": len(facts),
+            "numMetrics": len(metrics),
+        }
+        return json.dumps({
+            "schemaVersion": 1,
+            "generatedAt": datetime.now().isoformat(timespec="seconds") + "Z",
+            "source": source,
+            "subjectsCount": 1,
+            "subjects": [subject],
+        }, separators=(",", ":"))
+
+    def get_data(self, subject: str, fields: List[str], filters: list, SummaryRequest: bool,
+                 System: str, TopNUsed: Optional[dict] = None) -> Optional[pd.DataFrame]:
+        filter_key = [f.to_dict() for f in filters or []]
+        topn_key = {k: v.to_dict() for k, v in (TopNUsed or {}).items()}
+        rng = np.random.default_rng(_request_seed(subject, fields, filter_key, SummaryRequest, System, topn_key, _spec.rows))
+
+        dims = _spec.dimensions()
+        metrics = _spec.metrics()
+        data: Dict[str, Any] = {}
+        for name in fields:
+            if name in dims:
+                dtype, cardinality = dims[name]
+            else:
+                dtype, cardinality = metrics.get(name, "float"), 1000
+            dtype = _spec.dtypes.get(name, dtype)
+            data[name] = _column(rng, name, dtype, cardinality, _spec.rows)
+        df = pd.DataFrame(data, columns=list(fields))
+
+        dim_fields = [f for f in fields if f in dims]
+        metric_fields = [f for f in fields if f not in dims]
+        if SummaryRequest and dim_fields:
+            agg = {m: "sum" for m in metric_fields}
+            df = df.groupby(dim_fields, as_index=False, sort=True).agg(agg) if agg else df.drop_duplicates(dim_fields)
+            df = df[list(fields)]
+
+        if TopNUsed:
+            option = next(iter(TopNUsed.values()))
+            n = int(option.NumberOfResults)
+            ranked = df.sort_values(option.MetricField, ascending=n < 0, kind="mergesort")
+            df = ranked.head(abs(n))
+
+        _sleep(len(df))
+        if len(df) == 0:
+            return None
+        return df.reset_index(drop=True)
+
+
+def _financial_year_start(year: int) -> date:
+    # Synthetic calendar: financial year N runs 1 April N .. 31 March N+1
+    return date(year, 4, 1)
+
+
+class FakeCalendarAssistant:
+    """Drop-in replacement for inmydata_openedge.CalendarAssistant.CalendarAssistant."""
+
+    def __init__(self, tenant: str, calendar_name: str, server: str = "inmydata.com",
+                 api_key: Optional[str] = None, *args: Any, **kwargs: Any):
+        self.tenant = tenant
+        self.calendar_name = calendar_name
+        self.server = server
+        self.api_key = api_key
+
+    def get_financial_periods(self, input_date: date) -> FinancialPeriodDetails:
+        _sleep()
+        year = input_date.year if input_date.month >= 4 else input_date.year - 1
+        start = _financial_year_start(year)
+        month = (input_date.month - 4) % 12 + 1
+        week = min((input_date - start).days // 7 + 1, 52)
+        quarter = (month - 1) // 3 + 1
+        return FinancialPeriodDetails(year, month, week, quarter)
+
+    def get_calendar_period_date_range(self, year: int, periodnumber: int,
+                                       periodtype: CalendarPeriodType) -> Optional[CalendarPeriodDateRange]:
+        _sleep()
+        start = _financial_year_start(year)
+        next_year = _financial_year_start(year + 1)
+        if periodtype == CalendarPeriodType.year:
+            if periodnumber != 1:
+                return None
+            return CalendarPeriodDateRange(start, next_year - timedelta(days=1))
+        if periodtype == CalendarPeriodType.week:
+            if not 1 <= periodnumber <= 52:
+                return None
+            first = start + timedelta(days=7 * (periodnumber - 1))
+            last = next_year - timedelta(days=1) if periodnumber == 52 else first + timedelta(days=6)
+            return CalendarPeriodDateRange(first, last)
+        months = 3 if periodtype == CalendarPeriodType.quarter else 1
+        count = 4 if periodtype == CalendarPeriodType.quarter else 12
+        if not 1 <= periodnumber <= count:
+            return None
+        first_month = (periodnumber - 1) * months
+        first = _add_months(start, first_month)
+        last = _add_months(start, first_month + months) - timedelta(days=1)
+        return CalendarPeriodDateRange(first, last)
+
+
+def _add_months(d: date, months: int) -> date:
+    total = d.month - 1 + months
+    return date(d.year + total // 12, total % 12 + 1, 1)
+
+
+def install(spec: Optional[SyntheticSpec] = None) -> None:
+    """Patch the SDK (and an already imported mcp_utils) to use the fakes."""
+    global _spec
+    _spec = spec or SyntheticSpec()
+    if not _originals:
+        _originals["driver"] = _structured_module.StructuredDataDriver
+        _originals["calendar"] = _calendar_module.CalendarAssistant
+    _structured_module.StructuredDataDriver = FakeStructuredDataDriver
+    _calendar_module.CalendarAssistant = FakeCalendarAssistant
+    utils_module = sys.modules.get("mcp_utils")
+    if utils_module is not None and hasattr(utils_module, "StructuredDataDriver"):
+        utils_module.StructuredDataDriver = FakeStructuredDataDriver
+
+
+def configure(spec: SyntheticSpec) -> None:
+    """Change the synthetic data shape without re-installing."""
+    global _spec
+    _spec = spec
+
+
+def uninstall() -> None:
+    """Restore the real SDK classes."""
+    if not _originals:
+        return
+    _structured_module.StructuredDataDriver = _originals["driver"]
+    _calendar_module.CalendarAssistant = _originals["calendar"]
+    utils_module = sys.modules.get("mcp_utils")
+    if utils_module is not None and hasattr(utils_module, "StructuredDataDriver"):
+        utils_module.StructuredDataDriver = _originals["driver"]
+    _originals.clear()
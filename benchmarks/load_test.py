@@ -0,0 +1,294 @@
+"""
+Concurrent load generator for the streamable-http server (server_remote.py).
+
+Grows test-client.py into a multi-session driver: each simulated agent session opens
+its own MCP session and runs a scripted tool mix
+
+    get_schema -> get_rows_fast (non-summary, persisted) -> N x query_results_fast
+
+By default a stub server (benchmarks/stub_server.py, backed by the synthetic SDK fakes)
+is started on a free port; pass --url to target an already running server instead.
+
+Reports throughput, p50/p95/p99 latency and error rate per tool, plus server RSS over
+time (when the server pid is known), and writes everything to JSON:
+
+    python -m benchmarks.load_test --sessions 50,200,500 --queries 3 --output load_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.fake_sdk import SUBJECT, SYSTEM  # noqa: E402
+from benchmarks.run_benchmarks import _percentile  # noqa: E402
+
+RAW_SELECT = ["Transaction Date", "Customer Name", "Store Code", "Region", "Sales Value", "Quantity"]
+QUERIES = [
+    'SELECT "Region", SUM("Sales Value") AS total FROM my_table GROUP BY 1 ORDER BY 2 DESC',
+    'SELECT "Store Code", COUNT(*) AS n FROM my_table GROUP BY 1 ORDER BY 2 DESC LIMIT 10',
+    'SELECT MIN("Transaction Date") AS first, MAX("Transaction Date") AS last FROM my_table',
+    'SELECT "Customer Name", SUM("Quantity") AS qty FROM my_table GROUP BY 1 ORDER BY 2 DESC LIMIT 5',
+    'SELECT AVG("Sales Value") AS avg_sale FROM my_table WHERE "Quantity" > 10',
+]
+
+
+class Recorder:
+    """Collects per-tool latencies and errors across all sessions."""
+
+    def __init__(self) -> None:
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: Dict[str, str] = {}
+
+    def record(self, tool: str, seconds: float, error: Optional[str]) -> None:
+        self.latencies[tool].append(seconds * 1000.0)
+        if error:
+            self.errors[tool] += 1
+            self.error_samples.setdefault(tool, error[:300])
+
+    def summary(self, wall_seconds: float) -> Dict[str, Any]:
+        tools: Dict[str, Any] = {}
+        total_calls = 0
+        total_errors = 0
+        for tool, samples in sorted(self.latencies.items()):
+            calls = len(samples)
+            errors = self.errors.get(tool, 0)
+            total_calls += calls
+            total_errors += errors
+            tools[tool] = {
+                "calls": calls,
+                "errors": errors,
+                "error_rate": round(errors / calls, 4) if calls else 0.0,
+                "p50_ms": round(_percentile(samples, 50), 2),
+                "p95_ms": round(_percentile(samples, 95), 2),
+                "p99_ms": round(_percentile(samples, 99), 2),
+                "max_ms": round(max(samples), 2) if samples else 0.0,
+                "throughput_per_s": round(calls / wall_seconds, 2) if wall_seconds else 0.0,
+            }
+            if tool in self.error_samples:
+                tools[tool]["error_sample"] = self.error_samples[tool]
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "total_calls": total_calls,
+            "total_errors": total_errors,
+            "error_rate": round(total_errors / total_calls, 4) if total_calls else 0.0,
+            "throughput_per_s": round(total_calls / wall_seconds, 2) if wall_seconds else 0.0,
+            "tools": tools,
+        }
+
+
+def _payload_error(result: Any) -> Tuple[Optional[str], Dict[str, Any]]:
+    if getattr(result, "is_error", False):
+        text = "".join(getattr(c, "text", "") for c in getattr(result, "content", []))
+        return text or "tool error", {}
+    text = "".join(getattr(c, "text", "") for c in getattr(result, "content", []))
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return (text[:300] if text.startswith("Error") else None), {}
+    if isinstance(payload, dict):
+        for key in ("error", "errorX"):
+            if payload.get(key):
+                return str(payload[key]), payload
+        return None, payload
+    return None, {}
+
+
+async def _timed_call(recorder: Recorder, client: Any, tool: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        result = await client.call_tool(tool, args, raise_on_error=False)
+        error, payload = _payload_error(result)
+    except Exception as e:
+        error, payload = f"{type(e).__name__}: {e}", {}
+    recorder.record(tool, time.perf_counter() - start, error)
+    return payload
+
+
+async def _session(index: int, url: str, tenant: str, queries: int, recorder: Recorder, start_delay: float) -> None:
+    from fastmcp.client import Client
+    from fastmcp.client.transports import StreamableHttpTransport
+
+    await asyncio.sleep(start_delay)
+    transport = StreamableHttpTransport(
+        url=url,
+        headers={
+            "Authorization": "Bearer load-test-key",
+            "x-inmydata-tenant": tenant,
+            "x-inmydata-calendar": "Default",
+            "x-inmydata-user": "load-test",
+            "x-inmydata-session-id": f"load-{index}",
+        },
+    )
+    start = time.perf_counter()
+    try:
+        async with Client(transport, timeout=120) as client:
+            recorder.record("session.initialize", time.perf_counter() - start, None)
+            await _timed_call(recorder, client, "get_schema", {})
+            rows = await _timed_call(recorder, client, "get_rows_fast", {
+                "subject": SUBJECT, "select": RAW_SELECT, "summary": False, "system": SYSTEM})
+            instance_id = rows.get("instance_id", "")
+            rng = random.Random(index)
+            for _ in range(queries):
+                if not instance_id:
+                    break
+                await _timed_call(recorder, client, "query_results_fast", {
+                    "instance_id": instance_id, "sql": rng.choice(QUERIES)})
+    except Exception as e:
+        recorder.record("session.initialize", time.perf_counter() - start, f"{type(e).__name__}: {e}")
+
+
+def _rss_bytes(pid: int) -> Optional[int]:
+    try:
+        with open(f"/proc/{pid}/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+async def _sample_rss(pid: Optional[int], samples: List[Dict[str, Any]], started: float,
+                      interval: float, stop: asyncio.Event) -> None:
+    if not pid:
+        return
+    while not stop.is_set():
+        rss = _rss_bytes(pid)
+        if rss is not None:
+            samples.append({"t": round(time.perf_counter() - started, 2), "rss_bytes": rss})
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _run_level(url: str, sessions: int, queries: int, tenants: int, ramp_up: float,
+                     server_pid: Optional[int], rss_interval: float) -> Dict[str, Any]:
+    recorder = Recorder()
+    rss_samples: List[Dict[str, Any]] = []
+    stop = asyncio.Event()
+    started = time.perf_counter()
+    sampler = asyncio.create_task(_sample_rss(server_pid, rss_samples, started, rss_interval, stop))
+
+    tasks = [
+        _session(i, url, f"tenant{i % tenants}", queries, recorder, ramp_up * i / max(sessions, 1))
+        for i in range(sessions)
+    ]
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    result = recorder.summary(wall)
+    result["sessions"] = sessions
+    result["server_rss"] = {
+        "samples": rss_samples,
+        "max_bytes": max((s["rss_bytes"] for s in rss_samples), default=None),
+    }
+    return result
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float) -> bool:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def _print_level(level: Dict[str, Any]) -> None:
+    print(f"\nsessions={level['sessions']}  calls={level['total_calls']}  "
+          f"throughput={level['throughput_per_s']}/s  errors={level['error_rate'] * 100:.2f}%  "
+          f"wall={level['wall_seconds']}s  max_rss={(level['server_rss']['max_bytes'] or 0) / 1e6:.1f} MB",
+          file=sys.stderr)
+    print(f"  {'tool':<22}{'calls':>7}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=sys.stderr)
+    for tool, stats in level["tools"].items():
+        print(f"  {tool:<22}{stats['calls']:>7}{stats['error_rate'] * 100:>8.2f}"
+              f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}", file=sys.stderr)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Concurrent load test for the streamable-http MCP server")
+    parser.add_argument("--url", default="", help="Target server URL (default: start a local stub server)")
+    parser.add_argument("--server-pid", type=int, default=0, help="PID of the target server, for RSS sampling")
+    parser.add_argument("--sessions", default="50", help="Comma separated concurrent session counts, e.g. 50,200,500")
+    parser.add_argument("--queries", type=int, default=3, help="query_results_fast calls per session")
+    parser.add_argument("--tenants", type=int, default=5, help="Number of distinct tenants the sessions are spread across")
+    parser.add_argument("--ramp-up", type=float, default=2.0, help="Seconds over which sessions are started")
+    parser.add_argument("--rss-interval", type=float, default=0.5, help="Seconds between server RSS samples")
+    parser.add_argument("--rows", type=int, default=10000, help="Stub server: rows per non-summary get_rows")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Stub server: injected upstream latency")
+    parser.add_argument("--output", default="load_results.json")
+    args = parser.parse_args(argv)
+
+    stub: Optional[subprocess.Popen] = None
+    url = args.url
+    server_pid: Optional[int] = args.server_pid or None
+    if not url:
+        port = _free_port()
+        stub = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.stub_server", "--port", str(port),
+             "--rows", str(args.rows), "--latency-ms", str(args.latency_ms)],
+            cwd=REPO_ROOT,
+        )
+        if not _wait_for_port(port, 60):
+            stub.terminate()
+            print("Stub server did not start", file=sys.stderr)
+            return 1
+        url = f"http://127.0.0.1:{port}/mcp"
+        server_pid = stub.pid
+
+    levels: List[Dict[str, Any]] = []
+    try:
+        for sessions in [int(s) for s in args.sessions.split(",") if s]:
+            level = asyncio.run(_run_level(url, sessions, args.queries, args.tenants, args.ramp_up,
+                                           server_pid, args.rss_interval))
+            _print_level(level)
+            levels.append(level)
+    finally:
+        if stub is not None:
+            stub.terminate()
+            try:
+                stub.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                stub.kill()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "url": url,
+            "stub_server": stub is not None,
+        },
+        "config": vars(args),
+        "levels": levels,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote results to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
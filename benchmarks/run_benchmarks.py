@@ -0,0 +1,313 @@
+"""
+Offline benchmark harness for mcp_utils and the MCP tools.
+
+Swaps the inmydata SDK for the synthetic fakes in benchmarks/fake_sdk.py, then measures
+end-to-end latency and Python memory for:
+  - each mcp_utils method, called directly
+  - each MCP tool of server.py, called through the in-process FastMCP transport
+
+Results are written as JSON so runs can be compared between releases:
+
+    python -m benchmarks.run_benchmarks --rows 1000,100000 --output bench_results.json
+    python -m benchmarks.run_benchmarks --baseline bench_results.json --max-regression 20
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_sdk  # noqa: E402
+
+Call = Callable[[], Awaitable[Any]]
+
+
+def _current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux only)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _summarize(samples_ms: List[float]) -> Dict[str, float]:
+    return {
+        "min": round(min(samples_ms), 3),
+        "p50": round(_percentile(samples_ms, 50), 3),
+        "p95": round(_percentile(samples_ms, 95), 3),
+        "max": round(max(samples_ms), 3),
+        "mean": round(statistics.fmean(samples_ms), 3),
+    }
+
+
+def _check_result(result: Any) -> Optional[str]:
+    """Return an error message if a tool/method result reports an error."""
+    text = result
+    if hasattr(result, "content"):
+        text = "".join(getattr(c, "text", "") for c in result.content)
+    if isinstance(text, str):
+        try:
+            payload = json.loads(text)
+        except ValueError:
+            return text[:200] if text.startswith("Error") else None
+        if isinstance(payload, dict):
+            for key in ("error", "errorX"):
+                if payload.get(key):
+                    return str(payload[key])
+    return None
+
+
+async def _measure(name: str, call: Call, iterations: int, warmup: int) -> Dict[str, Any]:
+    for _ in range(warmup):
+        await call()
+
+    samples: List[float] = []
+    error: Optional[str] = None
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = await call()
+        samples.append((time.perf_counter() - start) * 1000.0)
+        error = error or _check_result(result)
+
+    # Separate pass for memory so tracemalloc overhead doesn't skew latency
+    gc.collect()
+    tracemalloc.start()
+    await call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    entry: Dict[str, Any] = {
+        "name": name,
+        "iterations": iterations,
+        "latency_ms": _summarize(samples),
+        "peak_python_alloc_bytes": peak,
+        "rss_bytes": _current_rss(),
+    }
+    if error:
+        entry["error"] = error
+    return entry
+
+
+def _utils_cases(spec: fake_sdk.SyntheticSpec) -> Dict[str, Call]:
+    import mcp_utils as module
+
+    def utils() -> "module.mcp_utils":
+        return module.mcp_utils("bench-key", "bench", "Default", "bench-user", "bench-session", "inmydata.com", "OpenEdge")
+
+    select = ["Region", "Product Category", "Financial Week", "Sales Value", "Quantity"]
+    raw_select = ["Transaction Date", "Customer Name", "Store Code", "Sales Value", "Quantity", "Cost Value"]
+    persisted: Dict[str, str] = {}
+
+    async def query_results() -> Any:
+        if "instance_id" not in persisted:
+            result = json.loads(await utils().get_rows(fake_sdk.SUBJECT, raw_select, False, fake_sdk.SYSTEM, []))
+            persisted["instance_id"] = result.get("instance_id", "")
+        sql = 'SELECT "Store Code", SUM("Sales Value") AS total FROM my_table GROUP BY 1 ORDER BY 2 DESC LIMIT 20'
+        return await utils().query_results(persisted["instance_id"], sql)
+
+    async def get_schema() -> Any:
+        return utils().get_schema()
+
+    return {
+        "get_schema": get_schema,
+        "get_rows.summary": lambda: utils().get_rows(fake_sdk.SUBJECT, select, True, fake_sdk.SYSTEM, []),
+        "get_rows.raw": lambda: utils().get_rows(fake_sdk.SUBJECT, raw_select, False, fake_sdk.SYSTEM, []),
+        "get_top_n": lambda: utils().get_top_n(fake_sdk.SUBJECT, "Store Code", "Sales Value", 10, fake_sdk.SYSTEM, []),
+        "query_results": query_results,
+        "get_financial_periods": lambda: utils().get_financial_periods("2025-06-15"),
+        "get_calendar_period_date_range": lambda: utils().get_calendar_period_date_range(2025, 2, "quarter"),
+        "resolve_calendar": lambda: utils().resolve_calendar(
+            ["2025-06-15", "2025-06-16"], [[2025, 2, "quarter"]], ["previous 8 quarters"], "2025-06-15"),
+    }
+
+
+def _tool_cases(client: Any) -> Dict[str, Call]:
+    select = ["Region", "Product Category", "Financial Week", "Sales Value", "Quantity"]
+    raw_select = ["Transaction Date", "Customer Name", "Store Code", "Sales Value", "Quantity", "Cost Value"]
+    persisted: Dict[str, str] = {}
+
+    async def query_results_fast() -> Any:
+        if "instance_id" not in persisted:
+            result = await client.call_tool("get_rows_fast", {
+                "subject": fake_sdk.SUBJECT, "select": raw_select, "summary": False, "system": fake_sdk.SYSTEM})
+            text = "".join(getattr(c, "text", "") for c in result.content)
+            persisted["instance_id"] = json.loads(text).get("instance_id", "")
+        return await client.call_tool("query_results_fast", {
+            "instance_id": persisted["instance_id"],
+            "sql": 'SELECT "Store Code", SUM("Sales Value") AS total FROM my_table GROUP BY 1 ORDER BY 2 DESC LIMIT 20'})
+
+    return {
+        "list_tools": lambda: client.list_tools(),
+        "get_schema": lambda: client.call_tool("get_schema", {}),
+        "get_rows_fast.summary": lambda: client.call_tool("get_rows_fast", {
+            "subject": fake_sdk.SUBJECT, "select": select, "summary": True, "system": fake_sdk.SYSTEM}),
+        "get_rows_fast.raw": lambda: client.call_tool("get_rows_fast", {
+            "subject": fake_sdk.SUBJECT, "select": raw_select, "summary": False, "system": fake_sdk.SYSTEM}),
+        "get_top_n_fast": lambda: client.call_tool("get_top_n_fast", {
+            "subject": fake_sdk.SUBJECT, "group_by": "Store Code", "order_by": "Sales Value", "n": 10,
+            "system": fake_sdk.SYSTEM}),
+        "query_results_fast": query_results_fast,
+        "get_financial_periods": lambda: client.call_tool("get_financial_periods", {"target_date": "2025-06-15"}),
+        "get_calendar_period_date_range": lambda: client.call_tool("get_calendar_period_date_range", {
+            "financial_year": 2025, "period_number": 2, "period_type": "quarter"}),
+        "resolve_calendar_periods": lambda: client.call_tool("resolve_calendar_periods", {
+            "dates": ["2025-06-15", "2025-06-16"], "periods": [[2025, 2, "quarter"]],
+            "expressions": ["previous 8 quarters"], "as_of": "2025-06-15"}),
+    }
+
+
+async def _run_scenario(spec: fake_sdk.SyntheticSpec, iterations: int, warmup: int,
+                        only: Optional[List[str]]) -> List[Dict[str, Any]]:
+    fake_sdk.configure(spec)
+    scenario = {
+        "rows": spec.rows,
+        "extra_dimensions": spec.extra_dimensions,
+        "extra_metrics": spec.extra_metrics,
+        "latency_ms": spec.latency_ms,
+    }
+    results: List[Dict[str, Any]] = []
+
+    for name, call in _utils_cases(spec).items():
+        if only and not any(o in f"mcp_utils.{name}" for o in only):
+            continue
+        entry = await _measure(f"mcp_utils.{name}", call, iterations, warmup)
+        entry["scenario"] = scenario
+        results.append(entry)
+        print(f"  {entry['name']:<45} p50={entry['latency_ms']['p50']:>10.2f} ms  peak={entry['peak_python_alloc_bytes'] / 1e6:>8.2f} MB", file=sys.stderr)
+
+    from fastmcp import Client
+    import server
+
+    async with Client(server.mcp) as client:
+        for name, call in _tool_cases(client).items():
+            if only and not any(o in f"tool.{name}" for o in only):
+                continue
+            entry = await _measure(f"tool.{name}", call, iterations, warmup)
+            entry["scenario"] = scenario
+            results.append(entry)
+            print(f"  {entry['name']:<45} p50={entry['latency_ms']['p50']:>10.2f} ms  peak={entry['peak_python_alloc_bytes'] / 1e6:>8.2f} MB", file=sys.stderr)
+
+    return results
+
+
+def _metadata() -> Dict[str, Any]:
+    versions: Dict[str, str] = {}
+    for package in ("pandas", "numpy", "duckdb", "mcp", "fastmcp"):
+        try:
+            module = __import__(package)
+            versions[package] = getattr(module, "__version__", "unknown")
+        except Exception:
+            versions[package] = "missing"
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=5).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "packages": versions,
+    }
+
+
+def _compare(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> int:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    def key(entry: Dict[str, Any]) -> str:
+        return f"{entry['name']}@{json.dumps(entry.get('scenario', {}), sort_keys=True)}"
+
+    previous = {key(e): e for e in baseline.get("results", [])}
+    regressions = 0
+    print(f"\nComparison against {baseline_path} (p50 latency):", file=sys.stderr)
+    for entry in results:
+        old = previous.get(key(entry))
+        if not old:
+            continue
+        before, after = old["latency_ms"]["p50"], entry["latency_ms"]["p50"]
+        change = ((after - before) / before * 100.0) if before > 0 else 0.0
+        flag = ""
+        if change > max_regression:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"  {entry['name']:<45} rows={entry['scenario']['rows']:<9} {before:>10.2f} -> {after:>10.2f} ms ({change:+.1f}%){flag}", file=sys.stderr)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the inmydata MCP server")
+    parser.add_argument("--rows", default="1000,100000", help="Comma separated row counts to benchmark")
+    parser.add_argument("--extra-dimensions", type=int, default=0, help="Extra synthetic string dimensions")
+    parser.add_argument("--extra-metrics", type=int, default=0, help="Extra synthetic float metrics")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Injected upstream latency per call")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", default="", help="Comma separated substrings of benchmark names to run")
+    parser.add_argument("--output", default="bench_results.json", help="Where to write the JSON results")
+    parser.add_argument("--baseline", default="", help="Previous results JSON to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Percent p50 slowdown vs baseline that counts as a regression")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="mcp-bench-") as workdir:
+        # Point the server at the fakes and a throwaway dataset directory
+        os.environ["MCP_DUCKDB_LOCATION"] = workdir
+        os.environ.setdefault("INMYDATA_TENANT", "bench")
+        os.environ.setdefault("INMYDATA_CALENDAR", "Default")
+        os.environ.setdefault("INMYDATA_API_KEY", "bench-key")
+        os.environ["MCP_DEBUG"] = "0"
+        # The MCP SDK logs every request at INFO; keep the benchmark output readable
+        logging.getLogger("mcp").setLevel(logging.WARNING)
+        fake_sdk.install()
+
+        only = [o for o in args.only.split(",") if o] or None
+        results: List[Dict[str, Any]] = []
+        for rows in [int(r) for r in args.rows.split(",") if r]:
+            spec = fake_sdk.SyntheticSpec(rows=rows, extra_dimensions=args.extra_dimensions,
+                                          extra_metrics=args.extra_metrics, latency_ms=args.latency_ms)
+            print(f"Scenario rows={rows}", file=sys.stderr)
+            results.extend(asyncio.run(_run_scenario(spec, args.iterations, args.warmup, only)))
+
+        fake_sdk.uninstall()
+
+    report = {
+        "meta": _metadata(),
+        "config": vars(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {len(results)} results to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        return 1 if _compare(results, args.baseline, args.max_regression) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+"""
+Run server_remote.py's streamable-http app backed by the synthetic SDK fakes.
+
+Used by benchmarks/load_test.py, but can also be started on its own:
+
+    python -m benchmarks.stub_server --port 8765 --rows 50000 --latency-ms 40
+"""
+import argparse
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import fake_sdk  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="server_remote.py backed by a local SDK stub")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rows", type=int, default=10000, help="Rows returned by non-summary get_data calls")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Injected upstream latency per call")
+    parser.add_argument("--latency-per-1k-rows-ms", type=float, default=0.0)
+    args = parser.parse_args()
+
+    # The stub never talks to a real tenant, so always run the legacy (header) auth flow
+    os.environ["INMYDATA_USE_OAUTH"] = "false"
+    fake_sdk.install(fake_sdk.SyntheticSpec(rows=args.rows, latency_ms=args.latency_ms,
+                                            latency_per_1k_rows_ms=args.latency_per_1k_rows_ms))
+
+    import uvicorn
+    import server_remote
+
+    app = server_remote.mcp.streamable_http_app()
+    print(f"Stub MCP server listening on http://{args.host}:{args.port}/mcp (pid {os.getpid()})", flush=True)
+    uvicorn.run(app, host=args.host, port=args.port, ws="none", log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Per-tenant admission control for the remote MCP server.
+
+Every tool call that reaches the inmydata platform is admitted through two gates, keyed
+by the tenant that utils() resolved for the request:
+
+  1. A token bucket (rate + burst). An empty bucket rejects the call immediately.
+  2. A concurrency limit with a bounded FIFO wait queue. When all slots are busy the
+     call waits for a free slot; when the queue is full, or the wait exceeds the queue
+     timeout, the call is rejected.
+
+Rejected calls raise AdmissionRejected, which carries a retry_after hint (seconds) so the
+tool can return a fast, structured error instead of queuing forever.
+
+Configuration (environment variables, defaults for every tenant):
+  MCP_TENANT_RATE_PER_SECOND    - sustained calls per second, 0 disables the bucket (default 10)
+  MCP_TENANT_BURST              - bucket capacity (default 30)
+  MCP_TENANT_CONCURRENCY        - calls in flight at once (default 8)
+  MCP_TENANT_QUEUE_DEPTH        - calls allowed to wait for a slot (default 32)
+  MCP_TENANT_QUEUE_TIMEOUT      - seconds a call may wait for a slot (default 15)
+  MCP_TENANT_LIMITS             - JSON per-tenant overrides, e.g.
+                                  {"acme": {"rate": 2, "burst": 5, "concurrency": 2, "queue_depth": 4}}
+
+Usage:
+    from mcp_admission import admission, AdmissionRejected
+    async with admission.admit(tenant, "get_rows_fast") as waited:
+        ...
+"""
+import asyncio
+import json
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from mcp_logging import get_logger
+
+log = get_logger("admission")
+
+# Idle tenant states are pruned once this many tenants have been seen
+_MAX_IDLE_TENANTS = 1024
+
+
+@dataclass(frozen=True)
+class TenantLimits:
+    rate: float = 10.0
+    burst: float = 30.0
+    concurrency: int = 8
+    queue_depth: int = 32
+    queue_timeout: float = 15.0
+
+    @classmethod
+    def from_env(cls) -> "TenantLimits":
+        return cls(
+            rate=_env_number("MCP_TENANT_RATE_PER_SECOND", 10.0),
+            burst=_env_number("MCP_TENANT_BURST", 30.0),
+            concurrency=max(1, int(_env_number("MCP_TENANT_CONCURRENCY", 8))),
+            queue_depth=max(0, int(_env_number("MCP_TENANT_QUEUE_DEPTH", 32))),
+            queue_timeout=_env_number("MCP_TENANT_QUEUE_TIMEOUT", 15.0),
+        )
+
+    def with_overrides(self, values: Any) -> "TenantLimits":
+        """These limits with some replaced, e.g. {"rate": 2}. Raises ValueError for unknown or non-numeric values."""
+        if not isinstance(values, dict):
+            raise ValueError("limits must be an object")
+        changes: Dict[str, Any] = {}
+        for name, value in values.items():
+            if name not in self.__dataclass_fields__:
+                raise ValueError(f"unknown limit {name!r}")
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"limit {name!r} must be a number")
+            changes[name] = float(value)
+        if "concurrency" in changes:
+            changes["concurrency"] = max(1, int(changes["concurrency"]))
+        if "queue_depth" in changes:
+            changes["queue_depth"] = max(0, int(changes["queue_depth"]))
+        return replace(self, **changes)
+
+
+def _env_number(name: str, default: float) -> float:
+    """A numeric environment variable; default (with an error logged) when it is not a number."""
+    raw = os.environ.get(name)
+    if raw is None or not raw.strip():
+        return default
+    try:
+        return float(raw)
+    except ValueError:
+        log.error("admission.invalid_limit", variable=name, value=raw, default=default)
+        return default
+
+
+class AdmissionRejected(RuntimeError):
+    """Raised when a tenant's call is refused by the rate limit or the wait queue."""
+
+    def __init__(self, tenant: str, reason: str, retry_after: float, message: str):
+        super().__init__(message)
+        self.tenant = tenant
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_json(self) -> str:
+        return json.dumps({"error": str(self), "reason": self.reason, "retry_after": self.retry_after})
+
+
+class _TenantState:
+    def __init__(self, limits: TenantLimits):
+        self.limits = limits
+        self.tokens = limits.burst
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        # Exponentially weighted mean call duration, used for retry_after hints
+        self.service_seconds = 1.0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+        self.wait_seconds_total = 0.0
+
+    def refill(self, now: float) -> None:
+        if self.limits.rate > 0:
+            self.tokens = min(self.limits.burst, self.tokens + (now - self.refilled_at) * self.limits.rate)
+        self.refilled_at = now
+
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self.waiters and self.tokens >= self.limits.burst
+
+    def queue_retry_after(self) -> float:
+        # Time for the calls ahead of us to drain through the available slots
+        ahead = len(self.waiters) + 1
+        return self.service_seconds * ahead / self.limits.concurrency
+
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _round_retry(seconds: float) -> float:
+    return max(0.1, math.ceil(seconds * 10) / 10)
+
+
+class AdmissionController:
+    """
+    Token bucket plus bounded wait queue per tenant. All state is touched from the event
+    loop only, so no locking is needed.
+    """
+
+    def __init__(self, defaults: Optional[TenantLimits] = None, overrides: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.defaults = defaults or TenantLimits.from_env()
+        self.overrides: Dict[str, TenantLimits] = {}
+        for tenant, values in (overrides or {}).items():
+            try:
+                self.overrides[str(tenant).lower()] = self.defaults.with_overrides(values)
+            except ValueError as e:
+                log.error("admission.invalid_limits", tenant=tenant, error=str(e))
+        self._tenants: Dict[str, _TenantState] = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        overrides: Dict[str, Dict[str, Any]] = {}
+        raw = os.environ.get("MCP_TENANT_LIMITS", "")
+        if raw:
+            try:
+                overrides = json.loads(raw)
+            except ValueError as e:
+                log.error("admission.invalid_limits", error=str(e))
+            if not isinstance(overrides, dict):
+                log.error("admission.invalid_limits", error="MCP_TENANT_LIMITS must be a JSON object")
+                overrides = {}
+        return cls(TenantLimits.from_env(), overrides)
+
+    def _state(self, tenant: str) -> _TenantState:
+        key = tenant.lower()
+        state = self._tenants.get(key)
+        if state is None:
+            if len(self._tenants) >= _MAX_IDLE_TENANTS:
+                now = time.monotonic()
+                for name, other in list(self._tenants.items()):
+                    other.refill(now)
+                    if other.idle():
+                        del self._tenants[name]
+            state = _TenantState(self.overrides.get(key, self.defaults))
+            self._tenants[key] = state
+        return state
+
+    def _reject(self, state: _TenantState, tenant: str, reason: str, retry_after: float, message: str) -> AdmissionRejected:
+        state.rejected[reason] = state.rejected.get(reason, 0) + 1
+        retry_after = _round_retry(retry_after)
+        log.warning("admission.rejected", tenant=tenant, reason=reason, retry_after=retry_after,
+                    in_flight=state.in_flight, queued=len(state.waiters))
+        return AdmissionRejected(tenant, reason, retry_after, f"{message}; retry after {retry_after} seconds")
+
+    async def _acquire(self, state: _TenantState, tenant: str, tool: str) -> float:
+        limits = state.limits
+        now = time.monotonic()
+        state.refill(now)
+        if limits.rate > 0:
+            if state.tokens < 1:
+                raise self._reject(state, tenant, "rate_limited", (1 - state.tokens) / limits.rate,
+                                   f"Rate limit exceeded for tenant '{tenant}' ({tool})")
+            state.tokens -= 1
+
+        if state.in_flight < limits.concurrency and not state.waiters:
+            state.in_flight += 1
+            return 0.0
+
+        if len(state.waiters) >= limits.queue_depth:
+            self._refund(state)
+            raise self._reject(state, tenant, "queue_full", state.queue_retry_after(),
+                               f"Too many concurrent requests for tenant '{tenant}' ({tool})")
+
+        waiter = asyncio.get_running_loop().create_future()
+        state.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=limits.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the wait timed out; keep it
+                return time.monotonic() - now
+            state.waiters.remove(waiter)
+            self._refund(state)
+            raise self._reject(state, tenant, "queue_timeout", state.queue_retry_after(),
+                               f"Timed out waiting for a free slot for tenant '{tenant}' ({tool})")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release(state)
+            elif waiter in state.waiters:
+                state.waiters.remove(waiter)
+            raise
+        # The releasing call handed its slot over, in_flight is unchanged
+        return time.monotonic() - now
+
+    @staticmethod
+    def _refund(state: _TenantState) -> None:
+        # A call the queue turned away never ran, so it doesn't count against the rate limit
+        if state.limits.rate > 0:
+            state.tokens = min(state.limits.burst, state.tokens + 1)
+
+    def _release(self, state: _TenantState) -> None:
+        while state.waiters:
+            waiter = state.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        state.in_flight -= 1
+
+    @asynccontextmanager
+    async def admit(self, tenant: str, tool: str) -> AsyncIterator[float]:
+        """Hold an admission slot for the duration of the block. Yields the seconds spent queued."""
+        state = self._state(tenant or "")
+        waited = await self._acquire(state, tenant, tool)
+        state.admitted += 1
+        state.wait_seconds_total += waited
+        started = time.monotonic()
+        try:
+            yield waited
+        finally:
+            state.service_seconds = 0.8 * state.service_seconds + 0.2 * (time.monotonic() - started)
+            self._release(state)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        result: Dict[str, Dict[str, Any]] = {}
+        for tenant, state in self._tenants.items():
+            state.refill(now)
+            result[tenant] = {
+                "limits": {
+                    "rate": state.limits.rate,
+                    "burst": state.limits.burst,
+                    "concurrency": state.limits.concurrency,
+                    "queue_depth": state.limits.queue_depth,
+                },
+                "tokens": round(state.tokens, 3),
+                "in_flight": state.in_flight,
+                "queued": len(state.waiters),
+                "admitted_total": state.admitted,
+                "rejected_total": dict(state.rejected),
+                "wait_seconds_total": round(state.wait_seconds_total, 6),
+            }
+        return result
+
+    def render_metrics(self) -> str:
+        """Prometheus text exposition of the per-tenant admission state."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def family(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        def label(tenant: str, **extra: str) -> str:
+            labels = {"tenant": tenant, **extra}
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in labels.items()) + "}"
+
+        family("mcp_admission_in_flight", "gauge", "Tool calls currently holding a slot",
+               [f"mcp_admission_in_flight{label(t)} {s['in_flight']}" for t, s in snapshot.items()])
+        family("mcp_admission_queued", "gauge", "Tool calls waiting for a slot",
+               [f"mcp_admission_queued{label(t)} {s['queued']}" for t, s in snapshot.items()])
+        family("mcp_admission_tokens", "gauge", "Tokens left in the tenant's rate limit bucket",
+               [f"mcp_admission_tokens{label(t)} {s['tokens']}" for t, s in snapshot.items()])
+        family("mcp_admission_concurrency_limit", "gauge", "Configured concurrent calls per tenant",
+               [f"mcp_admission_concurrency_limit{label(t)} {s['limits']['concurrency']}" for t, s in snapshot.items()])
+        family("mcp_admission_queue_depth_limit", "gauge", "Configured wait queue depth per tenant",
+               [f"mcp_admission_queue_depth_limit{label(t)} {s['limits']['queue_depth']}" for t, s in snapshot.items()])
+        family("mcp_admission_rate_limit", "gauge", "Configured calls per second per tenant",
+               [f"mcp_admission_rate_limit{label(t)} {s['limits']['rate']}" for t, s in snapshot.items()])
+        family("mcp_admission_admitted_total", "counter", "Tool calls admitted",
+               [f"mcp_admission_admitted_total{label(t)} {s['admitted_total']}" for t, s in snapshot.items()])
+        family("mcp_admission_rejected_total", "counter", "Tool calls rejected, by reason",
+               [f"mcp_admission_rejected_total{label(t, reason=r)} {n}"
+                for t, s in snapshot.items() for r, n in sorted(s["rejected_total"].items())])
+        family("mcp_admission_wait_seconds_total", "counter", "Seconds admitted calls spent queued",
+               [f"mcp_admission_wait_seconds_total{label(t)} {s['wait_seconds_total']}" for t, s in snapshot.items()])
+        return "\n".join(lines) + "\n"
+
+
+admission = AdmissionController.from_env()
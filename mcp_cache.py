@@ -0,0 +1,179 @@
+"""
+Cache of upstream query results.
+
+get_rows / get_top_n results are kept as DataFrames, keyed by everything that determines
+the upstream answer (server, tenant, API key, subject, fields, filters, summary flag,
+system, Top N options), so a repeated question, or one prefetched by the schema-driven
+warm-up, is answered without a warehouse round trip. Entries expire after a TTL and the
+least recently used entries are evicted once the cache exceeds its byte budget. An entry
+can be partly refreshed (see merge), e.g. its open period, without extending its TTL.
+With MCP_CACHE_BACKEND=redis, results are also shared with the other replicas (see
+mcp_cache_backend); each replica still keeps the results it uses in its own memory, and
+load brings a result from the shared backend into it without blocking the event loop.
+
+Configuration (environment variables):
+  MCP_RESULT_CACHE_TTL          - seconds a result is reused, 0 disables the cache (default 300)
+  MCP_RESULT_CACHE_MAX_BYTES    - approximate in-memory size of all cached results (default 268435456)
+
+Usage:
+    from mcp_cache import result_cache
+    key = result_cache.key(server, tenant, subject, fields, ...)
+    await result_cache.load(key)
+    rows = result_cache.get(key)
+    if rows is None:
+        rows = fetch()
+        result_cache.put(key, rows)
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from mcp_cache_backend import CacheBackend, MemoryBackend, read_shared, shared_backend
+from mcp_logging import get_logger
+
+log = get_logger("cache")
+
+# Rows measured when estimating the size of a DataFrame with object columns
+_SIZE_SAMPLE_ROWS = 1000
+
+
+def frame_bytes(df: Any) -> int:
+    """Approximate in-memory size of a DataFrame, measuring object columns on a sample of rows."""
+    rows = len(df)
+    if rows <= _SIZE_SAMPLE_ROWS:
+        return int(df.memory_usage(deep=True).sum())
+    total = 0
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object:
+            # Python objects: deep size of a sample, scaled to the column
+            total += series.head(_SIZE_SAMPLE_ROWS).memory_usage(deep=True, index=False) * rows / _SIZE_SAMPLE_ROWS
+        else:
+            total += series.memory_usage(deep=True, index=False)
+    return int(total)
+
+
+class ResultCache:
+    """
+    TTL + LRU cache of DataFrames bounded by their approximate size, kept in a MemoryBackend
+    and, when configured, also in the backend shared by all replicas. Thread safe.
+    """
+
+    def __init__(self, ttl_seconds: float = 300.0, max_bytes: int = 256 * 1024 * 1024,
+                 shared: Optional[CacheBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        # key: (time.time() when fetched, time.time() when last refreshed, value)
+        self._local = MemoryBackend(max_bytes=max_bytes)
+        self.shared = shared
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+
+    @classmethod
+    def from_env(cls) -> "ResultCache":
+        return cls(
+            ttl_seconds=float(os.environ.get("MCP_RESULT_CACHE_TTL", "300")),
+            max_bytes=int(os.environ.get("MCP_RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+            shared=shared_backend(),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_bytes > 0
+
+    @staticmethod
+    def key(*parts: Any) -> str:
+        """Stable key for the given request parts (JSON-serializable, or stringified)."""
+        raw = json.dumps(parts, default=str, sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _entry(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        """The live entry of key in this replica's memory (see load)."""
+        return self._local.get(key)
+
+    async def load(self, key: str) -> None:
+        """Bring the entry of key from the shared backend into memory when only it has one."""
+        if self.enabled and self.shared is not None and self._local.get(key) is None:
+            await read_shared(self._read_shared, key)
+
+    def _read_shared(self, key: str) -> Optional[Tuple[float, float, Any]]:
+        record = self.shared.get("result:" + key)
+        if record is None:
+            return None
+        stored_at, refreshed_at, value = record
+        remaining = self.ttl_seconds - (time.time() - stored_at)
+        if remaining <= 0:
+            return None
+        entry = (stored_at, refreshed_at, value)
+        size = frame_bytes(value)
+        if size <= self.max_bytes:
+            self._local.set(key, entry, remaining, size)
+        with self._lock:
+            self.shared_hits += 1
+        return entry
+
+    def _store(self, key: str, entry: Tuple[float, float, Any], size: int) -> None:
+        remaining = self.ttl_seconds - (time.time() - entry[0])
+        self._local.set(key, entry, remaining, size)
+        if self.shared is not None:
+            self.shared.set("result:" + key, entry, remaining)
+
+    def get(self, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        entry = self._entry(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return entry[2]
+
+    def put(self, key: str, value: Any, size_bytes: Optional[int] = None) -> None:
+        if not self.enabled or value is None:
+            return
+        size = frame_bytes(value) if size_bytes is None else size_bytes
+        if size > self.max_bytes:
+            log.debug("cache.too_large", bytes=size)
+            return
+        now = time.time()
+        self._store(key, (now, now, value), size)
+
+    def merge(self, key: str, value: Any, size_bytes: Optional[int] = None) -> None:
+        """
+        Replace the value of an entry refreshed in part, keeping its TTL, which still counts from
+        the full fetch. Puts the value when the entry has expired or been evicted meanwhile.
+        """
+        if not self.enabled or value is None:
+            return
+        size = frame_bytes(value) if size_bytes is None else size_bytes
+        previous = self._entry(key)
+        if previous is not None and size <= self.max_bytes:
+            self._store(key, (previous[0], time.time(), value), size)
+            return
+        self.put(key, value, size)
+
+    def refreshed_age(self, key: str) -> Optional[float]:
+        """Seconds since the entry was fetched or last merged, or None when there is no live entry."""
+        entry = self._entry(key)
+        if entry is None:
+            return None
+        return time.time() - entry[1]
+
+    def clear(self) -> None:
+        """Drop this replica's entries; the shared backend's expire with their TTL."""
+        self._local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        local = self._local.stats()
+        with self._lock:
+            return {"entries": local["entries"], "bytes": local["bytes"], "hits": self.hits, "misses": self.misses,
+                    "shared_hits": self.shared_hits, "backend": self.shared.name if self.shared is not None else "memory"}
+
+
+result_cache = ResultCache.from_env()
@@ -0,0 +1,625 @@
+"""
+Cache backends for the result, schema, calendar and PAT introspection caches.
+
+Every replica of server_remote.py behind a load balancer used to keep each of these caches
+in its own memory, so scaling out multiplied upstream queries and token introspections.
+The caches now store through the CacheBackend interface:
+
+  - MemoryBackend: an in-process TTL + LRU store, bounded by bytes and entries. Every cache
+    keeps one as its local tier, and by default it is the only tier.
+  - RedisBackend: any server speaking the Redis protocol (RESP), shared by all replicas, when
+    MCP_CACHE_BACKEND=redis. A local miss is read from it in a worker thread (see read_shared),
+    and writes go to both tiers; shared writes and deletes are made by a background thread, so
+    neither holds up the event loop.
+
+Values written to the shared backend are encoded compactly by encode_value: JSON for plain
+data and a columnar binary layout for DataFrames (raw numeric buffers, categorical codes),
+zlib-compressed from MCP_CACHE_COMPRESS_BYTES. Nothing is pickled, so whatever is in the
+shared store cannot make a replica run code.
+
+The shared backend is best effort: when it cannot be reached, reads are misses, writes are
+dropped and the backend is skipped for MCP_CACHE_REDIS_RETRY_SECONDS, so replicas keep
+answering from their local tier.
+
+Configuration (environment variables):
+  MCP_CACHE_BACKEND             - memory, or redis to share caches between replicas (default memory)
+  MCP_CACHE_REDIS_URL           - redis://[[user]:password@]host[:port][/db] (default redis://localhost:6379/0)
+  MCP_CACHE_PREFIX              - prefix of every key written to the shared backend (default mcp:)
+  MCP_CACHE_REDIS_TIMEOUT       - seconds to wait for the shared backend (default 0.5)
+  MCP_CACHE_READ_TIMEOUT        - seconds a tool call waits on a shared read, decoding included (default 2)
+  MCP_CACHE_REDIS_RETRY_SECONDS - seconds the shared backend is skipped after a failure (default 5)
+  MCP_CACHE_SHARED_MAX_BYTES    - largest encoded value written to the shared backend (default 8388608)
+  MCP_CACHE_COMPRESS_BYTES      - encoded values from this size are zlib-compressed (default 1024)
+
+Usage:
+    from mcp_cache_backend import TieredCache
+    tokens = TieredCache("token", ttl_seconds=300)
+    record = await tokens.load(token_hash)     # tokens.get(token_hash): local tier only
+    if record is None:
+        tokens.set(token_hash, [claims, expires_at])
+"""
+import asyncio
+import json
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from mcp_logging import get_logger
+
+log = get_logger("cache_backend")
+
+_MAGIC = b"MC1"
+_FLAG_ZLIB = 1
+# Shared writes queued for the writer thread; further writes are dropped until it catches up
+_MAX_PENDING_WRITES = 1024
+# Idle connections kept to the shared backend
+_MAX_IDLE_CONNECTIONS = 8
+
+
+def cache_backend_kind() -> str:
+    return os.environ.get("MCP_CACHE_BACKEND", "memory").strip().lower() or "memory"
+
+
+def compress_bytes() -> int:
+    return max(0, int(os.environ.get("MCP_CACHE_COMPRESS_BYTES", "1024")))
+
+
+def shared_read_timeout() -> float:
+    try:
+        return max(0.0, float(os.environ.get("MCP_CACHE_READ_TIMEOUT", "2")))
+    except ValueError:
+        return 2.0
+
+
+def shared_max_bytes() -> int:
+    return int(os.environ.get("MCP_CACHE_SHARED_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+# --- Encoding ---------------------------------------------------------------------------------
+
+def _encode(value: Any, buffers: List[bytes]) -> Any:
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_encode(v, buffers) for v in value]
+    if isinstance(value, dict):
+        if all(isinstance(k, str) for k in value) and "$" not in value:
+            return {k: _encode(v, buffers) for k, v in value.items()}
+        return {"$": "dict", "items": [[_encode(k, buffers), _encode(v, buffers)] for k, v in value.items()]}
+    if isinstance(value, Decimal):
+        return {"$": "decimal", "v": str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        buffers.append(bytes(value))
+        return {"$": "bytes", "b": len(buffers) - 1}
+
+    import numpy as np
+    import pandas as pd
+
+    if value is pd.NaT:
+        return {"$": "nat"}
+    if value is pd.NA:
+        return {"$": "na"}
+    if isinstance(value, pd.Timestamp):
+        return {"$": "timestamp", "v": value.isoformat()}
+    if isinstance(value, datetime):
+        return {"$": "datetime", "v": value.isoformat()}
+    if isinstance(value, date):
+        return {"$": "date", "v": value.isoformat()}
+    if isinstance(value, np.generic):
+        return _encode(value.item(), buffers)
+    if isinstance(value, pd.DataFrame):
+        index = value.index
+        if isinstance(index, pd.RangeIndex):
+            encoded_index: Dict[str, Any] = {"range": [index.start, index.stop, index.step]}
+        else:
+            encoded_index = {"values": _encode_array(index, buffers)}
+        return {
+            "$": "frame",
+            "names": [_encode(c, buffers) for c in value.columns],
+            "columns": [_encode_array(value.iloc[:, i], buffers) for i in range(value.shape[1])],
+            "index": encoded_index,
+        }
+    raise TypeError(f"Cannot encode {type(value).__name__} for the shared cache")
+
+
+def _encode_array(values: Any, buffers: List[bytes]) -> Dict[str, Any]:
+    """A Series or Index: numpy buffers for numeric and datetime data, codes for categoricals."""
+    import numpy as np
+    import pandas as pd
+
+    dtype = values.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return {
+            "kind": "category",
+            "codes": _numpy_array(np.asarray(values.array.codes), buffers),
+            "categories": _encode_array(dtype.categories, buffers),
+            "ordered": bool(dtype.ordered),
+        }
+    if isinstance(dtype, pd.DatetimeTZDtype):
+        return {"kind": "datetimetz", "unit": dtype.unit, "tz": str(dtype.tz),
+                "utc": _numpy_array(np.asarray(values.array.asi8), buffers)}
+    if isinstance(dtype, np.dtype) and dtype.kind in "biufmM":
+        return _numpy_array(values.to_numpy(), buffers)
+    items = [_encode(v, buffers) for v in values.to_numpy(dtype=object)]
+    if isinstance(dtype, np.dtype):
+        return {"kind": "object", "values": items}
+    return {"kind": "extension", "dtype": str(dtype), "values": items}
+
+
+def _numpy_array(array: Any, buffers: List[bytes]) -> Dict[str, Any]:
+    import numpy as np
+
+    buffers.append(np.ascontiguousarray(array).tobytes())
+    return {"kind": "numpy", "dtype": array.dtype.str, "b": len(buffers) - 1}
+
+
+def _decode(doc: Any, buffers: List[memoryview]) -> Any:
+    if isinstance(doc, list):
+        return [_decode(v, buffers) for v in doc]
+    if not isinstance(doc, dict):
+        return doc
+    tag = doc.get("$")
+    if tag is None:
+        return {k: _decode(v, buffers) for k, v in doc.items()}
+    if tag == "dict":
+        return {_freeze(_decode(k, buffers)): _decode(v, buffers) for k, v in doc["items"]}
+    if tag == "decimal":
+        return Decimal(doc["v"])
+    if tag == "bytes":
+        return bytes(buffers[doc["b"]])
+    if tag == "datetime":
+        return datetime.fromisoformat(doc["v"])
+    if tag == "date":
+        return date.fromisoformat(doc["v"])
+
+    import pandas as pd
+
+    if tag == "nat":
+        return pd.NaT
+    if tag == "na":
+        return pd.NA
+    if tag == "timestamp":
+        return pd.Timestamp(doc["v"])
+    if tag == "frame":
+        index = doc["index"]
+        if "range" in index:
+            frame_index = pd.RangeIndex(*index["range"])
+        else:
+            frame_index = pd.Index(_decode_array(index["values"], buffers))
+        columns = [_decode_array(c, buffers) for c in doc["columns"]]
+        frame = pd.DataFrame({i: pd.Series(c, index=frame_index, copy=False) for i, c in enumerate(columns)},
+                             index=frame_index)
+        frame.columns = [_freeze(_decode(n, buffers)) for n in doc["names"]]
+        return frame
+    raise ValueError(f"Unknown encoded value {tag!r}")
+
+
+def _decode_array(doc: Dict[str, Any], buffers: List[memoryview]) -> Any:
+    import numpy as np
+    import pandas as pd
+
+    kind = doc["kind"]
+    if kind == "numpy":
+        return np.frombuffer(buffers[doc["b"]], dtype=np.dtype(doc["dtype"])).copy()
+    if kind == "category":
+        codes = _decode_array(doc["codes"], buffers)
+        categories = pd.Index(_decode_array(doc["categories"], buffers))
+        return pd.Categorical.from_codes(codes, categories=categories, ordered=doc["ordered"])
+    if kind == "datetimetz":
+        utc = _decode_array(doc["utc"], buffers).view(f"M8[{doc['unit']}]")
+        return pd.DatetimeIndex(utc).tz_localize("UTC").tz_convert(doc["tz"]).array
+    values = [_decode(v, buffers) for v in doc["values"]]
+    if kind == "extension":
+        return pd.array(values, dtype=doc["dtype"])
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def _freeze(value: Any) -> Any:
+    # Dict keys and column names decoded as lists were tuples
+    return tuple(_freeze(v) for v in value) if isinstance(value, list) else value
+
+
+def encode_value(value: Any) -> bytes:
+    """
+    Compact bytes of a value made of None, bool, int, float, str, bytes, Decimal, dates,
+    lists, tuples (decoded as lists), dicts and DataFrames. Raises TypeError otherwise.
+    """
+    buffers: List[bytes] = []
+    doc = _encode(value, buffers)
+    header = json.dumps({"v": doc, "b": [len(b) for b in buffers]}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    body = b"".join([struct.pack(">I", len(header)), header, *buffers])
+    flags = 0
+    if len(body) >= compress_bytes():
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            body, flags = packed, _FLAG_ZLIB
+    return _MAGIC + bytes([flags]) + body
+
+
+def decode_value(data: bytes) -> Any:
+    """The value encode_value encoded. Raises ValueError for anything else."""
+    if data[:len(_MAGIC)] != _MAGIC or len(data) <= len(_MAGIC):
+        raise ValueError("Not an encoded cache value")
+    flags = data[len(_MAGIC)]
+    body = memoryview(data)[len(_MAGIC) + 1:]
+    if flags & _FLAG_ZLIB:
+        body = memoryview(zlib.decompress(body))
+    (length,) = struct.unpack_from(">I", body)
+    header = json.loads(bytes(body[4:4 + length]))
+    buffers: List[memoryview] = []
+    offset = 4 + length
+    for size in header["b"]:
+        buffers.append(body[offset:offset + size])
+        offset += size
+    return _decode(header["v"], buffers)
+
+
+# --- Backends ---------------------------------------------------------------------------------
+
+class CacheBackend:
+    """
+    Key-value store with per-entry TTLs. shared: entries are visible to other replicas, so
+    values must survive encode_value.
+    """
+
+    name = "backend"
+    shared = False
+
+    def get(self, key: str) -> Optional[Any]:
+        """The live value of key, or None."""
+        raise NotImplementedError
+
+    def set(self, key: str, value: Any, ttl_seconds: float, size_bytes: int = 0) -> None:
+        """Store value for ttl_seconds; size_bytes counts towards a byte budget where there is one."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    """In-process TTL + LRU store bounded by the size_bytes of its entries and their count. Thread safe."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes: Optional[int] = None, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        # key: (time.monotonic() when it expires, size, value)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry[0]:
+                del self._entries[key]
+                self._bytes -= entry[1]
+                return None
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def set(self, key: str, value: Any, ttl_seconds: float, size_bytes: int = 0) -> None:
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+            if ttl_seconds <= 0:
+                return
+            self._entries[key] = (time.monotonic() + ttl_seconds, size_bytes, value)
+            self._bytes += size_bytes
+            while self._entries and ((self.max_bytes is not None and self._bytes > self.max_bytes)
+                                     or (self.max_entries is not None and len(self._entries) > self.max_entries)):
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._bytes -= entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes}
+
+
+class RedisError(Exception):
+    """An error reply from the shared backend."""
+
+
+class _Connection:
+    """One RESP connection: commands are arrays of bulk strings."""
+
+    def __init__(self, host: str, port: int, timeout: float):
+        self._sock = socket.create_connection((host, port), timeout=timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._sock.makefile("rb")
+
+    def call(self, *args: Any) -> Any:
+        parts = [b"*%d\r\n" % len(args)]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(b"$%d\r\n" % len(data))
+            parts.append(data)
+            parts.append(b"\r\n")
+        self._sock.sendall(b"".join(parts))
+        return self._read()
+
+    def _read(self) -> Any:
+        line = self._file.readline()
+        if not line.endswith(b"\r\n"):
+            raise ConnectionError("Connection to the cache backend closed")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode("utf-8")
+        if kind == b"-":
+            raise RedisError(rest.decode("utf-8", "replace"))
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Connection to the cache backend closed")
+            return data[:-2]
+        if kind == b"*":
+            length = int(rest)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply from the cache backend: {line[:32]!r}")
+
+    def close(self) -> None:
+        try:
+            self._file.close()
+            self._sock.close()
+        except OSError:
+            pass
+
+
+class RedisBackend(CacheBackend):
+    """
+    Shared store on a server speaking the Redis protocol, without a client library: values
+    are encode_value bytes under MCP_CACHE_PREFIX with a PX expiry. Connections are pooled
+    and writes are made by a background thread. Thread safe.
+    """
+
+    name = "redis"
+    shared = True
+
+    def __init__(self, url: Optional[str] = None, prefix: Optional[str] = None, timeout: Optional[float] = None,
+                 retry_seconds: Optional[float] = None, max_value_bytes: Optional[int] = None):
+        url = url or os.environ.get("MCP_CACHE_REDIS_URL", "redis://localhost:6379/0")
+        parsed = urlsplit(url)
+        if parsed.scheme != "redis":
+            raise ValueError(f"Unsupported cache backend URL {url!r}; use redis://host:port/db")
+        self.host = parsed.hostname or "localhost"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.strip("/") or 0)
+        self.prefix = os.environ.get("MCP_CACHE_PREFIX", "mcp:") if prefix is None else prefix
+        self.timeout = float(os.environ.get("MCP_CACHE_REDIS_TIMEOUT", "0.5")) if timeout is None else timeout
+        self.retry_seconds = float(os.environ.get("MCP_CACHE_REDIS_RETRY_SECONDS", "5")) if retry_seconds is None else retry_seconds
+        self.max_value_bytes = shared_max_bytes() if max_value_bytes is None else max_value_bytes
+        self._idle: List[_Connection] = []
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._writes: "queue.Queue[Tuple[str, Any, Optional[float]]]" = queue.Queue(maxsize=_MAX_PENDING_WRITES)
+        self._writer: Optional[threading.Thread] = None
+
+    def _connect(self) -> _Connection:
+        conn = _Connection(self.host, self.port, self.timeout)
+        try:
+            if self.password is not None:
+                conn.call("AUTH", *([self.username] if self.username else []), self.password)
+            if self.db:
+                conn.call("SELECT", self.db)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def execute(self, *args: Any) -> Any:
+        """Run one command and return its reply. Raises OSError, ConnectionError or RedisError."""
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = self._connect()
+        try:
+            reply = conn.call(*args)
+        except RedisError:
+            self._release(conn)
+            raise
+        except BaseException:
+            conn.close()
+            raise
+        self._release(conn)
+        return reply
+
+    def _release(self, conn: _Connection) -> None:
+        with self._lock:
+            if len(self._idle) < _MAX_IDLE_CONNECTIONS:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _call(self, *args: Any) -> Any:
+        """execute(), but None while the backend is unavailable."""
+        if time.monotonic() < self._down_until:
+            return None
+        try:
+            return self.execute(*args)
+        except RedisError as e:
+            log.warning("cache.backend_error", backend=self.name, command=str(args[0]), error=str(e))
+        except OSError as e:
+            self._down_until = time.monotonic() + self.retry_seconds
+            log.warning("cache.backend_unavailable", backend=self.name, host=self.host, port=self.port,
+                        retry_seconds=self.retry_seconds, error=str(e))
+        return None
+
+    def get(self, key: str) -> Optional[Any]:
+        data = self._call("GET", self.prefix + key)
+        if data is None:
+            return None
+        try:
+            return decode_value(data)
+        except Exception as e:
+            log.warning("cache.decode_failed", backend=self.name, key=key, error=str(e))
+            return None
+
+    def set(self, key: str, value: Any, ttl_seconds: float, size_bytes: int = 0) -> None:
+        if ttl_seconds <= 0:
+            return
+        self._enqueue(key, value, time.monotonic() + ttl_seconds)
+
+    def _enqueue(self, key: str, value: Any, expires_at: Optional[float]) -> None:
+        """Queue a write for the writer thread; expires_at None deletes key."""
+        if time.monotonic() < self._down_until:
+            return
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(target=self._write_loop, name="mcp-cache-writer", daemon=True)
+                    self._writer.start()
+        try:
+            self._writes.put_nowait((key, value, expires_at))
+        except queue.Full:
+            log.debug("cache.write_dropped", sample=True, backend=self.name, key=key)
+
+    def _write_loop(self) -> None:
+        while True:
+            key, value, expires_at = self._writes.get()
+            try:
+                if expires_at is None:
+                    self._call("DEL", self.prefix + key)
+                else:
+                    self._write(key, value, expires_at - time.monotonic())
+            except Exception as e:
+                log.warning("cache.write_failed", backend=self.name, key=key, error=str(e))
+            finally:
+                self._writes.task_done()
+
+    def _write(self, key: str, value: Any, ttl_seconds: float) -> None:
+        if ttl_seconds <= 0:
+            return
+        try:
+            data = encode_value(value)
+        except (TypeError, ValueError) as e:
+            log.debug("cache.encode_failed", backend=self.name, key=key, error=str(e))
+            return
+        if len(data) > self.max_value_bytes:
+            log.debug("cache.too_large", sample=True, backend=self.name, key=key, bytes=len(data))
+            return
+        self._call("SET", self.prefix + key, data, "PX", max(1, int(ttl_seconds * 1000)))
+
+    def flush(self) -> None:
+        """Wait until every queued write and delete has been made."""
+        self._writes.join()
+
+    def delete(self, key: str) -> None:
+        self._enqueue(key, None, None)
+
+
+_shared: Optional[CacheBackend] = None
+_shared_configured = False
+_shared_lock = threading.Lock()
+
+
+def shared_backend() -> Optional[CacheBackend]:
+    """The backend shared by all replicas (MCP_CACHE_BACKEND), or None when caches are in-process only."""
+    global _shared, _shared_configured
+    with _shared_lock:
+        if not _shared_configured:
+            kind = cache_backend_kind()
+            if kind == "redis":
+                _shared = RedisBackend()
+                log.info("cache.backend", backend=kind, host=_shared.host, port=_shared.port, db=_shared.db)
+            elif kind != "memory":
+                log.warning("cache.unknown_backend", backend=kind)
+            _shared_configured = True
+        return _shared
+
+
+async def read_shared(func: Callable[..., Any], *args: Any) -> Optional[Any]:
+    """
+    func(*args), a blocking read from the shared backend, in a worker thread, so the event loop
+    never waits on the network or on decoding. None once shared_read_timeout() has passed; the
+    read still completes, so a local tier it fills has the value for the next call.
+    """
+    try:
+        return await asyncio.wait_for(asyncio.to_thread(func, *args), shared_read_timeout())
+    except asyncio.TimeoutError:
+        log.warning("cache.read_timeout", timeout=shared_read_timeout())
+        return None
+
+
+class TieredCache:
+    """
+    One kind of cached value (namespace): a local MemoryBackend in front of the shared
+    backend, when one is configured. The shared copy is stored as [expires_at, value] so a
+    replica that reads it keeps it locally only for the entry's remaining time, never longer
+    than the TTL it was written with. get only looks at the local tier and is safe on the
+    event loop; load also reads the shared tier, off the loop.
+    """
+
+    def __init__(self, namespace: str, ttl_seconds: float, max_entries: int = 10000,
+                 shared: Optional[CacheBackend] = None):
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.local = MemoryBackend(max_entries=max_entries)
+        self.shared = shared if shared is not None else shared_backend()
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.local.get(key)
+
+    def fetch(self, key: str) -> Optional[Any]:
+        """get, reading through to the shared tier on a local miss. Blocks; see load."""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            record = self.shared.get(f"{self.namespace}:{key}")
+            if not (isinstance(record, list) and len(record) == 2
+                    and isinstance(record[0], (int, float))):
+                return None
+            remaining = record[0] - time.time()
+            if remaining <= 0:
+                return None
+            value = record[1]
+            self.local.set(key, value, min(remaining, self.ttl_seconds))
+        return value
+
+    async def load(self, key: str) -> Optional[Any]:
+        """fetch, with the shared read in a worker thread (see read_shared)."""
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = await read_shared(self.fetch, key)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.local.set(key, value, ttl)
+        if self.shared is not None:
+            self.shared.set(f"{self.namespace}:{key}", [time.time() + ttl, value], ttl)
+
+    def delete(self, key: str) -> None:
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(f"{self.namespace}:{key}")
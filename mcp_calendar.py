@@ -0,0 +1,446 @@
+"""
+Cached calendar lookups for resolve_calendar_periods.
+
+Multi-period comparisons ("each of the last 8 quarters") used to take one
+get_financial_periods or get_calendar_period_date_range call, and one upstream
+CalendarAssistant round trip, per period. CalendarCache keeps what the calendar API has
+returned for a (server, tenant, calendar):
+
+  - the financial year, quarter, month and week of a date, and
+  - the start and end dates of a (financial year, period number, period type).
+
+A date inside already-known year, quarter, month and week ranges is answered from those
+ranges (a bisect over each type's ranges, sorted by start date) without asking again, so
+a batch of dates in a few periods costs a few lookups. CalendarResolver resolves a batch
+of dates, (financial year, period number, period type) tuples and relative expressions
+such as "previous 8 quarters" or "same month last year", running the lookups the cache
+cannot answer concurrently and each distinct lookup only once. The SDK has no bulk
+calendar endpoint, so this is as close to one request per batch as it gets. With
+MCP_CACHE_BACKEND=redis, lookups are shared between replicas (see mcp_cache_backend).
+
+Configuration (environment variables):
+  MCP_CALENDAR_CACHE_TTL        - seconds calendar lookups are reused (default 86400)
+  MCP_CALENDAR_CONCURRENCY      - upstream calendar lookups one batch runs at once (default 8)
+
+Usage:
+    from mcp_calendar import CalendarResolver, calendar_cache
+    resolver = CalendarResolver(calendar_cache(server, tenant, calendar),
+                                lambda: CalendarAssistant(tenant, calendar, server, api_key),
+                                run)                    # async run(func, *args), e.g. in a thread
+    result = await resolver.resolve(["2025-06-30"], [[2025, 2, "quarter"]], ["previous 8 quarters"], date.today())
+"""
+import asyncio
+import bisect
+import os
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from mcp_cache_backend import CacheBackend, read_shared, shared_backend
+from mcp_logging import get_logger
+
+log = get_logger("calendar")
+
+PERIOD_TYPES = ("year", "quarter", "month", "week")
+# Periods per financial year, where every year has the same number
+PERIODS_PER_YEAR = {"year": 1, "quarter": 4, "month": 12}
+# Dates, periods and expressions one resolve call accepts
+MAX_BATCH_ITEMS = 500
+# Dates this close to the one before are looked up one after the other, so the later
+# ones can be answered from the ranges fetched for the earlier ones
+_RUN_DAYS = 6
+
+_EXPRESSION = re.compile(r"^(current|this|previous|last|next)\s+(?:(\d+)\s+)?(year|quarter|month|week)s?$")
+_SAME_LAST_YEAR = re.compile(r"^same\s+(year|quarter|month|week)\s+(?:last|previous)\s+year$")
+
+
+def calendar_cache_ttl() -> float:
+    return float(os.environ.get("MCP_CALENDAR_CACHE_TTL", "86400"))
+
+
+def calendar_concurrency() -> int:
+    return max(1, int(os.environ.get("MCP_CALENDAR_CONCURRENCY", "8")))
+
+
+def parse_expression(text: str) -> Tuple[str, str, int]:
+    """
+    (direction, period type, count) of a relative expression: direction is "current",
+    "previous", "next" or "same_last_year". "last quarter" is the previous quarter,
+    "last 3 months" the 3 months before the current one. Raises ValueError otherwise.
+    """
+    normalized = " ".join(str(text).strip().lower().split())
+    match = _SAME_LAST_YEAR.match(normalized)
+    if match:
+        return "same_last_year", match.group(1), 1
+    match = _EXPRESSION.match(normalized)
+    if not match:
+        raise ValueError(
+            f"Unsupported expression {text!r}; use e.g. 'current month', 'previous 8 quarters', "
+            "'next 2 weeks' or 'same quarter last year'"
+        )
+    word, count, period_type = match.groups()
+    direction = {"this": "current", "last": "previous"}.get(word, word)
+    count = int(count) if count else 1
+    if direction == "current" and count != 1:
+        raise ValueError(f"Unsupported expression {text!r}; a count needs previous, last or next")
+    return direction, period_type, count
+
+
+class CalendarCache:
+    """
+    Periods of dates and date ranges of periods for one tenant calendar (scope), expiring after
+    a TTL. Lookups are also written to the shared cache backend when one is configured;
+    periods_of and range_of answer from memory, while load_periods and load_range also read
+    local misses from the shared backend, off the event loop. Thread safe.
+    """
+
+    def __init__(self, ttl_seconds: float = 86400.0, scope: str = "", shared: Optional[CacheBackend] = None):
+        self.ttl_seconds = ttl_seconds
+        self.scope = scope
+        self.shared = shared
+        # Stored at: time.time(), so entries read from the shared backend keep their age
+        self._periods: Dict[date, Tuple[float, Dict[str, int]]] = {}
+        self._ranges: Dict[Tuple[str, int, int], Tuple[float, Optional[Tuple[date, date]]]] = {}
+        # Per period type: (start, end, financial year, period number, stored at), sorted
+        self._by_start: Dict[str, List[Tuple[date, date, int, int, float]]] = {t: [] for t in PERIOD_TYPES}
+        self._lock = threading.Lock()
+
+    def _live(self, stored_at: float) -> bool:
+        return time.time() - stored_at <= self.ttl_seconds
+
+    def _shared_key(self, *parts: Any) -> str:
+        return ":".join(["calendar", self.scope, *map(str, parts)])
+
+    def _share(self, key: str, stored_at: float, value: Any) -> None:
+        if self.shared is not None:
+            self.shared.set(key, [stored_at, value], self.ttl_seconds)
+
+    def _shared_record(self, key: str) -> Optional[Tuple[float, Any]]:
+        if self.shared is None:
+            return None
+        record = self.shared.get(key)
+        if record is None or not self._live(record[0]):
+            return None
+        return record[0], record[1]
+
+    def periods_of(self, day: date) -> Optional[Dict[str, int]]:
+        """Financial year, quarter, month and week of day, or None when they are not known."""
+        with self._lock:
+            return self._local_periods(day)
+
+    async def load_periods(self, day: date) -> Optional[Dict[str, int]]:
+        """periods_of, read from the shared backend when not known locally."""
+        found = self.periods_of(day)
+        if found is None and self.shared is not None:
+            found = await read_shared(self._shared_periods, day)
+        return found
+
+    def _shared_periods(self, day: date) -> Optional[Dict[str, int]]:
+        record = self._shared_record(self._shared_key("periods", day.isoformat()))
+        if record is None:
+            return None
+        found = dict(record[1])
+        self._put_periods(day, found, record[0])
+        return found
+
+    def _local_periods(self, day: date) -> Optional[Dict[str, int]]:
+        entry = self._periods.get(day)
+        if entry is not None and self._live(entry[0]):
+            return dict(entry[1])
+        found: Dict[str, int] = {}
+        for period_type in PERIOD_TYPES:
+            ranges = self._by_start[period_type]
+            i = bisect.bisect_right(ranges, (day, date.max)) - 1
+            if i < 0 or ranges[i][1] < day or not self._live(ranges[i][4]):
+                return None
+            found[period_type] = ranges[i][2] if period_type == "year" else ranges[i][3]
+        return found
+
+    def put_periods(self, day: date, periods: Dict[str, int]) -> None:
+        now = time.time()
+        self._put_periods(day, periods, now)
+        self._share(self._shared_key("periods", day.isoformat()), now, dict(periods))
+
+    def _put_periods(self, day: date, periods: Dict[str, int], stored_at: float) -> None:
+        with self._lock:
+            self._periods[day] = (stored_at, dict(periods))
+
+    def range_of(self, period_type: str, year: int, number: int) -> Tuple[bool, Optional[Tuple[date, date]]]:
+        """(known, (start, end) or None when the calendar has no such period)."""
+        with self._lock:
+            entry = self._ranges.get((period_type, year, number))
+        if entry is not None and self._live(entry[0]):
+            return True, entry[1]
+        return False, None
+
+    async def load_range(self, period_type: str, year: int, number: int) -> Tuple[bool, Optional[Tuple[date, date]]]:
+        """range_of, read from the shared backend when not known locally."""
+        known, span = self.range_of(period_type, year, number)
+        if not known and self.shared is not None:
+            known, span = await read_shared(self._shared_range, period_type, year, number) or (False, None)
+        return known, span
+
+    def _shared_range(self, period_type: str, year: int, number: int) -> Tuple[bool, Optional[Tuple[date, date]]]:
+        record = self._shared_record(self._shared_key("range", period_type, year, number))
+        if record is None:
+            return False, None
+        span = (date.fromisoformat(record[1][0]), date.fromisoformat(record[1][1])) if record[1] else None
+        self._put_range(period_type, year, number, span, record[0])
+        return True, span
+
+    def put_range(self, period_type: str, year: int, number: int, span: Optional[Tuple[date, date]]) -> None:
+        now = time.time()
+        self._put_range(period_type, year, number, span, now)
+        self._share(self._shared_key("range", period_type, year, number), now,
+                    [span[0].isoformat(), span[1].isoformat()] if span else None)
+
+    def _put_range(self, period_type: str, year: int, number: int, span: Optional[Tuple[date, date]],
+                   stored_at: float) -> None:
+        with self._lock:
+            self._ranges[(period_type, year, number)] = (stored_at, span)
+            if span is None:
+                return
+            ranges = self._by_start[period_type]
+            ranges[:] = [r for r in ranges if (r[2], r[3]) != (year, number) and self._live(r[4])]
+            bisect.insort(ranges, (span[0], span[1], year, number, stored_at))
+
+
+_caches: Dict[Tuple[str, str, str], CalendarCache] = {}
+_caches_lock = threading.Lock()
+
+
+def calendar_cache(server: str, tenant: str, calendar: str) -> CalendarCache:
+    """The CalendarCache of a tenant calendar, created on first use."""
+    key = (server, tenant, calendar)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = _caches[key] = CalendarCache(calendar_cache_ttl(), f"{server}/{tenant}/{calendar}", shared_backend())
+        return cache
+
+
+def _as_date(value: Any) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.fromisoformat(str(value)).date()
+
+
+def _parse_period(item: Any) -> Tuple[str, int, int]:
+    """(period type, financial year, period number) of a {"financial_year", "period_number", "period_type"} object or a [year, number, type] list."""
+    if isinstance(item, dict):
+        values = (item.get("financial_year"), item.get("period_number"), item.get("period_type"))
+    elif isinstance(item, (list, tuple)) and len(item) == 3:
+        values = tuple(item)
+    else:
+        raise ValueError("A period must be {financial_year, period_number, period_type} or [financial_year, period_number, period_type]")
+    year, number, period_type = values
+    period_type = str(period_type or "").strip().lower()
+    if period_type not in PERIOD_TYPES:
+        raise ValueError(f"Invalid period_type: {values[2]}. Must be one of: year, month, quarter, week")
+    try:
+        return period_type, int(year), int(number)
+    except (TypeError, ValueError):
+        raise ValueError("financial_year and period_number must be integers") from None
+
+
+class CalendarResolver:
+    """
+    Resolves one batch of calendar questions against a CalendarCache, fetching what it does
+    not know through run(func, *args) with at most concurrency lookups in flight. calls
+    counts the upstream lookups made. A failed lookup is reported on the items that needed
+    it, except for the fatal exception types (e.g. the call's deadline), which fail the batch.
+    """
+
+    def __init__(self, cache: CalendarCache, open_assistant: Callable[[], Any],
+                 run: Callable[..., Awaitable[Any]], concurrency: Optional[int] = None,
+                 fatal: Tuple[type, ...] = ()):
+        self.cache = cache
+        self.open_assistant = open_assistant
+        self.run = run
+        self.fatal = fatal
+        self.calls = 0
+        self._semaphore = asyncio.Semaphore(calendar_concurrency() if concurrency is None else concurrency)
+        self._assistant: Optional[asyncio.Future] = None
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    async def _call(self, method: str, *args: Any) -> Any:
+        if self._assistant is None:
+            self._assistant = asyncio.ensure_future(self.run(self.open_assistant))
+        assistant = await self._assistant
+        async with self._semaphore:
+            self.calls += 1
+            return await self.run(getattr(assistant, method), *args)
+
+    def _item_error(self, e: Exception) -> str:
+        """The error of an item whose lookup raised e, or e re-raised when it is fatal."""
+        if isinstance(e, self.fatal):
+            raise e
+        log.warning("calendar.lookup_failed", error=str(e))
+        return str(e)
+
+    async def _lookup(self, key: Tuple, method: str, *args: Any) -> Any:
+        # Concurrent askers of the same lookup share one upstream call
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._call(method, *args))
+        return await future
+
+    async def periods(self, day: date) -> Dict[str, int]:
+        """Financial year, quarter, month and week of day."""
+        found = await self.cache.load_periods(day)
+        if found is None:
+            details = await self._lookup(("periods", day), "get_financial_periods", day)
+            found = {"year": int(details.year), "quarter": int(details.quarter),
+                     "month": int(details.month), "week": int(details.week)}
+            self.cache.put_periods(day, found)
+        return found
+
+    async def span(self, period_type: str, year: int, number: int) -> Optional[Tuple[date, date]]:
+        """Start and end date of a period, or None when the calendar has no such period."""
+        known, span = await self.cache.load_range(period_type, year, number)
+        if not known:
+            from inmydata_openedge.CalendarAssistant import CalendarPeriodType
+
+            response = await self._lookup(("range", period_type, year, number), "get_calendar_period_date_range",
+                                          year, number, getattr(CalendarPeriodType, period_type))
+            span = (_as_date(response.StartDate), _as_date(response.EndDate)) if response is not None else None
+            self.cache.put_range(period_type, year, number, span)
+        return span
+
+    async def weeks_in(self, year: int) -> int:
+        span = await self.span("year", year, 1)
+        if span is None:
+            raise ValueError(f"No financial year {year} in the calendar")
+        return (await self.periods(span[1]))["week"]
+
+    async def shift(self, period_type: str, year: int, number: int, by: int) -> Tuple[int, int]:
+        """The (financial year, period number) by periods after (or before, when negative) a period."""
+        per_year = PERIODS_PER_YEAR.get(period_type)
+        if per_year is not None:
+            index = year * per_year + number - 1 + by
+            return index // per_year, index % per_year + 1
+        # Weeks per year vary (52 or 53), so walk year by year
+        number += by
+        while number < 1:
+            year -= 1
+            number += await self.weeks_in(year)
+        while number > (weeks := await self.weeks_in(year)):
+            number -= weeks
+            year += 1
+        return year, number
+
+    async def expand(self, expression: str, as_of: date) -> List[Tuple[str, int, int]]:
+        """The (period type, financial year, period number) an expression refers to, oldest first."""
+        direction, period_type, count = parse_expression(expression)
+        current = await self.periods(as_of)
+        year = current["year"]
+        number = 1 if period_type == "year" else current[period_type]
+        if direction == "current":
+            return [(period_type, year, number)]
+        if direction == "same_last_year":
+            return [(period_type, year - 1, number)]
+        offsets = range(-count, 0) if direction == "previous" else range(1, count + 1)
+        return [(period_type, *await self.shift(period_type, year, number, by)) for by in offsets]
+
+    async def _resolve_run(self, days: List[date]) -> None:
+        for i, day in enumerate(days):
+            if await self.cache.load_periods(day) is not None:
+                continue
+            found = await self.periods(day)
+            if i + 1 < len(days):
+                # Later dates of the run are then answered from these ranges
+                await asyncio.gather(*(self.span(t, found["year"], 1 if t == "year" else found[t]) for t in PERIOD_TYPES))
+
+    async def resolve_dates(self, days: List[date]) -> None:
+        """Look up the periods of days, runs of nearby dates one after the other and the runs concurrently."""
+        runs: List[List[date]] = []
+        for day in sorted(set(days)):
+            if runs and day - runs[-1][0] <= timedelta(days=_RUN_DAYS):
+                runs[-1].append(day)
+            else:
+                runs.append([day])
+        # A run stops at a failed lookup; its dates then report the failure themselves
+        for outcome in await asyncio.gather(*(self._resolve_run(run) for run in runs), return_exceptions=True):
+            if isinstance(outcome, self.fatal) or (isinstance(outcome, BaseException) and not isinstance(outcome, Exception)):
+                raise outcome
+
+    async def _period_entry(self, period_type: str, year: int, number: int) -> Dict[str, Any]:
+        entry: Dict[str, Any] = {"financial_year": year, "period_number": number, "period_type": period_type}
+        try:
+            span = await self.span(period_type, year, number)
+        except Exception as e:
+            entry["error"] = self._item_error(e)
+            return entry
+        if span is None:
+            entry["error"] = "No date range found for the specified period"
+        else:
+            entry["start_date"] = span[0].isoformat()
+            entry["end_date"] = span[1].isoformat()
+        return entry
+
+    async def _period_item(self, item: Any, parsed: Any) -> Dict[str, Any]:
+        if isinstance(parsed, Exception):
+            return {"period": item, "error": str(parsed)}
+        return await self._period_entry(*parsed)
+
+    async def _expression_entry(self, expression: str, as_of: date) -> Dict[str, Any]:
+        try:
+            periods = await self.expand(expression, as_of)
+        except ValueError as e:
+            return {"expression": expression, "error": str(e)}
+        except Exception as e:
+            return {"expression": expression, "error": self._item_error(e)}
+        entries = await asyncio.gather(*(self._period_entry(*p) for p in periods))
+        return {"expression": expression, "periods": list(entries)}
+
+    async def resolve(self, dates: List[str], periods: List[Any], expressions: List[str], as_of: date) -> Dict[str, Any]:
+        """
+        {"dates": [...], "periods": [...], "expressions": [...]} in input order. An item that
+        cannot be resolved gets an "error" instead of failing the batch.
+        """
+        if len(dates) + len(periods) + len(expressions) > MAX_BATCH_ITEMS:
+            raise ValueError(f"At most {MAX_BATCH_ITEMS} dates, periods and expressions can be resolved in one call")
+        parsed_dates: List[Any] = []
+        for text in dates:
+            try:
+                parsed_dates.append(_as_date(text))
+            except ValueError:
+                parsed_dates.append(ValueError(f"Invalid date: {text!r}; use YYYY-MM-DD"))
+        parsed_periods: List[Any] = []
+        for item in periods:
+            try:
+                parsed_periods.append(_parse_period(item))
+            except ValueError as e:
+                parsed_periods.append(e)
+
+        days = [d for d in parsed_dates if isinstance(d, date)]
+        if expressions:
+            days.append(as_of)
+        await self.resolve_dates(days)
+
+        result: Dict[str, Any] = {}
+        if dates:
+            entries = []
+            for text, day in zip(dates, parsed_dates):
+                if isinstance(day, Exception):
+                    entries.append({"date": text, "error": str(day)})
+                    continue
+                try:
+                    found = await self.periods(day)
+                except Exception as e:
+                    entries.append({"date": day.isoformat(), "error": self._item_error(e)})
+                    continue
+                entries.append({"date": day.isoformat(), "financial_year": found["year"], "quarter": found["quarter"],
+                                "month": found["month"], "week": found["week"]})
+            result["dates"] = entries
+        if periods:
+            entries = await asyncio.gather(*(self._period_item(item, p) for item, p in zip(periods, parsed_periods)))
+            result["periods"] = list(entries)
+        if expressions:
+            entries = await asyncio.gather(*(self._expression_entry(e, as_of) for e in expressions))
+            result["expressions"] = list(entries)
+        return result
@@ -0,0 +1,211 @@
+"""
+Content-negotiated response compression for the remote server's ASGI app.
+
+Tool results (get_rows_fast, get_schema, query_results_fast) are JSON with repeated keys,
+repeated dimension values and long schema descriptions, and compress several times over.
+CompressionMiddleware encodes responses with brotli (when the optional brotli package is
+installed) or gzip, whichever the client's Accept-Encoding prefers:
+
+  - A response sent as one body is compressed when it is at least MCP_COMPRESSION_MIN_BYTES.
+  - A streamed response, such as the streamable-http transport's text/event-stream, is
+    compressed chunk by chunk with a flush after each chunk, so every event still reaches
+    the client as soon as it is sent.
+  - Responses that already have a Content-Encoding, or whose type is already compressed
+    (gzip CSV and Parquet exports, images, archives), are passed through unchanged.
+
+Chunks of at least MCP_COMPRESSION_THREAD_BYTES are compressed in a worker thread so
+large results do not hold up the event loop.
+
+Configuration (environment variables):
+  MCP_COMPRESSION               - compress responses for clients that accept it (default 1)
+  MCP_COMPRESSION_MIN_BYTES     - smallest single-body response that is compressed (default 1024)
+  MCP_COMPRESSION_LEVEL         - gzip level, 1 (fastest) to 9 (smallest) (default 6)
+  MCP_COMPRESSION_BROTLI_QUALITY - brotli quality, 0 to 11 (default 5)
+  MCP_COMPRESSION_THREAD_BYTES  - chunk size from which compression runs in a worker thread (default 65536)
+
+Usage:
+    from mcp_compression import CompressionMiddleware
+    app.add_middleware(CompressionMiddleware)
+"""
+import asyncio
+import os
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Media types whose bodies are already compressed
+_COMPRESSED_TYPES = ("application/gzip", "application/x-gzip", "application/zip", "application/zstd",
+                     "application/vnd.apache.parquet", "application/octet-stream", "image/", "audio/", "video/")
+
+
+def compression_enabled() -> bool:
+    return os.environ.get("MCP_COMPRESSION", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def compression_min_bytes() -> int:
+    return max(0, int(os.environ.get("MCP_COMPRESSION_MIN_BYTES", "1024")))
+
+
+def compression_level() -> int:
+    return min(9, max(1, int(os.environ.get("MCP_COMPRESSION_LEVEL", "6"))))
+
+
+def brotli_quality() -> int:
+    return min(11, max(0, int(os.environ.get("MCP_COMPRESSION_BROTLI_QUALITY", "5"))))
+
+
+def compression_thread_bytes() -> int:
+    return max(0, int(os.environ.get("MCP_COMPRESSION_THREAD_BYTES", "65536")))
+
+
+def _brotli() -> Optional[Any]:
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def negotiate(accept_encoding: str, brotli_available: bool) -> Optional[str]:
+    """The encoding to use for an Accept-Encoding header value: "br", "gzip" or None."""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    offered = ["br", "gzip"] if brotli_available else ["gzip"]
+    best, best_q = None, 0.0
+    for encoding in offered:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class _Encoder:
+    """Incremental encoder; each chunk() output is decodable on its own once received."""
+
+    def __init__(self, encoding: str, level: int, quality: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = _brotli().Compressor(quality=quality)
+        else:
+            self._gz = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.flush()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self, data: bytes = b"") -> bytes:
+        if self.encoding == "br":
+            return self._br.process(data) + self._br.finish()
+        return self._gz.compress(data) + self._gz.flush(zlib.Z_FINISH)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+    return not content_type.startswith(_COMPRESSED_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing HTTP responses for clients that send Accept-Encoding."""
+
+    def __init__(self, app: Any, minimum_size: Optional[int] = None, level: Optional[int] = None,
+                 quality: Optional[int] = None, thread_bytes: Optional[int] = None):
+        self.app = app
+        self.minimum_size = compression_min_bytes() if minimum_size is None else minimum_size
+        self.level = compression_level() if level is None else level
+        self.quality = brotli_quality() if quality is None else quality
+        self.thread_bytes = compression_thread_bytes() if thread_bytes is None else thread_bytes
+        self.enabled = compression_enabled()
+        self.brotli_available = _brotli() is not None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept = _header(scope.get("headers") or [], b"accept-encoding")
+        encoding = negotiate(accept.decode("latin-1"), self.brotli_available) if accept else None
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await self.app(scope, receive, _CompressingSend(self, encoding, send))
+
+
+class _CompressingSend:
+    """
+    The send callable handed to the app. Holds back http.response.start until the first body
+    message shows whether the response is a single body or a stream, then rewrites the headers.
+    """
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Callable):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Optional[Dict[str, Any]] = None
+        self.encoder: Optional[_Encoder] = None
+        self.passthrough = False
+
+    async def _run(self, func: Callable[[bytes], bytes], data: bytes) -> bytes:
+        if len(data) >= self.middleware.thread_bytes:
+            return await asyncio.to_thread(func, data)
+        return func(data)
+
+    def _encoded_start(self, content_length: Optional[int]) -> Dict[str, Any]:
+        headers = [(k, v) for k, v in self.start["headers"] if k.lower() not in (b"content-length", b"vary")]
+        vary = _header(self.start["headers"], b"vary")
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        headers.append((b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"))
+        if content_length is not None:
+            headers.append((b"content-length", str(content_length).encode("latin-1")))
+        return {**self.start, "headers": headers}
+
+    async def __call__(self, message: Dict[str, Any]) -> None:
+        kind = message["type"]
+        if kind == "http.response.start":
+            self.start = {**message, "headers": list(message.get("headers") or [])}
+            return
+        if kind != "http.response.body" or self.passthrough or self.start is None:
+            return await self.send(message)
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.encoder is None:
+            headers = self.start["headers"]
+            length = _header(headers, b"content-length")
+            small = (not more and len(body) < self.middleware.minimum_size) or \
+                (length is not None and int(length) < self.middleware.minimum_size)
+            if small or self.start["status"] in (204, 304) or not _compressible(headers):
+                self.passthrough = True
+                await self.send(self.start)
+                return await self.send(message)
+            self.encoder = _Encoder(self.encoding, self.middleware.level, self.middleware.quality)
+            if not more:
+                # The whole response in one body: compress it and send its real length
+                compressed = await self._run(self.encoder.finish, body)
+                await self.send(self._encoded_start(len(compressed)))
+                return await self.send({"type": "http.response.body", "body": compressed, "more_body": False})
+            await self.send(self._encoded_start(None))
+
+        if more:
+            data = await self._run(self.encoder.chunk, body) if body else b""
+        else:
+            data = await self._run(self.encoder.finish, body)
+        if data or not more:
+            await self.send({"type": "http.response.body", "body": data, "more_body": more})
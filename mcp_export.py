@@ -0,0 +1,172 @@
+"""
+Streaming export of persisted datasets for the remote server's HTTP routes.
+
+A BI job that needs the whole dataset behind an instance_id should not have to pull it
+through query_results_fast, which renders the result as one JSON string. The export
+routes stream it instead, in a format written by DuckDB itself:
+
+  - csv      gzip-compressed CSV with a header row
+  - parquet  Parquet (zstd)
+  - arrow    Arrow IPC stream; needs pyarrow, which is optional
+
+csv and parquet are written by DuckDB's COPY to a temporary file next to the dataset and
+streamed from disk in fixed-size blocks; arrow is streamed batch by batch from DuckDB's
+record batch reader. Either way server memory stays flat whatever the dataset size.
+The temporary file is removed once the response ends, including when the client goes away.
+
+Configuration (environment variables):
+  MCP_EXPORT_BLOCK_BYTES        - bytes read from the export file per response chunk (default 1048576)
+  MCP_EXPORT_BATCH_ROWS         - rows per Arrow record batch (default 65536)
+
+Usage:
+    from mcp_export import EXPORT_FORMATS, open_export
+    export = open_export(duckdb_path, "parquet")   # blocking; run in a worker thread
+    return StreamingResponse(export.chunks(), media_type=export.media_type, headers=export.headers(name))
+"""
+import os
+import uuid
+from typing import Any, Callable, Dict, Iterator
+
+from mcp_logging import get_logger
+
+log = get_logger("export")
+
+# format: (media type, file extension, COPY options or None when streamed from record batches)
+EXPORT_FORMATS: Dict[str, tuple] = {
+    "csv": ("application/gzip", "csv.gz", "FORMAT csv, HEADER true, COMPRESSION gzip"),
+    "parquet": ("application/vnd.apache.parquet", "parquet", "FORMAT parquet, COMPRESSION zstd"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows", None),
+}
+
+
+class ExportUnavailable(RuntimeError):
+    """Raised when the requested format needs an optional dependency that is not installed."""
+
+
+def export_block_bytes() -> int:
+    return max(64 * 1024, int(os.environ.get("MCP_EXPORT_BLOCK_BYTES", str(1024 * 1024))))
+
+
+def export_batch_rows() -> int:
+    return max(1024, int(os.environ.get("MCP_EXPORT_BATCH_ROWS", "65536")))
+
+
+class DatasetExport:
+    """An export ready to stream: chunks() yields its bytes once and then releases its resources."""
+
+    def __init__(self, fmt: str, produce: Callable[[], Iterator[bytes]], cleanup: Callable[[], None]):
+        self.format = fmt
+        self.media_type, self.extension, _ = EXPORT_FORMATS[fmt]
+        self._produce = produce
+        self._cleanup = cleanup
+        self._closed = False
+
+    def headers(self, name: str) -> Dict[str, str]:
+        return {"Content-Disposition": f'attachment; filename="{name}.{self.extension}"'}
+
+    def chunks(self) -> Iterator[bytes]:
+        try:
+            yield from self._produce()
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._cleanup()
+
+
+def open_export(duckdb_path: str, fmt: str) -> DatasetExport:
+    """
+    Prepare an export of my_table in duckdb_path. Blocking: csv and parquet are fully written
+    here, so errors surface before the response starts rather than truncating it.
+    """
+    import duckdb
+
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'; use one of {', '.join(EXPORT_FORMATS)}")
+    options = EXPORT_FORMATS[fmt][2]
+    if options is None:
+        return _open_arrow(duckdb, duckdb_path, fmt)
+
+    export_path = os.path.join(os.path.dirname(duckdb_path), f"{uuid.uuid4()}.export.{EXPORT_FORMATS[fmt][1]}")
+
+    def _remove() -> None:
+        try:
+            os.remove(export_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("export.cleanup_failed", path=export_path, error=str(e))
+
+    con = duckdb.connect(duckdb_path, read_only=True)
+    try:
+        con.execute(f"COPY (SELECT * FROM my_table ORDER BY rowid) TO '{export_path}' ({options})")
+    except BaseException:
+        _remove()
+        raise
+    finally:
+        con.close()
+    log.info("export.ready", format=fmt, bytes=os.path.getsize(export_path))
+
+    def _read() -> Iterator[bytes]:
+        block = export_block_bytes()
+        with open(export_path, "rb") as f:
+            while True:
+                data = f.read(block)
+                if not data:
+                    return
+                yield data
+
+    return DatasetExport(fmt, _read, _remove)
+
+
+class _ByteSink:
+    """Write-only file object collecting what the Arrow IPC writer emits until it is taken."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data: Any) -> int:
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+def _open_arrow(duckdb: Any, duckdb_path: str, fmt: str) -> DatasetExport:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportUnavailable("Arrow export requires pyarrow; install it or use format=parquet") from None
+
+    con = duckdb.connect(duckdb_path, read_only=True)
+    try:
+        result = con.execute("SELECT * FROM my_table ORDER BY rowid")
+        # to_arrow_reader replaces fetch_record_batch in newer DuckDB releases
+        reader = getattr(result, "to_arrow_reader", result.fetch_record_batch)(export_batch_rows())
+    except BaseException:
+        con.close()
+        raise
+
+    def _batches() -> Iterator[bytes]:
+        sink = _ByteSink()
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), reader.schema)
+        for batch in reader:
+            writer.write_batch(batch)
+            yield sink.take()
+        writer.close()
+        yield sink.take()
+
+    return DatasetExport(fmt, _batches, con.close)
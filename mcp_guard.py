@@ -0,0 +1,152 @@
+"""
+Cost guard for query_results SQL.
+
+query_results_fast runs SQL written by an LLM against a persisted dataset on a shared
+instance. Before a statement runs, the guard:
+
+  1. rejects statement types that reach outside the dataset (ATTACH, COPY, EXPORT, INSTALL/LOAD,
+     PRAGMA, SET, CALL, PREPARE/EXECUTE) and functions that read files, other databases or the
+     environment (read_csv, read_parquet, glob, getenv, query, ...);
+  2. disables DuckDB's external access on the connection and locks its configuration, so file
+     scans that slip past the parser check (e.g. FROM 'data.csv') fail too;
+  3. asks DuckDB for the plan (EXPLAIN) of a single SELECT, rejects it when an operator is
+     estimated to produce more than MCP_QUERY_MAX_ESTIMATED_ROWS rows (typically an accidental
+     cross join), and wraps it in a LIMIT when its result is estimated above
+     MCP_QUERY_MAX_RESULT_ROWS and it has no LIMIT of its own.
+
+Configuration (environment variables):
+  MCP_QUERY_GUARD               - guard query_results SQL (default 1)
+  MCP_QUERY_MAX_RESULT_ROWS     - estimated result rows above which a LIMIT is added (default 10000)
+  MCP_QUERY_MAX_ESTIMATED_ROWS  - estimated rows of any plan operator above which the query is
+                                  rejected, 0 for no limit (default 100000000)
+
+Usage:
+    from mcp_guard import QueryRejected, check_statements, lock_down, guard_limit
+    check_statements(con, sql)                     # raises QueryRejected
+    lock_down(con)
+    limited, report = guard_limit(con, sql)        # report is None when the query is unchanged
+"""
+import json
+import os
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+_DENIED_STATEMENTS = {"ATTACH", "DETACH", "COPY", "COPY_DATABASE", "EXPORT", "EXTENSION", "LOAD", "PRAGMA",
+                      "SET", "VARIABLE_SET", "CALL", "PREPARE", "EXECUTE"}
+
+# Functions that read outside the dataset or run SQL held in a string; read_* is denied as a prefix
+_DENIED_FUNCTIONS = {"glob", "getenv", "query", "query_table", "sniff_csv", "json_execute_serialized_sql",
+                     "parquet_scan", "parquet_metadata", "parquet_schema", "parquet_file_metadata",
+                     "parquet_kv_metadata", "sqlite_scan", "sqlite_attach", "postgres_scan", "postgres_attach",
+                     "postgres_query", "mysql_scan", "mysql_query", "iceberg_scan", "iceberg_metadata",
+                     "delta_scan", "duckdb_secrets", "duckdb_settings", "load_aws_credentials"}
+
+_GUARDED_ALIAS = "__guarded"
+
+
+def query_guard_enabled() -> bool:
+    return os.environ.get("MCP_QUERY_GUARD", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def max_result_rows() -> int:
+    return int(os.environ.get("MCP_QUERY_MAX_RESULT_ROWS", "10000"))
+
+
+def max_estimated_rows() -> int:
+    return int(os.environ.get("MCP_QUERY_MAX_ESTIMATED_ROWS", "100000000"))
+
+
+class QueryRejected(Exception):
+    """Raised when the guard refuses to run a query; the message says why and what to do instead."""
+
+
+def _function_names(node: Any) -> Iterator[str]:
+    if isinstance(node, list):
+        for item in node:
+            yield from _function_names(item)
+    elif isinstance(node, dict):
+        if node.get("class") == "FUNCTION" and node.get("function_name"):
+            yield str(node["function_name"]).lower()
+        for value in node.values():
+            yield from _function_names(value)
+
+
+def check_statements(con: Any, sql: str) -> None:
+    """Raise QueryRejected when sql has a denied statement type or calls a denied function."""
+    statements = con.extract_statements(sql)
+    for statement in statements:
+        kind = statement.type.name
+        if kind in _DENIED_STATEMENTS:
+            keyword = (statement.query.split() or [kind])[0].upper()
+            raise QueryRejected(f"{keyword} statements are not allowed; query my_table with SELECT")
+    for statement in statements:
+        if statement.type.name != "SELECT":
+            continue
+        parsed = json.loads(con.execute("SELECT json_serialize_sql(?)", [statement.query]).fetchone()[0])
+        for name in _function_names(parsed.get("statements", [])):
+            if name.startswith("read_") or name in _DENIED_FUNCTIONS:
+                raise QueryRejected(f"Function {name}() is not allowed; only my_table can be queried")
+
+
+def lock_down(con: Any) -> None:
+    """Deny file system and network access to the rest of the connection's queries."""
+    con.execute("SET enable_external_access = false")
+    con.execute("SET lock_configuration = true")
+
+
+def _estimates(node: Dict[str, Any]) -> Tuple[Optional[int], int]:
+    """
+    (estimated output rows, largest estimate of any operator) of a plan node. The output is None
+    when a LIMIT bounds it or the plan gives no estimate.
+    """
+    children = [_estimates(c) for c in node.get("children") or []]
+    largest = max((c[1] for c in children), default=0)
+    name = str(node.get("name", ""))
+    estimate = (node.get("extra_info") or {}).get("Estimated Cardinality")
+    # Operators above an ORDER BY report 0 rather than their input's estimate
+    if estimate is not None and int(estimate) > 0:
+        out: Optional[int] = int(estimate)
+    elif "LIMIT" in name:
+        out = None
+    elif name == "UNGROUPED_AGGREGATE":
+        out = 1
+    elif name == "CROSS_PRODUCT" and children and all(c[0] is not None for c in children):
+        out = 1
+        for c in children:
+            out *= c[0]
+    else:
+        known = [c[0] for c in children if c[0] is not None]
+        out = max(known) if known and len(known) == len(children) else None
+    return out, max(largest, out or 0)
+
+
+def guard_limit(con: Any, sql: str) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Inspect the plan of a single SELECT. Raises QueryRejected when an operator is estimated
+    above MCP_QUERY_MAX_ESTIMATED_ROWS; returns (sql wrapped in a LIMIT, report) when the
+    result is estimated above MCP_QUERY_MAX_RESULT_ROWS, otherwise (sql, None).
+    """
+    statements = con.extract_statements(sql)
+    if len(statements) != 1 or statements[0].type.name != "SELECT":
+        return sql, None
+    query = statements[0].query.rstrip().rstrip(";").rstrip()
+    plan = json.loads(con.execute("EXPLAIN (FORMAT json) " + query).fetchall()[0][1])
+    root = plan[0] if isinstance(plan, list) else plan
+    estimated, largest = _estimates(root)
+
+    ceiling = max_estimated_rows()
+    if ceiling > 0 and largest > ceiling:
+        raise QueryRejected(
+            f"Query plan is estimated to produce {largest} intermediate rows (limit {ceiling}); "
+            "check for a missing join condition, filter earlier or aggregate"
+        )
+    limit = max_result_rows()
+    if estimated is None or limit <= 0 or estimated <= limit:
+        return sql, None
+    limited = f"SELECT * FROM (\n{query}\n) AS {_GUARDED_ALIAS} LIMIT {limit}"
+    return limited, {
+        "changed": True,
+        "estimated_rows": estimated,
+        "limit": limit,
+        "message": f"Result was estimated at {estimated} rows, so a LIMIT {limit} was added; "
+                   "aggregate, filter or page with LIMIT/OFFSET to see other rows",
+    }
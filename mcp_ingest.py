@@ -0,0 +1,305 @@
+"""
+Bounded-memory ingestion of large raw (summary=False) get_rows results into DuckDB.
+
+A raw extract can run to millions of rows. Holding it as one pandas DataFrame, then
+registering and copying it into DuckDB, multiplies its size in memory. Instead the result
+is read in chunks and each chunk is appended to my_table as soon as it is parsed:
+
+  - With the inmydata SDK, the request get_data would send is sent directly, and the
+    gzipped CSV in the response is parsed chunk by chunk, so the full DataFrame never exists.
+    The SDK has no public streaming call, so this relies on its private request class and
+    response format; when either is not the one expected, a warning is logged and
+    get_data is used instead.
+  - With any other driver (e.g. the benchmark fakes), get_data's DataFrame is split into
+    chunks, which still bounds DuckDB's side of the copy.
+
+Chunks are sized from the bytes per row of the previous chunk to stay within a memory
+ceiling, and hard caps on rows and bytes abort the ingest with IngestLimitExceeded.
+
+Configuration (environment variables):
+  MCP_STREAMING_INGEST          - ingest raw get_rows results in chunks (default 1)
+  MCP_INGEST_MEMORY_BYTES       - memory ceiling for one ingest, split between the parsed
+                                  chunk and DuckDB (default 268435456, minimum 67108864)
+  MCP_INGEST_MAX_ROWS           - rows after which the ingest is aborted, 0 for no cap (default 20000000)
+  MCP_INGEST_MAX_BYTES          - in-memory bytes of parsed rows after which the ingest is
+                                  aborted, 0 for no cap (default 8589934592)
+
+Usage:
+    from mcp_ingest import ChunkAppender, IngestLimits, open_chunks
+    first, stream = open_chunks(driver, subject, fields, filters, system, IngestLimits.from_env())
+    appender = ChunkAppender(con, quote)
+    appender.create(first, select_list)
+    for chunk in stream or ():
+        appender.append(chunk, select_list)
+"""
+import base64
+import gzip
+import inspect
+import io
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+from mcp_cache import frame_bytes
+from mcp_logging import get_logger
+
+log = get_logger("ingest")
+
+# Rows parsed before the bytes per row are known
+_FIRST_CHUNK_ROWS = 10000
+_MIN_CHUNK_ROWS = 1000
+
+# Parameters of the SDK's private request and response classes that _sdk_csv_reader relies on
+_SDK_REQUEST_PARAMETERS = ("Subject", "Fields", "Filters", "TopNUsed", "SummaryRequest", "System")
+_SDK_RESPONSE_FIELDS = ("noRows", "csvDataString")
+
+_INTEGER_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT", "UINTEGER", "UBIGINT")
+
+
+def streaming_ingest_enabled() -> bool:
+    return os.environ.get("MCP_STREAMING_INGEST", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+@dataclass(frozen=True)
+class IngestLimits:
+    memory_bytes: int = 256 * 1024 * 1024
+    max_rows: int = 20_000_000
+    max_bytes: int = 8 * 1024 * 1024 * 1024
+
+    @classmethod
+    def from_env(cls) -> "IngestLimits":
+        return cls(
+            memory_bytes=max(64 * 1024 * 1024, int(os.environ.get("MCP_INGEST_MEMORY_BYTES", str(256 * 1024 * 1024)))),
+            max_rows=int(os.environ.get("MCP_INGEST_MAX_ROWS", "20000000")),
+            max_bytes=int(os.environ.get("MCP_INGEST_MAX_BYTES", str(8 * 1024 * 1024 * 1024))),
+        )
+
+    @property
+    def chunk_bytes(self) -> int:
+        # A parsed chunk is copied once more while DuckDB scans it; DuckDB gets the other half
+        return self.memory_bytes // 4
+
+    @property
+    def duckdb_memory_limit(self) -> str:
+        return f"{max(1, self.memory_bytes // 2 // (1024 * 1024))}MB"
+
+
+class IngestLimitExceeded(RuntimeError):
+    """Raised when an ingest passes MCP_INGEST_MAX_ROWS or MCP_INGEST_MAX_BYTES."""
+
+    def __init__(self, limit: str, value: int, maximum: int):
+        super().__init__(f"Result exceeds the {limit} limit ({value} > {maximum}); "
+                         "narrow the filters or use summary=True")
+        self.limit = limit
+        self.value = value
+        self.maximum = maximum
+
+
+class ChunkStream:
+    """
+    Iterator over the remaining chunks of a result. Each chunk's bytes per row size the next
+    one. close() may be called from another thread to end the stream after the current chunk.
+    """
+
+    def __init__(self, read: Callable[[int], Any], close: Callable[[], None], limits: IngestLimits):
+        self._read = read
+        self._close = close
+        self._closed = False
+        self.limits = limits
+        self.next_rows = _FIRST_CHUNK_ROWS
+
+    def size_from(self, chunk: Any) -> None:
+        if len(chunk):
+            per_row = max(1, frame_bytes(chunk) // len(chunk))
+            self.next_rows = max(_MIN_CHUNK_ROWS, self.limits.chunk_bytes // per_row)
+
+    def __iter__(self) -> Iterator[Any]:
+        return self
+
+    def __next__(self) -> Any:
+        chunk = None if self._closed else self._read(self.next_rows)
+        if chunk is None or len(chunk) == 0:
+            self._closed = True
+            self._close()
+            raise StopIteration
+        self.size_from(chunk)
+        return chunk
+
+    def close(self) -> None:
+        self._closed = True
+
+
+def open_chunks(driver: Any, subject: str, fields: List[str], filters: list, system: str,
+                limits: IngestLimits) -> Tuple[Optional[Any], Optional[ChunkStream]]:
+    """
+    Request a raw result and parse its first chunk. Returns (first_chunk, stream of the
+    remaining chunks), (first_chunk, None) when the first chunk is the whole result, or
+    (None, None) when there is no data.
+    """
+    reader = _sdk_csv_reader(driver, subject, fields, filters, system)
+    if reader is not None:
+        read, close = reader
+    else:
+        rows = driver.get_data(subject, fields, filters, False, system, None)
+        if rows is None:
+            return None, None
+        if len(rows) > limits.max_rows > 0:
+            raise IngestLimitExceeded("row", len(rows), limits.max_rows)
+        offset = [0]
+
+        def read(n: int) -> Any:
+            chunk = rows.iloc[offset[0]:offset[0] + n]
+            offset[0] += len(chunk)
+            return chunk
+
+        def close() -> None:
+            pass
+
+    stream = ChunkStream(read, close, limits)
+    first = read(_FIRST_CHUNK_ROWS + 1)
+    if first is None or len(first) == 0:
+        close()
+        return None, None
+    if len(first) <= _FIRST_CHUNK_ROWS:
+        close()
+        return first, None
+    stream.size_from(first)
+    return first, stream
+
+
+def _sdk_csv_reader(driver: Any, subject: str, fields: List[str], filters: list,
+                    system: str) -> Optional[Tuple[Callable[[int], Any], Callable[[], None]]]:
+    """
+    Send the request StructuredDataDriver.get_data would send and return (read(n), close)
+    over the CSV in the response, or None when the driver is not the inmydata SDK or its
+    private API is not the one expected, in which case get_data is to be used.
+    """
+    request_type = getattr(driver, "_AIDataAPIRequest", None)
+    if request_type is None:
+        return None
+    if not _sdk_api_matches(driver):
+        log.warning("ingest.sdk_unsupported", sdk_module=type(driver).__module__,
+                    detail="StructuredDataDriver private API changed; falling back to get_data")
+        return None
+    import jsonpickle
+    import pandas as pd
+    import requests
+
+    request = request_type(subject, fields, filters, {}, False, system)
+    body = json.loads(jsonpickle.encode(request.to_dict(), unpicklable=False))
+    headers = {"Authorization": "Bearer " + driver.api_key, "Content-Type": "application/json"}
+    url = "https://" + driver.tenant + "." + driver.server + "/api/developer/v1/ai/data"
+    response = requests.post(url, json=body, headers=headers)
+    if response.status_code == 404:
+        log.warning("ingest.sdk_unsupported", url=url, detail="data endpoint not found; falling back to get_data")
+        return None
+    if response.status_code != 200:
+        log.warning("ingest.upstream_status", status=response.status_code)
+        return lambda n: None, lambda: None
+    value = json.loads(response.text).get("value")
+    del response
+    if not isinstance(value, dict):
+        raise ValueError("Response does not contain 'value' or it is None")
+    if not all(f in value for f in _SDK_RESPONSE_FIELDS):
+        log.warning("ingest.sdk_unsupported", fields=sorted(value),
+                    detail="data response format changed; falling back to get_data")
+        return None
+    if not value.get("noRows"):
+        return lambda n: None, lambda: None
+
+    # Only the compressed CSV stays in memory; it is inflated and parsed a chunk at a time
+    compressed = base64.standard_b64decode(value.pop("csvDataString"))
+    text = io.TextIOWrapper(gzip.GzipFile(fileobj=io.BytesIO(compressed)), encoding="utf-8")
+    reader = pd.read_csv(text, iterator=True)
+
+    def read(n: int) -> Any:
+        try:
+            return reader.get_chunk(n)
+        except StopIteration:
+            return None
+
+    return read, reader.close
+
+
+def _sdk_api_matches(driver: Any) -> bool:
+    """True when the driver's private request and response classes are the shape _sdk_csv_reader expects."""
+    request_type = getattr(driver, "_AIDataAPIRequest", None)
+    response_type = getattr(driver, "_AIDataAPIResponse", None)
+    if response_type is None or not hasattr(request_type, "to_dict"):
+        return False
+    if not all(hasattr(driver, a) for a in ("tenant", "server", "api_key")):
+        return False
+    try:
+        request = list(inspect.signature(request_type).parameters)
+        response = list(inspect.signature(response_type).parameters)
+    except (TypeError, ValueError):
+        return False
+    return tuple(request) == _SDK_REQUEST_PARAMETERS and all(f in response for f in _SDK_RESPONSE_FIELDS)
+
+
+def _common_type(table_type: str, chunk_type: str) -> str:
+    """The DuckDB type that holds both a column's existing values and a new chunk's."""
+    if table_type == chunk_type:
+        return table_type
+    if "VARCHAR" in (table_type, chunk_type):
+        return "VARCHAR"
+    numeric = _INTEGER_TYPES + ("DOUBLE", "FLOAT", "BOOLEAN")
+    if table_type.startswith(numeric) and chunk_type.startswith(numeric):
+        if table_type.startswith(_INTEGER_TYPES + ("BOOLEAN",)) and chunk_type.startswith(_INTEGER_TYPES + ("BOOLEAN",)):
+            return "BIGINT"
+        return "DOUBLE"
+    if {table_type, chunk_type} <= {"DATE", "TIMESTAMP"}:
+        return "TIMESTAMP"
+    return "VARCHAR"
+
+
+class ChunkAppender:
+    """
+    Writes chunks to my_table by column name. Column types are inferred per chunk, so a later
+    chunk may e.g. carry decimals or text in a column that started out as integers; such
+    columns are widened first (see _common_type). A column that has only held NULLs so far
+    takes the type of its first non-null chunk.
+    """
+
+    def __init__(self, con: Any, quote: Callable[[str], str]):
+        self.con = con
+        self.quote = quote
+        self.filled: set = set()
+
+    def _note_filled(self, chunk: Any) -> None:
+        self.filled.update(str(c) for c in chunk.columns[chunk.notna().any().to_numpy()])
+
+    def create(self, chunk: Any, select_list: str) -> None:
+        self.con.register("chunk", chunk)
+        try:
+            self.con.execute(f"CREATE OR REPLACE TABLE my_table AS SELECT {select_list} FROM chunk")
+        finally:
+            self.con.unregister("chunk")
+        self._note_filled(chunk)
+
+    def append(self, chunk: Any, select_list: str) -> None:
+        self.con.register("chunk", chunk)
+        try:
+            incoming = {r[0]: r[1] for r in self.con.execute(f"DESCRIBE SELECT {select_list} FROM chunk").fetchall()}
+            existing = {r[0]: r[1] for r in self.con.execute("DESCRIBE my_table").fetchall()}
+            empty = {str(c) for c in chunk.columns[chunk.isna().all().to_numpy()]}
+            nulls = []
+            for name, chunk_type in incoming.items():
+                table_type = existing.get(name)
+                if table_type is None:
+                    continue
+                if name in empty:
+                    # NULLs fit any type, but e.g. a DOUBLE NULL does not cast to DATE
+                    nulls.append(f"CAST(NULL AS {table_type}) AS {self.quote(name)}")
+                    continue
+                target = chunk_type if name not in self.filled else _common_type(table_type, chunk_type)
+                if target != table_type:
+                    self.con.execute(f"ALTER TABLE my_table ALTER {self.quote(name)} TYPE {target}")
+            source = f"SELECT {select_list} FROM chunk"
+            if nulls:
+                source = f"SELECT * REPLACE ({', '.join(nulls)}) FROM ({source})"
+            self.con.execute(f"INSERT INTO my_table BY NAME {source}")
+        finally:
+            self.con.unregister("chunk")
+        self._note_filled(chunk)
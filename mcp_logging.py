@@ -0,0 +1,222 @@
+"""
+Non-blocking structured logging for the MCP servers.
+
+Log calls on the request path only build a LogRecord and put it on an in-memory queue.
+Formatting, secret redaction and the write to stderr happen on a background listener
+thread, so a slow container log driver never blocks the event loop.
+
+Configuration (environment variables):
+  MCP_LOG_LEVEL              - DEBUG, INFO (default), WARNING, ERROR
+  MCP_LOG_FORMAT             - json (default) or text
+  MCP_LOG_DEBUG_SAMPLE_RATE  - fraction (0..1) of high-volume debug lines to keep (default 1.0)
+  MCP_LOG_QUEUE_SIZE         - max queued records before new ones are dropped (default 10000)
+
+Usage:
+    from mcp_logging import get_logger
+    log = get_logger("utils")
+    log.info("dataset.persisted", instance_id=instance_id, rows=total_rows)
+    log.debug("get_rows.call", sample=True, subject=subject, where=where)
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# Kept separate from the "mcp" SDK's own logger hierarchy
+_ROOT_LOGGER = "inmydata.mcp"
+
+# Field names whose values are never written to the log
+_REDACTED_KEYS = {
+    "api_key", "apikey", "authorization", "token", "access_token", "refresh_token",
+    "client_secret", "secret", "password",
+}
+_REDACTED = "***"
+_BEARER_PATTERN = re.compile(r"(bearer\s+)[^\s\"',]+", re.IGNORECASE)
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional["_NonBlockingQueueHandler"] = None
+_debug_sample_rate = 1.0
+
+
+def _redact(value: Any, key: Optional[str] = None) -> Any:
+    if key is not None and key.lower() in _REDACTED_KEYS:
+        return _REDACTED
+    if isinstance(value, str):
+        return _BEARER_PATTERN.sub(r"\1" + _REDACTED, value)
+    if isinstance(value, dict):
+        return {k: _redact(v, str(k)) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_redact(v) for v in value]
+    return value
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that never blocks or formats on the caller's thread.
+    When the queue is full the record is dropped and counted instead.
+    """
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]"):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record can be handed over as-is.
+        # Formatting (and redaction) is deferred to the listener thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects with redacted structured fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": _redact(record.getMessage()),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            payload.update(_redact(fields))
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable formatter: `[time] LEVEL logger event key=value ...`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"[{self.formatTime(record)}] {record.levelname} {record.name} {_redact(record.getMessage())}"
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in _redact(fields).items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """
+    Thin wrapper over a stdlib logger that takes an event name plus keyword fields.
+    Records are built directly (no caller lookup) and handed to the queue handler.
+    """
+
+    def __init__(self, logger: logging.Logger):
+        self._logger = logger
+
+    def isEnabledFor(self, level: int) -> bool:
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, event: str, fields: Dict[str, Any], sample: bool = False, exc_info: bool = False) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        if sample and level <= logging.DEBUG and _debug_sample_rate < 1.0 and random.random() >= _debug_sample_rate:
+            return
+        record = self._logger.makeRecord(
+            self._logger.name, level, "(unknown file)", 0, event, None,
+            sys.exc_info() if exc_info else None, extra={"fields": fields},
+        )
+        self._logger.handle(record)
+
+    def debug(self, event: str, *, sample: bool = False, **fields: Any) -> None:
+        """Debug line. Pass sample=True for high-volume lines subject to MCP_LOG_DEBUG_SAMPLE_RATE."""
+        self._log(logging.DEBUG, event, fields, sample)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+def _configure() -> None:
+    global _listener, _queue_handler, _debug_sample_rate
+
+    level_name = os.environ.get("MCP_LOG_LEVEL", "INFO").strip().upper()
+    level = logging.getLevelName(level_name)
+    if not isinstance(level, int):
+        level = logging.INFO
+
+    try:
+        _debug_sample_rate = min(1.0, max(0.0, float(os.environ.get("MCP_LOG_DEBUG_SAMPLE_RATE", "1.0"))))
+    except ValueError:
+        _debug_sample_rate = 1.0
+
+    try:
+        queue_size = int(os.environ.get("MCP_LOG_QUEUE_SIZE", "10000"))
+    except ValueError:
+        queue_size = 10000
+
+    if os.environ.get("MCP_LOG_FORMAT", "json").strip().lower() == "text":
+        formatter: logging.Formatter = TextFormatter()
+    else:
+        formatter = JsonFormatter()
+
+    # stderr, never stdout: the STDIO server speaks the MCP protocol on stdout
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(formatter)
+
+    root = logging.getLogger(_ROOT_LOGGER)
+    if _queue_handler is not None:
+        root.removeHandler(_queue_handler)
+
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+    _queue_handler = _NonBlockingQueueHandler(log_queue)
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown)
+
+    root.setLevel(level)
+    root.addHandler(_queue_handler)
+    root.propagate = False
+
+
+def get_logger(name: str = _ROOT_LOGGER) -> StructuredLogger:
+    """
+    Return a structured logger under the "inmydata.mcp" hierarchy, starting the background
+    listener on first use.
+    """
+    if _listener is None:
+        with _lock:
+            if _listener is None:
+                _configure()
+    if name != _ROOT_LOGGER and not name.startswith(_ROOT_LOGGER + "."):
+        name = f"{_ROOT_LOGGER}.{name}"
+    return StructuredLogger(logging.getLogger(name))
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def shutdown() -> None:
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
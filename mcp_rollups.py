@@ -0,0 +1,287 @@
+"""
+Rollup tables for persisted datasets.
+
+Most query_results_fast SQL is a GROUP BY over one or two dimension columns of my_table
+with SUM/AVG/COUNT/MIN/MAX of a metric column. When rollups are enabled, the persist stage
+pre-aggregates my_table by its low-cardinality dimensions (all of them together, each pair
+and each one alone) into __rollup_N tables next to my_table, and query_results rewrites
+matching aggregate queries to read the smallest rollup that covers them.
+
+Queries are parsed and rebuilt with DuckDB's own parser (json_serialize_sql /
+json_deserialize_sql). A query is only rewritten when every column it touches outside an
+aggregate is a dimension of the chosen rollup and every aggregate is one the rollup can
+answer exactly; anything else runs against my_table unchanged.
+
+Configuration (environment variables):
+  MCP_DATASET_ROLLUPS           - build rollups when a result is persisted (default 0)
+  MCP_ROLLUP_MIN_ROWS           - smallest dataset worth rolling up (default 100000)
+  MCP_ROLLUP_MAX_DIMENSIONS     - dimensions rolled up per dataset (default 4)
+
+Usage:
+    from mcp_rollups import build_rollups, rewrite_query
+    meta = build_rollups(con, dimensions, metrics, row_count, distinct)
+    rewritten = rewrite_query(con, sql, meta)   # (sql, table) or None
+"""
+import json
+import os
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from mcp_logging import get_logger
+
+log = get_logger("rollups")
+
+# A rollup is only kept when it has at most this fraction of my_table's rows
+_MAX_GROUP_RATIO = 0.1
+
+_ROLLUP_PREFIX = "__rollup_"
+_ROWS_COLUMN = "__rows"
+
+# Expression classes that cannot be answered from pre-aggregated rows
+_UNSUPPORTED_CLASSES = ("SUBQUERY", "WINDOW", "STAR")
+_SUPPORTED_MODIFIERS = ("ORDER_MODIFIER", "LIMIT_MODIFIER", "DISTINCT_MODIFIER")
+
+# Replacement for each supported aggregate; {i} is the metric's index in the rollup metadata
+_AGGREGATE_TEMPLATES = {
+    "sum": 'sum("__sum_{i}")',
+    "min": 'min("__min_{i}")',
+    "max": 'max("__max_{i}")',
+    "count": 'COALESCE(CAST(sum("__count_{i}") AS BIGINT), 0)',
+    "avg": 'sum("__sum_{i}") / sum("__count_{i}")',
+    "mean": 'sum("__sum_{i}") / sum("__count_{i}")',
+    "count_star": f'COALESCE(CAST(sum("{_ROWS_COLUMN}") AS BIGINT), 0)',
+}
+
+_aggregate_names: Optional[Set[str]] = None
+
+
+def rollups_enabled() -> bool:
+    return os.environ.get("MCP_DATASET_ROLLUPS", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def rollup_min_rows() -> int:
+    return int(os.environ.get("MCP_ROLLUP_MIN_ROWS", "100000"))
+
+
+def rollups_path(duckdb_path: str) -> str:
+    """Sidecar file describing the rollup tables of a persisted dataset."""
+    return os.path.splitext(duckdb_path)[0] + ".rollups.json"
+
+
+def load_rollups(duckdb_path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(rollups_path(duckdb_path), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        log.warning("rollups.unreadable", path=duckdb_path, error=str(e))
+        return None
+
+
+def _identifier(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def build_rollups(
+    con: Any,
+    dimensions: List[str],
+    metrics: List[str],
+    row_count: int,
+    distinct: Dict[str, int],
+    max_dimensions: Optional[int] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Create __rollup_N tables over my_table and return their metadata, or None when no rollup
+    would be small enough to help. dimensions / metrics are columns of my_table; distinct maps
+    dimension columns to their (approximate) distinct counts.
+    """
+    if max_dimensions is None:
+        max_dimensions = int(os.environ.get("MCP_ROLLUP_MAX_DIMENSIONS", "4"))
+    limit = row_count * _MAX_GROUP_RATIO
+    candidates = sorted(
+        (d for d in dimensions if 0 < distinct.get(d, row_count) <= limit),
+        key=lambda d: (distinct[d], d)
+    )[:max_dimensions]
+    if not candidates or not metrics:
+        return None
+
+    def aggregates(from_rollup: bool) -> str:
+        # Re-aggregating a rollup combines partial aggregates; my_table is aggregated directly
+        parts = []
+        for i, metric in enumerate(metrics):
+            m = _identifier(metric)
+            if from_rollup:
+                parts += [f'sum("__sum_{i}") AS "__sum_{i}"', f'sum("__count_{i}") AS "__count_{i}"',
+                          f'min("__min_{i}") AS "__min_{i}"', f'max("__max_{i}") AS "__max_{i}"']
+            else:
+                parts += [f'sum({m}) AS "__sum_{i}"', f'count({m}) AS "__count_{i}"',
+                          f'min({m}) AS "__min_{i}"', f'max({m}) AS "__max_{i}"']
+        parts.append(f'sum("{_ROWS_COLUMN}") AS "{_ROWS_COLUMN}"' if from_rollup else f'count(*) AS "{_ROWS_COLUMN}"')
+        return ", ".join(parts)
+
+    tables: List[Dict[str, Any]] = []
+
+    def create(group: Tuple[str, ...], source: Optional[str]) -> Optional[Dict[str, Any]]:
+        # The product of the distinct counts bounds the group count; skip groups that may be too big
+        estimate = 1
+        for d in group:
+            estimate *= distinct[d]
+        if estimate > limit:
+            return None
+        name = f"{_ROLLUP_PREFIX}{len(tables)}"
+        keys = ", ".join(_identifier(d) for d in group)
+        con.execute(
+            f"CREATE OR REPLACE TABLE {name} AS SELECT {keys}, {aggregates(source is not None)} "
+            f"FROM {source or 'my_table'} GROUP BY ALL"
+        )
+        rows = con.execute(f"SELECT count(*) FROM {name}").fetchone()[0]
+        if rows > limit:
+            con.execute(f"DROP TABLE {name}")
+            return None
+        table = {"name": name, "dimensions": list(group), "rows": int(rows)}
+        tables.append(table)
+        return table
+
+    # The finest rollup answers queries over any subset of the candidates; when it is small
+    # enough the coarser rollups are derived from it instead of rescanning my_table
+    groups = [tuple(c) for c in combinations(candidates, 2)] + [(d,) for d in candidates]
+    finest = create(tuple(candidates), None) if len(candidates) > 2 else None
+    source = finest["name"] if finest else None
+    for group in groups:
+        create(group, source)
+
+    if not tables:
+        return None
+    return {"metrics": list(metrics), "tables": tables}
+
+
+def _aggregate_function_names(con: Any) -> Set[str]:
+    global _aggregate_names
+    if _aggregate_names is None:
+        rows = con.execute("SELECT DISTINCT function_name FROM duckdb_functions() WHERE function_type = 'aggregate'").fetchall()
+        _aggregate_names = {r[0].lower() for r in rows} | {"count_star"}
+    return _aggregate_names
+
+
+class _Rewriter:
+    """Walks a serialized SELECT, replacing aggregates with their rollup equivalents."""
+
+    def __init__(self, con: Any, meta: Dict[str, Any], aliases: Set[str]):
+        self.con = con
+        self.metrics = {m: i for i, m in enumerate(meta["metrics"])}
+        self.dimensions = {d for t in meta["tables"] for d in t["dimensions"]}
+        self.aggregate_names = _aggregate_function_names(con)
+        self.aliases = aliases
+        self.used_dimensions: Set[str] = set()
+        self.replaced = 0
+        self.failed = False
+
+    def _template(self, expression: str) -> Dict[str, Any]:
+        parsed = json.loads(self.con.execute("SELECT json_serialize_sql(?)", ["SELECT " + expression]).fetchone()[0])
+        return parsed["statements"][0]["node"]["select_list"][0]
+
+    def _aggregate(self, expr: Dict[str, Any]) -> Dict[str, Any]:
+        name = expr["function_name"].lower()
+        children = expr.get("children") or []
+        if expr.get("distinct") or expr.get("filter") or (expr.get("order_bys") or {}).get("orders"):
+            self.failed = True
+            return expr
+        if name == "count" and not children:
+            name = "count_star"
+        if name == "count_star":
+            template = _AGGREGATE_TEMPLATES[name]
+        elif (name in _AGGREGATE_TEMPLATES and len(children) == 1 and children[0].get("class") == "COLUMN_REF"
+              and children[0]["column_names"][-1] in self.metrics):
+            template = _AGGREGATE_TEMPLATES[name].format(i=self.metrics[children[0]["column_names"][-1]])
+        else:
+            self.failed = True
+            return expr
+        self.replaced += 1
+        replacement = self._template(template)
+        replacement["alias"] = expr.get("alias", "")
+        return replacement
+
+    def visit(self, expr: Any) -> Any:
+        if self.failed:
+            return expr
+        if isinstance(expr, list):
+            return [self.visit(e) for e in expr]
+        if not isinstance(expr, dict):
+            return expr
+        cls = expr.get("class")
+        if cls in _UNSUPPORTED_CLASSES:
+            self.failed = True
+            return expr
+        if cls == "FUNCTION" and expr.get("function_name", "").lower() in self.aggregate_names:
+            return self._aggregate(expr)
+        if cls == "COLUMN_REF":
+            names = expr["column_names"]
+            if names[-1] in self.dimensions:
+                self.used_dimensions.add(names[-1])
+            elif not (len(names) == 1 and names[0] in self.aliases):
+                self.failed = True
+            return expr
+        return {k: self.visit(v) for k, v in expr.items()}
+
+
+def _plain_aggregate_select(node: Dict[str, Any]) -> bool:
+    source = node.get("from_table") or {}
+    return (
+        node.get("type") == "SELECT_NODE"
+        and source.get("type") == "BASE_TABLE"
+        and str(source.get("table_name", "")).lower() == "my_table"
+        and source.get("schema_name", "") in ("", "main")
+        and not source.get("sample")
+        and not (node.get("cte_map") or {}).get("map")
+        and not node.get("qualify")
+        and not node.get("sample")
+        # GROUP BY ALL groups by the same non-aggregate expressions after the rewrite
+        and node.get("aggregate_handling") in ("STANDARD_HANDLING", "FORCE_AGGREGATES")
+        and all(m.get("type") in _SUPPORTED_MODIFIERS for m in node.get("modifiers", []))
+    )
+
+
+def rewrite_query(con: Any, sql: str, meta: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """
+    Rewrite an aggregate query over my_table to read a rollup table instead.
+    Returns (rewritten_sql, rollup_table), or None when the query is not answerable from a rollup.
+    """
+    parsed = json.loads(con.execute("SELECT json_serialize_sql(?)", [sql]).fetchone()[0])
+    if parsed.get("error") or len(parsed.get("statements", [])) != 1:
+        return None
+    node = parsed["statements"][0]["node"]
+    if not _plain_aggregate_select(node):
+        return None
+
+    select_list = node["select_list"]
+    rewriter = _Rewriter(con, meta, {item["alias"] for item in select_list if item.get("alias")})
+    rewritten_items = []
+    changed = []
+    for item in select_list:
+        before = rewriter.replaced
+        rewritten_items.append(rewriter.visit(item))
+        changed.append(rewriter.replaced > before)
+    for key in ("where_clause", "group_expressions", "having", "modifiers"):
+        node[key] = rewriter.visit(node.get(key))
+    if rewriter.failed or not rewriter.replaced:
+        return None
+
+    covering = [t for t in meta["tables"] if rewriter.used_dimensions <= set(t["dimensions"])]
+    if not covering:
+        return None
+    table = min(covering, key=lambda t: t["rows"])
+
+    # Keep the output column names of the original query, e.g. sum("Sales Value")
+    original_columns = con.sql(sql).columns
+    for i, item in enumerate(rewritten_items):
+        if changed[i] and not item.get("alias"):
+            item["alias"] = original_columns[i]
+    node["select_list"] = rewritten_items
+    source = node["from_table"]
+    source["alias"] = source.get("alias") or "my_table"
+    source["table_name"] = table["name"]
+    source["schema_name"] = ""
+
+    rewritten = con.execute("SELECT json_deserialize_sql(?)", [json.dumps(parsed)]).fetchone()[0]
+    return rewritten, table["name"]
@@ -0,0 +1,194 @@
+"""
+Content-addressed storage of persisted datasets.
+
+Sessions of one tenant often ask the same question, and each answer large enough to be
+persisted used to get a DuckDB file of its own under a new instance_id. Datasets are now
+also kept in a store under MCP_DUCKDB_LOCATION/store, named by a digest of their content
+(server, tenant, column names and types, and every row's hash, in order):
+
+  - A new dataset whose digest is already stored becomes a hard link to the stored file,
+    with its profile and rollup sidecars, instead of being written again.
+  - The file's link count is its reference count: the stored copy plus one per instance_id.
+    Deleting an instance_id's files drops a reference; nothing else has to be tracked.
+  - An instance_id about to be modified (e.g. DELETE via query_results_fast) is first given a
+    private copy, so other instance_ids never see the change (see unshare).
+  - Stored datasets no instance_id refers to are evicted after MCP_DATASET_STORE_TTL
+    seconds, oldest first once they take up more than MCP_DATASET_STORE_MAX_BYTES.
+
+File systems without hard links simply get one file per instance_id, as before.
+
+Configuration (environment variables):
+  MCP_DATASET_DEDUP             - share identical persisted datasets between instance_ids (default 1)
+  MCP_DATASET_STORE_TTL         - seconds an unreferenced stored dataset is kept for reuse (default 3600)
+  MCP_DATASET_STORE_MAX_BYTES   - bytes of unreferenced stored datasets kept for reuse (default 2147483648)
+
+Usage:
+    from mcp_store import FrameDigest, link_stored, publish, sweep, unshare
+    digest = FrameDigest(f"{server}/{tenant}")
+    digest.update(frame)                        # once per chunk, in order
+    if not link_stored(digest.hexdigest(), files):
+        ...write the dataset, then...
+        publish(digest.hexdigest(), files)      # files: the .duckdb file first, then its sidecars
+    sweep(location)
+"""
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Iterator, List, Tuple
+
+from mcp_logging import get_logger
+
+log = get_logger("store")
+
+_STORE_DIR = "store"
+
+
+def dedup_enabled() -> bool:
+    return os.environ.get("MCP_DATASET_DEDUP", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def store_ttl_seconds() -> float:
+    return float(os.environ.get("MCP_DATASET_STORE_TTL", "3600"))
+
+
+def store_max_bytes() -> int:
+    return int(os.environ.get("MCP_DATASET_STORE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+
+class FrameDigest:
+    """Running digest of DataFrame contents: column names and dtypes, and row hashes in order."""
+
+    def __init__(self, scope: str):
+        self._hash = hashlib.blake2b(scope.encode("utf-8"), digest_size=20)
+
+    def update(self, frame: Any) -> None:
+        import pandas as pd
+
+        self._hash.update(json.dumps([[str(c), str(t)] for c, t in frame.dtypes.items()]).encode("utf-8"))
+        self._hash.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def _pairs(key: str, files: List[str]) -> Iterator[Tuple[str, str]]:
+    """(dataset file, stored file) for files, whose first entry is the .duckdb file."""
+    stem = os.path.splitext(files[0])[0]
+    store = os.path.join(os.path.dirname(files[0]), _STORE_DIR)
+    for path in files:
+        yield path, os.path.join(store, key + path[len(stem):])
+
+
+def link_stored(key: str, files: List[str]) -> bool:
+    """
+    Make files hard links to the stored dataset with this key. Returns False, leaving no
+    files behind, when there is none or linking fails.
+    """
+    pairs = list(_pairs(key, files))
+    if not os.path.exists(pairs[0][1]):
+        return False
+    linked = []
+    try:
+        for path, stored in pairs:
+            if os.path.exists(stored):
+                os.link(stored, path)
+                linked.append(path)
+        # The store evicts the least recently used datasets first
+        os.utime(pairs[0][1])
+    except OSError as e:
+        # e.g. evicted since the check
+        log.debug("store.link_failed", key=key, error=str(e))
+        for path in linked:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return False
+    return pairs[0][0] in linked
+
+
+def publish(key: str, files: List[str]) -> None:
+    """Add a newly written dataset (files as for link_stored) to the store under key."""
+    pairs = list(_pairs(key, files))
+    try:
+        os.makedirs(os.path.dirname(pairs[0][1]), exist_ok=True)
+        if os.path.exists(pairs[0][1]):
+            return
+        # Sidecars first, so a dataset is only found once all its files are stored
+        for path, stored in pairs[1:] + pairs[:1]:
+            if os.path.exists(path):
+                os.link(path, stored)
+    except FileExistsError:
+        pass
+    except OSError as e:
+        log.warning("store.publish_failed", key=key, error=str(e))
+
+
+def unshare(duckdb_path: str) -> bool:
+    """
+    Give a dataset that shares its file with other instance_ids a private copy, so it can be
+    modified. Returns True when a copy was made.
+    """
+    try:
+        if os.stat(duckdb_path).st_nlink <= 1:
+            return False
+    except FileNotFoundError:
+        return False
+    copy = f"{duckdb_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        shutil.copyfile(duckdb_path, copy)
+        os.replace(copy, duckdb_path)
+    except BaseException:
+        try:
+            os.remove(copy)
+        except OSError:
+            pass
+        raise
+    return True
+
+
+def _evict(store: str, key: str) -> None:
+    # The .duckdb file first, so link_stored stops finding the dataset
+    names = sorted((n for n in os.listdir(store) if n.startswith(key + ".")), key=lambda n: not n.endswith(".duckdb"))
+    for name in names:
+        try:
+            os.remove(os.path.join(store, name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("store.evict_failed", path=name, error=str(e))
+
+
+def sweep(location: str) -> int:
+    """Evict unreferenced stored datasets past MCP_DATASET_STORE_TTL or MCP_DATASET_STORE_MAX_BYTES; returns how many."""
+    store = os.path.join(location, _STORE_DIR)
+    try:
+        names = [n for n in os.listdir(store) if n.endswith(".duckdb")]
+    except FileNotFoundError:
+        return 0
+    now = time.time()
+    ttl = store_ttl_seconds()
+    unreferenced = []
+    for name in names:
+        try:
+            st = os.stat(os.path.join(store, name))
+        except FileNotFoundError:
+            continue
+        if st.st_nlink <= 1:
+            unreferenced.append((st.st_mtime, st.st_size, name[:-len(".duckdb")]))
+    unreferenced.sort()
+    total = sum(u[1] for u in unreferenced)
+    maximum = store_max_bytes()
+    evicted = 0
+    for mtime, size, key in unreferenced:
+        if now - mtime <= ttl and total <= maximum:
+            break
+        _evict(store, key)
+        total -= size
+        evicted += 1
+    if evicted:
+        log.info("store.evicted", datasets=evicted, unreferenced_bytes=total)
+    return evicted
@@ -1,18 +1,381 @@
+from __future__ import annotations
 from decimal import Decimal
+import importlib
 import os
 import tempfile
 import uuid
-import duckdb
-import pandas as pd
-import numpy as np
 from datetime import date, datetime
 import json
-from inmydata_openedge.StructuredData import StructuredDataDriver, AIDataFilter, LogicalOperator, ConditionOperator, TopNOption
-from typing import Optional, List, Dict, Any, Tuple
-from mcp.server.fastmcp import Context
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from typing import Optional, List, Dict, Any, Tuple, TYPE_CHECKING
 import asyncio
+from mcp_cache import frame_bytes, result_cache
+from mcp_cache_backend import TieredCache
+from mcp_calendar import CalendarResolver, calendar_cache
+from mcp_guard import QueryRejected, check_statements, guard_limit, lock_down, query_guard_enabled
+from mcp_ingest import ChunkAppender, ChunkStream, IngestLimitExceeded, IngestLimits, open_chunks, streaming_ingest_enabled
+from mcp_logging import get_logger
+from mcp_rollups import build_rollups, load_rollups, rewrite_query, rollup_min_rows, rollups_enabled, rollups_path
+from mcp_store import FrameDigest, dedup_enabled, link_stored, publish, sweep, unshare
+
+if TYPE_CHECKING:
+    import duckdb
+    import pandas as pd
+    import numpy as np
+    from inmydata_openedge.StructuredData import AIDataFilter, LogicalOperator, ConditionOperator
+
+
+class _LazyModule:
+    """
+    Stand-in for a heavy module that is imported on first attribute access.
+    pandas, numpy, duckdb and the inmydata SDK cost most of the servers' cold start,
+    and a STDIO client spawns server.py per session just to list the tools.
+    Once loaded, the module global is rebound to the real module so hot paths
+    pay no proxy overhead.
+    """
+
+    def __init__(self, module_name: str, alias: str):
+        self._module_name = module_name
+        self._alias = alias
+
+    def __getattr__(self, attr: str) -> Any:
+        module = importlib.import_module(self._module_name)
+        globals()[self._alias] = module
+        return getattr(module, attr)
+
+
+if not TYPE_CHECKING:
+    duckdb = _LazyModule("duckdb", "duckdb")
+    pd = _LazyModule("pandas", "pd")
+    np = _LazyModule("numpy", "np")
+    _sdk = _LazyModule("inmydata_openedge.StructuredData", "_sdk")
+
+log = get_logger("utils")
+slow_log = get_logger("slow_query")
+
+# Rough UTF-8 bytes per LLM token for JSON-heavy text
+_BYTES_PER_TOKEN = 4
+
+# Reserved in the response budget for the instance_id and the timings object
+_INSTANCE_ID_PLACEHOLDER = "00000000-0000-0000-0000-000000000000"
+_TIMINGS_RESERVE_BYTES = 512
+
+# Dataset profiles: most frequent values kept per text column, and the longest min/max text kept
+_PROFILE_TOP_VALUES = 3
+_PROFILE_MAX_TEXT = 60
+_NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                  "UINTEGER", "UBIGINT", "FLOAT", "DOUBLE", "DECIMAL")
+
+_SAMPLE_STRATEGIES = ("stratified", "reservoir", "head_tail", "extremes", "head")
+# Seed for the reservoir sample, so the same dataset always yields the same sample
+_SAMPLE_SEED = 42
+
+# Object columns with at most this fraction of distinct values become categoricals
+_CATEGORY_MAX_RATIO = 0.5
+
+# Field name words marking a time field (see _time_fields), and the order in which the time
+# column of a cached result is chosen for its open period, finest first
+_TIME_KEYWORDS = ("date", "time", "year", "month", "week", "quarter", "period", "day")
+_DELTA_GRAINS = ("date", "time", "day", "week", "period", "month", "quarter", "year")
+
+# Plan operators listed in a query_results profiling report
+_PROFILE_MAX_OPERATORS = 50
+
+# Stages reported by get_rows / get_top_n: requested, fetched (row count known), persisting, done
+_PROGRESS_STEPS = 4
+
+
+def timings_enabled(flag: Optional[str] = None) -> bool:
+    """
+    Returns True when per-call timings should be embedded in tool responses.
+    An explicit flag (e.g. from a request header) wins over the MCP_TIMINGS environment variable.
+    """
+    value = flag if flag else os.environ.get("MCP_TIMINGS", "0")
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def response_budget_bytes() -> Optional[int]:
+    """
+    Returns the output budget for rows embedded in a tool response, in bytes, or None when
+    responses are not budgeted. MCP_RESPONSE_MAX_BYTES (default 16000) and MCP_RESPONSE_MAX_TOKENS
+    (converted at ~4 bytes per token) can both be set; the smaller wins. 0 disables the budget.
+    """
+    budgets = []
+    for name, default, scale in (("MCP_RESPONSE_MAX_BYTES", "16000", 1), ("MCP_RESPONSE_MAX_TOKENS", "", _BYTES_PER_TOKEN)):
+        value = os.environ.get(name, default).strip()
+        if not value:
+            continue
+        try:
+            budgets.append(int(float(value) * scale))
+        except ValueError:
+            continue
+    if not budgets or min(budgets) <= 0:
+        return None
+    return min(budgets)
+
+
+class Timings:
+    """
+    Collects monotonic-clock spans (in milliseconds) for a single tool call.
+    Spans with the same name accumulate, so a stage can be timed in several pieces.
+
+    Usage:
+        timings = Timings()
+        with timings.span("fetch"):
+            ...
+        timings.set("dataframe_rows", 1234)
+        timings.to_dict()  # {"spans_ms": {"fetch": 12.3}, "dataframe_rows": 1234, "total_ms": 12.5}
+    """
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.spans: Dict[str, float] = {}
+        self.values: Dict[str, Any] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds * 1000.0
+
+    def set(self, name: str, value: Any) -> None:
+        self.values[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"spans_ms": {k: round(v, 3) for k, v in self.spans.items()}}
+        result.update(self.values)
+        result["total_ms"] = round((time.perf_counter() - self.started_at) * 1000.0, 3)
+        return result
+
+
+def tool_deadline_seconds(tool: str, override: Optional[float] = None) -> Optional[float]:
+    """
+    Returns the deadline for a tool call in seconds, or None for no deadline.
+    An explicit override wins over MCP_DEADLINE_<TOOL> (e.g. MCP_DEADLINE_GET_ROWS),
+    which wins over MCP_TOOL_DEADLINE_SECONDS (default 300). Zero disables the deadline.
+    """
+    if override is None:
+        value = os.environ.get(f"MCP_DEADLINE_{tool.upper()}", os.environ.get("MCP_TOOL_DEADLINE_SECONDS", "300"))
+        try:
+            override = float(value)
+        except ValueError:
+            override = 300.0
+    return override if override > 0 else None
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a tool call runs past its deadline; stage names the work that was abandoned."""
+
+    def __init__(self, stage: str, seconds: float):
+        super().__init__(f"Deadline of {seconds:g} seconds exceeded during {stage}")
+        self.stage = stage
+        self.seconds = seconds
+
+
+class Deadline:
+    """
+    A monotonic-clock deadline for a single tool call. Measured from started_at, so time
+    spent resolving auth/context and waiting for admission counts against it.
+    """
+
+    def __init__(self, seconds: Optional[float], started_at: Optional[float] = None):
+        self.seconds = seconds
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+
+    def remaining(self) -> Optional[float]:
+        if self.seconds is None:
+            return None
+        return max(0.0, self.seconds - (time.perf_counter() - self.started_at))
+
+    def check(self, stage: str) -> None:
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded(stage, self.seconds)
+
+
+def profiles_enabled() -> bool:
+    """Returns True unless MCP_DATASET_PROFILE turns persisted dataset profiles off."""
+    return os.environ.get("MCP_DATASET_PROFILE", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def sample_strategy() -> str:
+    """
+    Returns how the inline sample of a persisted dataset is chosen (MCP_SAMPLE_STRATEGY):
+      stratified (default) - rows spread evenly across the values of the first dimension column
+      reservoir            - uniform random sample (repeatable)
+      head_tail            - first and last rows, for sorted results
+      extremes             - highest and lowest rows of the primary metric
+      head                 - first rows, as returned upstream
+    """
+    value = os.environ.get("MCP_SAMPLE_STRATEGY", "stratified").strip().lower()
+    return value if value in _SAMPLE_STRATEGIES else "stratified"
+
+
+def query_profile_sample_rate() -> float:
+    """Fraction (0..1) of query_results calls profiled for the slow-query log (MCP_QUERY_PROFILE_SAMPLE_RATE, default 0)."""
+    try:
+        return min(1.0, max(0.0, float(os.environ.get("MCP_QUERY_PROFILE_SAMPLE_RATE", "0"))))
+    except ValueError:
+        return 0.0
+
+
+def slow_query_ms() -> float:
+    """Milliseconds after which a sampled query_results call is written to the slow-query log (MCP_SLOW_QUERY_MS, default 1000)."""
+    try:
+        return float(os.environ.get("MCP_SLOW_QUERY_MS", "1000"))
+    except ValueError:
+        return 1000.0
+
+
+def delta_refresh_seconds() -> float:
+    """
+    Seconds after which a cached time-windowed get_rows result has its open period refetched
+    and merged in (MCP_DELTA_REFRESH_SECONDS, default 60; 0 turns delta refresh off).
+    """
+    try:
+        return float(os.environ.get("MCP_DELTA_REFRESH_SECONDS", "60"))
+    except ValueError:
+        return 60.0
+
+
+def normalize_dtypes_enabled() -> bool:
+    """Returns True unless MCP_NORMALIZE_DTYPES turns dtype normalization of upstream results off."""
+    return os.environ.get("MCP_NORMALIZE_DTYPES", "1").strip().lower() not in ("0", "false", "no", "off")
+
+
+def profile_path(duckdb_path: str) -> str:
+    """Sidecar file holding the cached profile of a persisted dataset."""
+    return os.path.splitext(duckdb_path)[0] + ".profile.json"
+
+
+def dataset_info_path(duckdb_path: str) -> str:
+    """Sidecar file describing a persisted dataset (owner, subject, row count) for the dataset:// resources."""
+    return os.path.splitext(duckdb_path)[0] + ".dataset.json"
+
+
+def resource_page_rows() -> int:
+    """Most rows returned by one dataset://<instance_id>/rows read (MCP_RESOURCE_PAGE_ROWS, default 1000)."""
+    try:
+        return max(1, int(os.environ.get("MCP_RESOURCE_PAGE_ROWS", "1000")))
+    except ValueError:
+        return 1000
+
+
+def dataset_files(duckdb_path: str) -> List[str]:
+    """A persisted dataset's file and the sidecars shared with identical datasets (see mcp_store)."""
+    return [duckdb_path, profile_path(duckdb_path), rollups_path(duckdb_path)]
+
+
+def dataset_shared(duckdb_path: str) -> bool:
+    """True when the dataset's file is a hard link shared with the store and other instance_ids."""
+    try:
+        return os.stat(duckdb_path).st_nlink > 1
+    except OSError:
+        return False
+
+
+def remove_dataset_files(duckdb_path: str) -> None:
+    """Delete a persisted dataset, its write-ahead log, profile, rollup and resource metadata, ignoring files that are already gone."""
+    for path in (duckdb_path, duckdb_path + ".wal", profile_path(duckdb_path), rollups_path(duckdb_path),
+                 dataset_info_path(duckdb_path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("dataset.cleanup_failed", path=path, error=str(e))
+
+
+def schema_cache_ttl() -> float:
+    """Seconds a fetched schema is reused for dataset rollups and result cache keys (MCP_SCHEMA_CACHE_TTL, default 300)."""
+    try:
+        return float(os.environ.get("MCP_SCHEMA_CACHE_TTL", "300"))
+    except ValueError:
+        return 300.0
 
 
+# Parsed schemas by "server/tenant": [time.time() when fetched, schema], shared between
+# replicas when a shared cache backend is configured
+_schema_cache = TieredCache("schema", schema_cache_ttl(), max_entries=1024)
+
+
+def _cache_schema(server: str, tenant: str, schema: Dict[str, Any]) -> None:
+    _schema_cache.set(f"{server}/{tenant}", [time.time(), schema], schema_cache_ttl())
+
+
+def _sdk_driver(*args: Any) -> Any:
+    return _sdk.StructuredDataDriver(*args)
+
+
+# Upstream fetches in flight by result cache key, so identical concurrent requests share one
+_pending_fetches: Dict[str, asyncio.Future] = {}
+# Fetches made for tool calls that are in flight; warm-up waits until there are none
+_foreground_fetches = 0
+# Background warm-ups by (server, tenant)
+_warmups: Dict[Tuple[str, str], asyncio.Task] = {}
+# Datasets persisted by get_rows, by result cache key: (time.monotonic() when persisted, path)
+_persisted_datasets: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_MAX_PERSISTED_DATASETS = 1024
+_WARMUP_YIELD_SECONDS = 0.25
+
+
+def warmup_enabled() -> bool:
+    """Returns True when get_schema should prefetch the hinted summaries of every subject (MCP_WARMUP)."""
+    return os.environ.get("MCP_WARMUP", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+def warmup_tenants() -> List[str]:
+    """Tenants whose hinted summaries are prefetched when the server starts (MCP_WARMUP_TENANTS, comma separated)."""
+    return [t.strip() for t in os.environ.get("MCP_WARMUP_TENANTS", "").split(",") if t.strip()]
+
+
+def schedule_warmup(utils: "mcp_utils", schema: Optional[Dict[str, Any]] = None) -> Optional[asyncio.Task]:
+    """
+    Start a background warm-up (see mcp_utils.warm_up) for the tenant of utils, unless one is
+    already running or there is no event loop. Returns the task.
+    """
+    if not result_cache.enabled or not utils.tenant:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    key = (utils.server, utils.tenant)
+    task = _warmups.get(key)
+    if task is not None and not task.done():
+        return task
+    worker = mcp_utils(utils.api_key, utils.tenant, utils.calendar, utils.user, utils.session_id, utils.server, utils.type, timings=False)
+    task = loop.create_task(worker.warm_up(schema))
+    _warmups[key] = task
+    return task
+
+
+def warm_up_tenants(factory) -> List[asyncio.Task]:
+    """
+    Schedule a warm-up for every tenant in warmup_tenants(). factory(tenant) returns the
+    mcp_utils to warm up with, or None when the tenant cannot be warmed (e.g. no API key).
+    """
+    tasks = []
+    for tenant in warmup_tenants():
+        try:
+            utils = factory(tenant)
+        except Exception as e:
+            log.warning("warmup.skipped", tenant=tenant, error=str(e))
+            continue
+        task = schedule_warmup(utils) if utils is not None else None
+        if task is not None:
+            tasks.append(task)
+    return tasks
+
 
 class mcp_utils:
     def __init__(
@@ -23,7 +386,14 @@ class mcp_utils:
             user: str,
             session_id: str,
             server: Optional[str],
-            type: Optional[str]):
+            type: Optional[str],
+            timings: Optional[bool] = None,
+            started_at: Optional[float] = None):
+        """
+        timings: embed a "timings" object in every response. Defaults to the MCP_TIMINGS environment variable.
+        started_at: time.perf_counter() value taken when the caller began resolving auth/context,
+        recorded as the "context" span when timings are enabled.
+        """
         self.api_key = api_key
         self.tenant = tenant
         self.calendar = calendar
@@ -39,9 +409,173 @@ class mcp_utils:
         else:
             self.type = type
 
-        print(f"Initialized mcp_utils with tenant={tenant}, calendar={calendar}, server={server}, user={user}, session_id={session_id}, type={type}")
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        # Replaced per call by the tool methods that support deadlines
+        self.deadline = Deadline(None, self.started_at)
+
+        if timings is None:
+            timings = timings_enabled()
+        self.timings: Optional[Timings] = None
+        if timings:
+            self.timings = Timings(started_at)
+            if started_at is not None:
+                self.timings.add("context", time.perf_counter() - started_at)
+
+        log.debug("mcp_utils.init", sample=True, tenant=tenant, calendar=calendar, server=server, user=user, session_id=session_id, type=type)
         pass
 
+    def span(self, name: str):
+        """
+        Time a stage of the current call. A no-op when timings are disabled, so hot paths can
+        always wrap their expensive stages:
+
+            with self.span("duckdb_write"):
+                ...
+        """
+        if self.timings is None:
+            return nullcontext()
+        return self.timings.span(name)
+
+    def _start_deadline(self, tool: str, timeout_seconds: Optional[float]) -> None:
+        self.deadline = Deadline(tool_deadline_seconds(tool, timeout_seconds), self.started_at)
+
+    async def _in_thread(self, stage: str, func, *args, interrupt=None, discard=None):
+        """
+        Run a blocking stage in a worker thread, bounded by the call's deadline, so the event
+        loop stays free and the call can be cancelled by the client.
+
+        If the caller gives up (deadline or cancellation) the thread cannot be stopped, so it is
+        left to finish: interrupt() is called to end it early where the work supports it, and
+        discard(result) releases whatever it produces once it does.
+        """
+        self.deadline.check(stage)
+        task = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout=self.deadline.remaining())
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            log.info("call.abandoned", stage=stage, reason="deadline" if timed_out else "cancelled",
+                     tenant=self.tenant, session_id=self.session_id)
+            if interrupt is not None:
+                try:
+                    interrupt()
+                except Exception:
+                    pass
+
+            def _finished(t: asyncio.Future) -> None:
+                if t.cancelled() or t.exception() is not None:
+                    return
+                if discard is not None:
+                    discard(t.result())
+
+            task.add_done_callback(_finished)
+            if timed_out:
+                raise DeadlineExceeded(stage, self.deadline.seconds) from None
+            raise
+
+    async def _progress(self, ctx: Optional[Any], progress: float, message: str) -> None:
+        """
+        Report a stage of a long-running call through the MCP context (a no-op without one, or
+        when the client did not ask for progress). Failures to notify never fail the call.
+        """
+        if ctx is None:
+            return
+        try:
+            await ctx.report_progress(progress, _PROGRESS_STEPS, message)
+        except Exception as e:
+            log.debug("progress.failed", sample=True, error=str(e))
+
+    async def _early_sample(self, ctx: Optional[Any], subject: str, sample: pd.DataFrame, total_rows: int) -> None:
+        """
+        Send the sample rows to the client as a log message before a large result is persisted,
+        so it has something to show while the DuckDB file is written.
+        """
+        if ctx is None:
+            return
+        try:
+            message = json.dumps({
+                "subject": subject,
+                "row_count": total_rows,
+                "columns": list(map(str, sample.columns)),
+                "sample": self._records(sample),
+                "status": "persisting",
+            }, ensure_ascii=False)
+            await ctx.info(message)
+        except Exception as e:
+            log.debug("progress.sample_failed", sample=True, error=str(e))
+
+    def _deadline_error(self, e: DeadlineExceeded) -> str:
+        return self._respond({"error": str(e), "reason": "deadline_exceeded", "stage": e.stage})
+
+    def _respond(self, result: Dict[str, Any], separators: Optional[Tuple[str, str]] = None) -> str:
+        """
+        JSON-encode a tool response, appending the "timings" object when timings are enabled.
+        The timings are spliced onto the encoded string so the payload is only serialized once.
+        """
+        with self.span("json_encode"):
+            s = json.dumps(result, ensure_ascii=False, separators=separators)
+        if self.timings is None or not s.endswith("}"):
+            return s
+        timings = json.dumps(self.timings.to_dict(), separators=(",", ":"))
+        return s[:-1] + ("," if result else "") + '"timings":' + timings + "}"
+
+    def _encoded_row_widths(self, df: pd.DataFrame, compact: bool = False) -> np.ndarray:
+        """
+        Estimate the JSON-encoded size (bytes) of each row as _records / json.dumps would emit
+        it, from per-column value widths, without serializing anything.
+        compact: widths for separators=(",", ":") rather than json.dumps' default (", ", ": ").
+        """
+        sep = 1 if compact else 2
+        # "{" + "}" per record, plus the separator between records
+        widths = np.full(len(df), 2 + sep, dtype=np.int64)
+        for col in df.columns:
+            series = df[col]
+            kind = series.dtype.kind
+            if kind == "b":
+                values = np.where(series.to_numpy(), 4, 5)
+            elif kind in "iuf":
+                values = series.astype(str).str.len().to_numpy()
+            elif kind == "M":
+                # "YYYY-MM-DDTHH:MM:SSZ" plus quotes, or "YYYY-MM-DD" for midnight (see _to_json_safe)
+                values = np.where((series.dt.normalize() == series).to_numpy(), 12, 22)
+            else:
+                # Strings (and anything else rendered as one) are quoted
+                values = series.astype(str).str.len().to_numpy() + 2
+            values = np.where(series.isna().to_numpy(), 4, values)
+            key = len(json.dumps(str(col), ensure_ascii=False)) + 2 * sep
+            widths += key + values.astype(np.int64)
+        return widths
+
+    def _rows_within_budget(self, df: pd.DataFrame, budget_bytes: int, compact: bool = False) -> int:
+        """
+        Number of leading rows of df whose encoded records fit in budget_bytes (at least one,
+        so a sample is never empty). Only as many rows as could possibly fit are measured.
+        """
+        if len(df) == 0:
+            return 0
+        # Every row costs at least its keys and one byte per value
+        min_row = 3 + sum(len(str(col)) + 4 for col in df.columns)
+        candidates = df.head(max(1, budget_bytes // min_row + 1))
+        with self.span("budget"):
+            cumulative = np.cumsum(self._encoded_row_widths(candidates, compact))
+            fit = int(np.searchsorted(cumulative, budget_bytes, side="right"))
+        return max(1, fit)
+
+    def _payload_overhead(self, result: Dict[str, Any]) -> int:
+        """Encoded size of a response without its data rows, plus room for the timings object."""
+        overhead = len(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        if self.timings is not None:
+            overhead += _TIMINGS_RESERVE_BYTES
+        return overhead
+
+    def _records(self, df: pd.DataFrame) -> List[Dict[str, Any]]:
+        # Convert each cell to JSON-safe types
+        with self.span("json_encode"):
+            return [
+                {str(col): self._to_json_safe(val) for col, val in row.items()}
+                for row in df.to_dict(orient="records")
+            ]
+
 
     def _to_json_safe(self, value):
         # Normalize types Claude will see
@@ -54,6 +588,9 @@ class mcp_utils:
             return float(value)
         if isinstance(value, (np.bool_,)):
             return bool(value)
+        if isinstance(value, pd.Timestamp) and value.tzinfo is None and value == value.normalize():
+            # Dates parsed by normalize_frame come back as midnight timestamps; keep them dates
+            return value.date().isoformat()
         if isinstance(value, (datetime,)):
             # ISO 8601 (assume naive are UTC; tweak if you have TZ info)
             if value.tzinfo is None:
@@ -77,35 +614,40 @@ class mcp_utils:
     ) -> str:
         """
         Serialize a DataFrame into a JSON string that's LLM-friendly.
-        - Caps rows to avoid blowing context.
+        - Caps rows to avoid blowing context: at most max_rows, and only as many as fit in
+          max_chars (estimated from per-column encoded widths, so the data is serialized once).
         - Converts NaN -> null, datetimes -> ISO 8601, numpy types -> Python scalars.
         - Includes schema & dtypes so the model understands columns.
         - Adds a small markdown preview (as a string field) for quick glance.
         """
         total_rows = int(len(df))
-        df_out = df.head(max_rows).copy()
 
         # Build schema & dtypes
         schema = [{"name": str(c), "dtype": str(df[c].dtype)} for c in df.columns]
 
-        # Convert each cell to JSON-safe types
-        records = [
-            {str(col): self._to_json_safe(val) for col, val in row.items()}
-            for row in df_out.to_dict(orient="records")
-        ]
-
         payload = {
             "type": "dataframe",
             "row_count": total_rows,
-            "returned_rows": len(df_out),
-            "truncated": total_rows > len(df_out),
+            "returned_rows": 0,
+            "truncated": False,
             "columns": list(map(str, df.columns)),
-            "data": records,
+            "data": [],
         }
 
         if include_schema:
             payload["schema"] = schema
 
+        # The markdown preview repeats the leading rows, so it gets an equal share of the budget
+        available = max_chars - len(json.dumps(payload, ensure_ascii=False, separators=(",", ":")))
+        if markdown_preview_rows > 0:
+            available //= 2
+        fit = self._rows_within_budget(df.head(max_rows), available, compact=True)
+        df_out = df.head(fit)
+
+        payload["returned_rows"] = len(df_out)
+        payload["truncated"] = total_rows > len(df_out)
+        payload["data"] = self._records(df_out)
+
         # Optional small markdown preview for humans (kept inside JSON)
         try:
             preview_rows = min(markdown_preview_rows, len(df_out))
@@ -117,7 +659,7 @@ class mcp_utils:
 
         s = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
 
-        # Hard cap by characters—if still too large, fall back to CSV snippet
+        # Hard cap by characters in case the estimate was off (e.g. heavily escaped strings)—fall back to CSV snippet
         if len(s) > max_chars:
             csv_sample = df_out.to_csv(index=False)
             s = json.dumps({
@@ -133,56 +675,58 @@ class mcp_utils:
         return s
 
     # --- Operator normalization ---
+    # Values are ConditionOperator / LogicalOperator member names, resolved on use so the
+    # SDK is only imported when a tool actually builds a filter.
     _OP_ALIASES = {
         # equals
-        "equals": ConditionOperator.Equals,
-        "eq": ConditionOperator.Equals,
-        "=": ConditionOperator.Equals,
+        "equals": "Equals",
+        "eq": "Equals",
+        "=": "Equals",
         # not equals
-        "not_equals": ConditionOperator.NotEquals,
-        "neq": ConditionOperator.NotEquals,
-        "!=": ConditionOperator.NotEquals,
-        "<>": ConditionOperator.NotEquals,
+        "not_equals": "NotEquals",
+        "neq": "NotEquals",
+        "!=": "NotEquals",
+        "<>": "NotEquals",
         # gt/gte/lt/lte
-        "gt": ConditionOperator.GreaterThan,
-        ">": ConditionOperator.GreaterThan,
-        "gte": ConditionOperator.GreaterThanOrEqualTo,
-        ">=": ConditionOperator.GreaterThanOrEqualTo,
-        "lt": ConditionOperator.LessThan,
-        "<": ConditionOperator.LessThan,
-        "lte": ConditionOperator.LessThanOrEqualTo,
-        "<=": ConditionOperator.LessThanOrEqualTo,
+        "gt": "GreaterThan",
+        ">": "GreaterThan",
+        "gte": "GreaterThanOrEqualTo",
+        ">=": "GreaterThanOrEqualTo",
+        "lt": "LessThan",
+        "<": "LessThan",
+        "lte": "LessThanOrEqualTo",
+        "<=": "LessThanOrEqualTo",
         # string-ish
-        "contains": ConditionOperator.Like,
-        "not_contains": ConditionOperator.NotLike,
-        "starts_with": ConditionOperator.StartsWith
+        "contains": "Like",
+        "not_contains": "NotLike",
+        "starts_with": "StartsWith"
     }
 
     # --- Operator normalization ---
     _LOGICAL_ALIASES = {
         # AND
-        "AND": LogicalOperator.And,
-        "and": LogicalOperator.And,
+        "AND": "And",
+        "and": "And",
         # OR
-        "OR": LogicalOperator.Or,
-        "or": LogicalOperator.Or
+        "OR": "Or",
+        "or": "Or"
     }
 
     def _normalize_condition_operator(self, op_raw: Optional[str]) -> ConditionOperator:
         if not op_raw:
-            return ConditionOperator.Equals
+            return _sdk.ConditionOperator.Equals
         key = str(op_raw).strip().lower()
         if key not in self._OP_ALIASES:
             raise ValueError(f"Unsupported operator: {op_raw!r}")
-        return self._OP_ALIASES[key]
+        return _sdk.ConditionOperator[self._OP_ALIASES[key]]
 
     def _normalize_logical_operator(self, logic_raw: Optional[str]) -> LogicalOperator:
         if not logic_raw:
-            return LogicalOperator.And
+            return _sdk.LogicalOperator.And
         key = str(logic_raw).strip().upper()
         if key not in self._LOGICAL_ALIASES:
             raise ValueError(f"Unsupported logical operator: {logic_raw!r}")
-        return self._LOGICAL_ALIASES[key]
+        return _sdk.LogicalOperator[self._LOGICAL_ALIASES[key]]
 
     def is_int(self, s: str) -> bool:
         try:
@@ -228,7 +772,7 @@ class mcp_utils:
             case_insensitive = bool(item.get("case_insensitive", True))
 
             filters.append(
-                AIDataFilter(
+                _sdk.AIDataFilter(
                     Field=field,
                     ConditionOperator=op,
                     LogicalOperator=logic,
@@ -241,61 +785,1039 @@ class mcp_utils:
 
         return filters
     
+    def _record_frame_size(self, df: pd.DataFrame) -> None:
+        """Record the upstream DataFrame's shape and in-memory size in the call timings."""
+        if self.timings is None:
+            return
+        with self.span("dataframe_size"):
+            self.timings.set("dataframe_rows", int(len(df)))
+            self.timings.set("dataframe_columns", int(len(df.columns)))
+            self.timings.set("dataframe_bytes", int(df.memory_usage(deep=True).sum()))
+
+    def _sample_size(self, rows: pd.DataFrame, overhead_bytes: int = 0, default_limit: int = 10) -> int:
+        """
+        Number of leading rows to return inline. With a response budget (see response_budget_bytes)
+        as many rows as fit are returned, capped by MCP_SAMPLE_ROWS when that is set explicitly.
+        Without a budget, MCP_SAMPLE_ROWS rows (default_limit when unset).
+        """
+        strlimit = os.environ.get("MCP_SAMPLE_ROWS", "")
+        cap = int(strlimit) if self.is_int(strlimit) else None
+        budget = response_budget_bytes()
+        if budget is None:
+            return cap if cap is not None else default_limit
+        candidates = rows if cap is None else rows.head(cap)
+        return self._rows_within_budget(candidates, budget - overhead_bytes)
+
     def save_to_duckdb(
         self, 
         rows: pd.DataFrame, 
         total_rows: int, 
-        default_limit: int = 10
-    ) -> Tuple[pd.DataFrame, str]:
+        default_limit: int = 10,
+        limit: Optional[int] = None
+    ) -> Tuple[pd.DataFrame, str, str, Optional[str]]:
         """
         Saves a DataFrame to a DuckDB database if it exceeds a row limit and returns a truncated sample.
+        A DataFrame identical to a stored dataset is linked to it rather than written (see mcp_store).
 
         Args:
             rows (pd.DataFrame): The DataFrame to process.
             total_rows (int): Total number of rows in the DataFrame.
-            default_limit (int, optional): Default row limit. Defaults to 10.
+            default_limit (int, optional): Row limit when responses are not budgeted. Defaults to 10.
+            limit (int, optional): Precomputed row limit, see _sample_size.
 
         Returns:
-            Tuple[pd.DataFrame, str, str]: (truncated DataFrame, path to DuckDB file or empty string if not saved, instance_id for DuckDB file or empty string if not saved)
+            Tuple[pd.DataFrame, str, str, Optional[str]]: (truncated DataFrame, path to DuckDB file or empty string if not saved, instance_id for DuckDB file or empty string if not saved, content key for the store or None)
         """
-        # Get row limit from environment variable
-        strlimit = os.environ.get("MCP_SAMPLE_ROWS", str(default_limit))
-        limit = int(strlimit) if self.is_int(strlimit) else default_limit
+        # Rows that fit in the response budget (or MCP_SAMPLE_ROWS)
+        if limit is None:
+            limit = self._sample_size(rows, default_limit=default_limit)
 
         # Get DuckDB storage location from environment variable
         duckdblocation = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
         
         duckdb_path = ""
         instance_id = ""
+        key = None
         
         if total_rows > limit:
             instance_id = str(uuid.uuid4())
-            print(f"Warning: total_rows={total_rows} exceeds threshold; data may be truncated.")
+            log.info("dataset.persist", instance_id=instance_id, total_rows=total_rows, sample_rows=limit)
+            duckdb_path = os.path.join(duckdblocation, f"{instance_id}.duckdb")
+
+            key = self._content_key([rows])
+            if key is not None and link_stored(key, dataset_files(duckdb_path)):
+                log.info("dataset.deduplicated", instance_id=instance_id, key=key)
+                con = duckdb.connect(duckdb_path, read_only=True)
+                try:
+                    with self.span("sampling"):
+                        rows = con.execute(self._sample_query(con, limit)).df()
+                finally:
+                    con.close()
+                return rows, duckdb_path, instance_id, key
             
             # Create in-memory DuckDB and register the DataFrame
-            duckdb_path = os.path.join(duckdblocation, f"{instance_id}.duckdb")
             con = duckdb.connect(database=duckdb_path)
-            
-            # Register DataFrame as a relation
-            con.register("rows", rows)
+            try:
+                with self.span("duckdb_write"):
+                    try:
+                        # Register DataFrame as a relation
+                        con.register("rows", rows)
+
+                        # Persist DataFrame to disk as a real table
+                        con.execute(f"CREATE OR REPLACE TABLE my_table AS SELECT {self._storage_columns(rows)} FROM rows")
+                        con.unregister("rows")
+                    except BaseException:
+                        # Never leave a half-written dataset behind
+                        con.close()
+                        remove_dataset_files(duckdb_path)
+                        raise
+
+                # Take the sample from the persisted table rather than the head of the DataFrame
+                with self.span("sampling"):
+                    rows = con.execute(self._sample_query(con, limit)).df()
+            finally:
+                # Save DuckDB database to disk            
+                con.close()
+        return rows, duckdb_path, instance_id, key
+
+    def _content_key(self, frames: List[pd.DataFrame]) -> Optional[str]:
+        """Store key of a dataset made of frames (see mcp_store), or None when deduplication is off or the rows cannot be hashed."""
+        if not dedup_enabled():
+            return None
+        try:
+            with self.span("dedup_hash"):
+                digest = FrameDigest(f"{self.server}/{self.tenant}")
+                for frame in frames:
+                    digest.update(frame)
+                return digest.hexdigest()
+        except TypeError as e:
+            # e.g. unhashable values in an object column
+            log.debug("dataset.dedup_skipped", error=str(e))
+            return None
 
-            # Persist DataFrame to disk as a real table
-            con.execute("CREATE OR REPLACE TABLE my_table AS SELECT * FROM rows")
-            
-            # Save DuckDB database to disk            
+    def stream_to_duckdb(
+        self,
+        first: pd.DataFrame,
+        chunks: ChunkStream,
+        limit: int,
+        subject: str = ""
+    ) -> Tuple[pd.DataFrame, str, str, int, Optional[str]]:
+        """
+        Persist a result that arrives in chunks (see mcp_ingest), appending each chunk to
+        my_table as it is parsed so only one chunk is held in memory. DuckDB's own memory is
+        capped at the ingest ceiling, and the ingest is aborted with IngestLimitExceeded,
+        leaving no files behind, once the rows or bytes pass their caps. The chunks are hashed
+        on the way; when the result turns out to be stored already, the new file is replaced by
+        a link to the stored one under a new instance_id (see mcp_store).
+
+        Returns (sample, path to DuckDB file, instance_id, total rows, content key for the store or None).
+        """
+        limits = chunks.limits
+        duckdblocation = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
+        instance_id = str(uuid.uuid4())
+        duckdb_path = os.path.join(duckdblocation, f"{instance_id}.duckdb")
+        log.info("dataset.stream", instance_id=instance_id, memory_bytes=limits.memory_bytes)
+
+        total_rows = 0
+        total_bytes = 0
+        count = 0
+        largest = 0
+        digest = FrameDigest(f"{self.server}/{self.tenant}") if dedup_enabled() else None
+        con = duckdb.connect(database=duckdb_path)
+        try:
+            with self.span("duckdb_write"):
+                try:
+                    con.execute(f"SET memory_limit = '{limits.duckdb_memory_limit}'")
+                    appender = ChunkAppender(con, self._sql_identifier)
+                    chunk = first
+                    while chunk is not None:
+                        if count and normalize_dtypes_enabled():
+                            chunk = self.normalize_frame(chunk, subject)
+                        size = frame_bytes(chunk)
+                        total_rows += len(chunk)
+                        total_bytes += size
+                        largest = max(largest, size)
+                        if total_rows > limits.max_rows > 0:
+                            raise IngestLimitExceeded("row", total_rows, limits.max_rows)
+                        if total_bytes > limits.max_bytes > 0:
+                            raise IngestLimitExceeded("byte", total_bytes, limits.max_bytes)
+                        if digest is not None:
+                            try:
+                                digest.update(chunk)
+                            except TypeError:
+                                digest = None
+                        if count:
+                            appender.append(chunk, self._storage_columns(chunk))
+                        else:
+                            appender.create(chunk, self._storage_columns(chunk))
+                        count += 1
+                        chunk = next(chunks, None)
+                except BaseException:
+                    chunks.close()
+                    con.close()
+                    remove_dataset_files(duckdb_path)
+                    raise
+
+            # The ceiling bounds the ingest only; sampling and queries use DuckDB's default limit
+            con.execute("RESET memory_limit")
+            log.info("dataset.streamed", instance_id=instance_id, total_rows=total_rows, chunks=count, bytes=total_bytes)
+            if self.timings is not None:
+                self.timings.set("ingest_chunks", count)
+                self.timings.set("ingest_max_chunk_bytes", int(largest))
+            with self.span("sampling"):
+                sample = con.execute(self._sample_query(con, limit)).df()
+        finally:
             con.close()
-                      
-            # Truncate DataFrame for sample
-            rows = rows.head(limit)        
-        return rows, duckdb_path, instance_id    
+
+        key = digest.hexdigest() if digest is not None else None
+        if key is not None:
+            alias_id = str(uuid.uuid4())
+            alias_path = os.path.join(duckdblocation, f"{alias_id}.duckdb")
+            if link_stored(key, dataset_files(alias_path)):
+                log.info("dataset.deduplicated", instance_id=alias_id, key=key)
+                remove_dataset_files(duckdb_path)
+                duckdb_path, instance_id = alias_path, alias_id
+        return sample, duckdb_path, instance_id, total_rows, key
+
+    def _storage_columns(self, rows: pd.DataFrame) -> str:
+        """
+        Select list persisting rows with the types SQL users expect: categoricals as VARCHAR
+        (DuckDB dictionary-compresses strings itself), downcast integers as BIGINT, so
+        arithmetic in query_results cannot overflow a narrow type, and datetimes that are all
+        midnight as DATE.
+        """
+        replace = []
+        for col in rows.columns:
+            series = rows[col]
+            dtype = series.dtype
+            target = None
+            if isinstance(dtype, pd.CategoricalDtype):
+                target = "VARCHAR"
+            elif dtype.kind in "iu" and dtype.itemsize < 8:
+                target = "BIGINT"
+            elif dtype.kind == "M" and getattr(dtype, "tz", None) is None:
+                target = "DATE" if bool((series.dt.normalize() == series)[series.notna()].all()) else "TIMESTAMP"
+            if target is not None:
+                replace.append(f"CAST({self._sql_identifier(col)} AS {target}) AS {self._sql_identifier(col)}")
+        if not replace:
+            return "*"
+        return "* REPLACE (" + ", ".join(replace) + ")"
+
+    def _sample_query(self, con: duckdb.DuckDBPyConnection, limit: int) -> str:
+        """
+        SQL selecting `limit` representative rows of my_table using sample_strategy(), in
+        original row order (extremes: by the metric, highest first). Strategies that need a
+        dimension or metric column fall back to reservoir when the table has none.
+        """
+        strategy = sample_strategy()
+        columns = con.execute("DESCRIBE my_table").fetchall()
+        names = [c[0] for c in columns]
+        numeric = [c[0] for c in columns if c[1].upper().startswith(_NUMERIC_TYPES)]
+        dimensions = [n for n in names if n not in numeric]
+        # Prefer a fractional column as the primary metric; integer columns are often years or codes
+        fractional = [c[0] for c in columns if c[1].upper().startswith(("FLOAT", "DOUBLE", "DECIMAL"))]
+        metric = (fractional or numeric or [None])[0]
+        n = int(limit)
+
+        if strategy == "head":
+            return f"SELECT * FROM my_table LIMIT {n}"
+        if strategy == "head_tail":
+            head, tail = (n + 1) // 2, n // 2
+            # UNION on __rowid drops the overlap when the table is smaller than the sample
+            return (
+                "SELECT * EXCLUDE (__rowid) FROM ("
+                f"(SELECT rowid AS __rowid, * FROM my_table ORDER BY rowid LIMIT {head}) "
+                "UNION "
+                f"(SELECT rowid AS __rowid, * FROM my_table ORDER BY rowid DESC LIMIT {tail})"
+                ") ORDER BY __rowid"
+            )
+        if strategy == "extremes" and metric is not None:
+            m = self._sql_identifier(metric)
+            top, bottom = (n + 1) // 2, n // 2
+            return (
+                "SELECT * EXCLUDE (__rowid) FROM ("
+                f"(SELECT rowid AS __rowid, * FROM my_table WHERE {m} IS NOT NULL ORDER BY {m} DESC, rowid LIMIT {top}) "
+                "UNION "
+                f"(SELECT rowid AS __rowid, * FROM my_table WHERE {m} IS NOT NULL ORDER BY {m} ASC, rowid LIMIT {bottom})"
+                f") ORDER BY {m} DESC, __rowid"
+            )
+        if strategy == "stratified" and dimensions:
+            d = self._sql_identifier(dimensions[0])
+            # Round-robin over the dimension's values: the k-th pick of every value before any (k+1)-th,
+            # with a repeatable pseudo-random pick inside each value
+            return (
+                "SELECT * EXCLUDE (__rowid, __pick) FROM ("
+                "SELECT * FROM ("
+                f"SELECT rowid AS __rowid, row_number() OVER (PARTITION BY {d} ORDER BY hash(rowid + {_SAMPLE_SEED})) AS __pick, * "
+                f"FROM my_table) ORDER BY __pick, __rowid LIMIT {n}"
+                ") ORDER BY __rowid"
+            )
+        return (
+            "SELECT * EXCLUDE (__rowid) FROM ("
+            f"SELECT rowid AS __rowid, * FROM my_table USING SAMPLE reservoir({n} ROWS) REPEATABLE ({_SAMPLE_SEED})"
+            ") ORDER BY __rowid"
+        )
+
+    def profile_dataset(self, duckdb_path: str) -> Dict[str, Any]:
+        """
+        Compute a compact per-column profile of a persisted dataset (type, approximate distinct
+        count, nulls, min/max, and mean/median for numbers or the most frequent values for text)
+        in one SUMMARIZE pass plus one grouped pass over the text columns. The profile is cached
+        next to the dataset (see profile_path) and answers the questions agents otherwise spend
+        query_results_fast round trips on.
+        """
+        with self.span("profile"):
+            con = duckdb.connect(duckdb_path, read_only=True)
+            try:
+                summary = con.execute("SUMMARIZE my_table").fetchall()
+                row_count = summary[0][10] if summary else 0
+                columns: Dict[str, Dict[str, Any]] = {}
+                text_columns = []
+                for name, column_type, min_value, max_value, approx_unique, avg, _std, _q25, q50, _q75, count, null_pct in summary:
+                    numeric = column_type.upper().startswith(_NUMERIC_TYPES)
+                    entry: Dict[str, Any] = {
+                        "type": column_type,
+                        "distinct_approx": int(approx_unique),
+                        "nulls": int(round((null_pct or 0) * count / 100.0)),
+                        "min": self._profile_value(min_value, numeric),
+                        "max": self._profile_value(max_value, numeric),
+                    }
+                    if numeric:
+                        entry["mean"] = self._profile_value(avg, True)
+                        entry["median"] = self._profile_value(q50, True)
+                    elif column_type.upper() in ("VARCHAR", "BOOLEAN") and 0 < approx_unique < count:
+                        text_columns.append(name)
+                    columns[name] = entry
+
+                if text_columns:
+                    branches = " UNION ALL ".join(
+                        f"SELECT {self._sql_literal(c)} AS col, CAST({self._sql_identifier(c)} AS VARCHAR) AS val, COUNT(*) AS n "
+                        f"FROM my_table WHERE {self._sql_identifier(c)} IS NOT NULL GROUP BY 2"
+                        for c in text_columns
+                    )
+                    top = con.execute(
+                        f"SELECT col, val, n FROM ({branches}) "
+                        f"QUALIFY row_number() OVER (PARTITION BY col ORDER BY n DESC, val) <= {_PROFILE_TOP_VALUES} "
+                        f"ORDER BY col, n DESC, val"
+                    ).fetchall()
+                    for col, val, n in top:
+                        columns[col].setdefault("top", []).append([self._profile_value(val, False), int(n)])
+            finally:
+                con.close()
+
+        profile = {"row_count": int(row_count), "columns": columns}
+        with open(profile_path(duckdb_path), "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False, separators=(",", ":"))
+        return profile
+
+    def _profile_value(self, value: Any, numeric: bool) -> Any:
+        if value is None:
+            return None
+        if numeric:
+            try:
+                number = float(value)
+            except (TypeError, ValueError):
+                return str(value)
+            return int(number) if number.is_integer() else round(number, 6)
+        text = str(value)
+        return text if len(text) <= _PROFILE_MAX_TEXT else text[:_PROFILE_MAX_TEXT] + "..."
+
+    async def _subject_fields(self, subject: str) -> Tuple[List[str], List[str]]:
+        """
+        Dimension (factFieldTypes) and metric (metricFieldTypes) field names of a subject, from the
+        schema cached by get_schema, fetched when missing or older than schema_cache_ttl().
+        Returns empty lists when the subject is unknown.
+        """
+        await self._load_schema()
+        if self._cached_schema() is None:
+            driver = _sdk.StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key, self.type)
+            schema_json = await self._in_thread("schema", driver.get_schema, "inmydata.MCP.Server")
+            _cache_schema(self.server, self.tenant, json.loads(schema_json) if schema_json else {})
+        entry = self._schema_subject(subject)
+        if entry is None:
+            return [], []
+        return list(entry.get("factFieldTypes") or {}), list(entry.get("metricFieldTypes") or {})
+
+    async def _load_schema(self) -> None:
+        """Bring this tenant's schema from the shared cache into this replica's, when only it has one."""
+        await _schema_cache.load(f"{self.server}/{self.tenant}")
+
+    def _cached_schema(self) -> Optional[Dict[str, Any]]:
+        cached = _schema_cache.get(f"{self.server}/{self.tenant}")
+        if cached is None or time.time() - cached[0] > schema_cache_ttl():
+            return None
+        return cached[1]
+
+    def _schema_subject(self, subject: str) -> Optional[Dict[str, Any]]:
+        for entry in (self._cached_schema() or {}).get("subjects", []):
+            if str(entry.get("name", "")).lower() == subject.lower():
+                return entry
+        return None
+
+    def _result_key(
+        self,
+        subject: str,
+        select: List[str],
+        where: Optional[List[Dict[str, Any]]],
+        summary: bool,
+        system: str,
+        top_n: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """
+        Result cache key of an upstream get_data request. A summary is grouped by its dimension
+        fields only, so when the schema is known a summary is keyed by its dimensions and serves
+        any request for a subset of its metrics.
+        """
+        fields: Dict[str, Any] = {"fields": sorted(select)}
+        if summary:
+            entry = self._schema_subject(subject)
+            if entry is not None:
+                facts = entry.get("factFieldTypes") or {}
+                fields = {"dimensions": sorted(f for f in select if f in facts)}
+        api_key = hashlib.sha256(self.api_key.encode("utf-8")).hexdigest()[:16]
+        return result_cache.key(self.server, self.tenant, api_key, self.type, subject, system, summary,
+                                where or [], top_n, fields)
+
+    @staticmethod
+    def _project(rows: Optional[pd.DataFrame], select: List[str]) -> Optional[pd.DataFrame]:
+        """rows restricted to the select columns, in order; None when a column is missing."""
+        if rows is None:
+            return None
+        columns = list(rows.columns)
+        if columns == list(select):
+            return rows
+        if not set(select) <= set(columns):
+            return None
+        return rows[list(select)]
+
+    async def _fetch_rows(self, key: str, select: List[str], subject: str, func, *args, background: bool = False) -> Optional[pd.DataFrame]:
+        """
+        func(*args) in a worker thread (see _in_thread), answered from the result cache when
+        possible and shared with an identical fetch already in flight. The result is normalized
+        (see normalize_frame) and cached, even when this call gives up before it arrives.
+        background: the fetch is a warm-up and does not hold back other warm-ups.
+        """
+        global _foreground_fetches
+        await result_cache.load(key)
+        rows = self._project(result_cache.get(key), select)
+        if rows is not None:
+            if self.timings is not None:
+                self.timings.set("cache", "hit")
+            return rows
+
+        pending = _pending_fetches.get(key)
+        if pending is not None:
+            try:
+                rows = self._project(await asyncio.wait_for(asyncio.shield(pending), timeout=self.deadline.remaining()), select)
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded("fetch", self.deadline.seconds) from None
+            except Exception:
+                # The shared fetch failed or was abandoned; fetch independently
+                rows = None
+            if rows is not None:
+                if self.timings is not None:
+                    self.timings.set("cache", "shared")
+                return rows
+
+        future = asyncio.get_running_loop().create_future()
+        # Mark the outcome retrieved so a failure nobody waited for is not reported as unhandled
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        _pending_fetches[key] = future
+        if not background:
+            _foreground_fetches += 1
+        try:
+            rows = await self._in_thread("fetch", self._fetch_normalized, subject, func, *args,
+                                         discard=lambda r: result_cache.put(key, r))
+        except BaseException as e:
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError("fetch abandoned"))
+            raise
+        finally:
+            if not background:
+                _foreground_fetches -= 1
+            if _pending_fetches.get(key) is future:
+                del _pending_fetches[key]
+        result_cache.put(key, rows)
+        future.set_result(rows)
+        if self.timings is not None:
+            self.timings.set("cache", "miss")
+        return self._project(rows, select)
+
+    async def _refresh_open_period(
+        self,
+        key: str,
+        subject: str,
+        where: Optional[List[Dict[str, Any]]],
+        summary: bool,
+        system: str,
+        driver: Any
+    ) -> None:
+        """
+        Bring a cached time-windowed result up to date by refetching its open period only.
+        A result qualifies when its AND-only filters include one on a time field of the subject
+        (see _time_fields) and it has a date or year column (see _open_period): the rows from the latest
+        value of the finest such column on are fetched again and replace the cached ones, while
+        closed periods are kept until the entry's TTL expires. Runs once the entry was last
+        refreshed more than delta_refresh_seconds() ago; a failed refresh leaves it as it was.
+        """
+        refresh = delta_refresh_seconds()
+        if refresh <= 0 or not where or key in _pending_fetches:
+            return
+        await result_cache.load(key)
+        age = result_cache.refreshed_age(key)
+        if age is None or age < refresh:
+            return
+        entry = self._schema_subject(subject)
+        if entry is None:
+            return
+        time_fields = self._time_fields(entry.get("factFieldTypes") or {})
+        if not any((w.get("field") or w.get("column") or w.get("name")) in time_fields for w in where):
+            return
+        if any(self._LOGICAL_ALIASES.get(str(w.get("logic") or w.get("logical") or "AND").strip().upper()) != "And"
+               or w.get("start_group") or w.get("end_group") for w in where):
+            return
+        cached = result_cache.get(key)
+        period = self._open_period(cached, time_fields) if cached is not None else None
+        if period is None:
+            return
+        column, cutoff, value = period
+        fields = list(map(str, cached.columns))
+        filters = self.parse_where(list(where) + [{"field": column, "op": "gte", "value": value, "logical": "AND"}])
+        try:
+            with self.span("delta"):
+                merged, fetched = await self._in_thread("delta", self._merge_open_period, cached, column, cutoff, subject,
+                                                        driver.get_data, subject, fields, filters, summary, system, None)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            log.warning("delta.failed", subject=subject, column=column, error=str(e))
+            return
+        result_cache.merge(key, merged)
+        log.debug("delta.refreshed", sample=True, subject=subject, column=column, since=value, rows=fetched)
+        if self.timings is not None:
+            self.timings.set("delta_rows", fetched)
+
+    @staticmethod
+    def _open_period(rows: pd.DataFrame, time_fields: List[str]) -> Optional[Tuple[str, Any, Any]]:
+        """
+        (column, first value of the open period, that value as a filter value) for the finest
+        date or integer year column of rows, or None when there is none. Integer periods within a
+        year (Month, Week, Period) restart every year, so their maximum isn't the latest period of
+        a result that spans years; they are left out.
+        """
+        candidates = [str(c) for c in rows.columns if str(c) in time_fields]
+        candidates.sort(key=lambda c: next((i for i, g in enumerate(_DELTA_GRAINS) if g in c.lower()), len(_DELTA_GRAINS)))
+        for column in candidates:
+            series = rows[column]
+            if series.dtype.kind not in "iuM" or not series.notna().any():
+                continue
+            if series.dtype.kind != "M" and "year" not in column.lower():
+                continue
+            latest = series.max()
+            if series.dtype.kind == "M":
+                value = latest.strftime("%Y-%m-%d") if latest == latest.normalize() else latest.isoformat()
+            else:
+                latest = value = int(latest)
+            return column, latest, value
+        return None
+
+    def _merge_open_period(
+        self,
+        cached: pd.DataFrame,
+        column: str,
+        cutoff: Any,
+        subject: str,
+        func,
+        *args
+    ) -> Tuple[pd.DataFrame, int]:
+        """cached with its rows from cutoff on replaced by func(*args), and the number of rows fetched."""
+        delta = self._fetch_normalized(subject, func, *args)
+        closed = cached[cached[column] < cutoff]
+        if delta is None or len(delta) == 0:
+            return closed.reset_index(drop=True), 0
+        merged = pd.concat([closed, delta[list(cached.columns)]], ignore_index=True)
+        if normalize_dtypes_enabled():
+            # Categories of the two parts differ, which concat turns back into objects
+            merged = self.normalize_frame(merged, subject)
+        return merged, len(delta)
+
+    async def _open_ingest(
+        self,
+        key: str,
+        select: List[str],
+        subject: str,
+        driver: Any,
+        filters: list,
+        system: str
+    ) -> Tuple[Optional[pd.DataFrame], Optional[ChunkStream]]:
+        """
+        Start a raw (summary=False) fetch in chunks (see mcp_ingest.open_chunks). Returns the
+        first chunk, normalized, and the stream of the rest, or (rows, None) when the result fits
+        in one chunk, in which case it is cached like any other result. A cached result, or one
+        already being fetched, is reused instead of streaming it again.
+        """
+        await result_cache.load(key)
+        rows = self._project(result_cache.get(key), select)
+        if rows is not None:
+            if self.timings is not None:
+                self.timings.set("cache", "hit")
+            return rows, None
+        if key in _pending_fetches:
+            return await self._fetch_rows(key, select, subject, driver.get_data, subject, select, filters, False, system, None), None
+
+        def _discard(opened: Tuple[Optional[pd.DataFrame], Optional[ChunkStream]]) -> None:
+            if opened[1] is not None:
+                opened[1].close()
+
+        limits = IngestLimits.from_env()
+        first, chunks = await self._in_thread("fetch", self._open_normalized, driver, subject, select, filters, system, limits,
+                                              discard=_discard)
+        if self.timings is not None:
+            self.timings.set("cache", "miss")
+        if chunks is None:
+            result_cache.put(key, first)
+        return first, chunks
+
+    def _open_normalized(
+        self,
+        driver: Any,
+        subject: str,
+        select: List[str],
+        filters: list,
+        system: str,
+        limits: IngestLimits
+    ) -> Tuple[Optional[pd.DataFrame], Optional[ChunkStream]]:
+        first, chunks = open_chunks(driver, subject, select, filters, system, limits)
+        if first is None or not normalize_dtypes_enabled():
+            return first, chunks
+        with self.span("normalize"):
+            return self.normalize_frame(first, subject), chunks
+
+    def _fetch_normalized(self, subject: str, func, *args) -> Optional[pd.DataFrame]:
+        rows = func(*args)
+        if rows is None or not normalize_dtypes_enabled():
+            return rows
+        with self.span("normalize"):
+            return self.normalize_frame(rows, subject)
+
+    def normalize_frame(self, rows: pd.DataFrame, subject: str = "") -> pd.DataFrame:
+        """
+        Compact the dtypes of an upstream DataFrame before it is cached or persisted:
+          - columns the subject's schema types as dates/times are parsed once to datetime64
+            (kept as text when any value does not parse)
+          - other object columns with few distinct values become categoricals
+          - integer columns are downcast to the smallest integer type that holds them
+        Floats keep float64 so no value changes. Uses the cached schema only; without it,
+        no column is parsed as a date.
+        """
+        entry = self._schema_subject(subject) if subject else None
+        field_types: Dict[str, str] = {}
+        if entry is not None:
+            for group in ("factFieldTypes", "metricFieldTypes"):
+                for name, info in (entry.get(group) or {}).items():
+                    field_types[name] = str((info or {}).get("type", "")).lower()
+
+        columns: Dict[str, Any] = {}
+        for col in rows.columns:
+            series = rows[col]
+            kind = series.dtype.kind
+            if series.dtype == object:
+                field_type = field_types.get(str(col), "")
+                if "date" in field_type or "time" in field_type:
+                    parsed = pd.to_datetime(series, errors="coerce", format="ISO8601")
+                    if parsed.isna().sum() == series.isna().sum():
+                        columns[col] = parsed
+                        continue
+                distinct = series.nunique(dropna=True)
+                if len(series) > 1 and distinct <= len(series) * _CATEGORY_MAX_RATIO:
+                    columns[col] = series.astype("category")
+            elif kind in "iu":
+                columns[col] = pd.to_numeric(series, downcast="integer" if kind == "i" else "unsigned")
+        if not columns:
+            return rows
+        normalized = rows.copy(deep=False)
+        for col, values in columns.items():
+            normalized[col] = values
+        return normalized
+
+    async def warm_up(self, schema: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Prefetch the summary of each subject's dashboard hints (recommendedMetrics by
+        recommendedTimeDimension) into the result cache, one query at a time and only while no
+        tool call is fetching, so the first real question is often answered without waiting
+        on the warehouse. schema: a get_schema result with hints; fetched when omitted.
+        Returns the number of summaries fetched.
+        """
+        self._start_deadline("warmup", None)
+        warmed = 0
+        try:
+            # Built in a worker thread: at startup this is the first import of the SDK and pandas,
+            # which must not hold up the event loop answering list_tools
+            driver = await self._in_thread("warmup", _sdk_driver, self.tenant, self.server, self.user, self.session_id, self.api_key, self.type)
+            if schema is None:
+                schema_json = await self._in_thread("schema", driver.get_schema, "inmydata.MCP.Server")
+                schema = json.loads(schema_json) if schema_json else {}
+                for subject in schema.get("subjects", []):
+                    self._add_dashboard_hints(subject)
+                _cache_schema(self.server, self.tenant, schema)
+
+            queries = []
+            for subject in schema.get("subjects", []):
+                hints = subject.get("dashboardHints") or {}
+                time_dimension = hints.get("recommendedTimeDimension")
+                metrics = hints.get("recommendedMetrics") or []
+                if time_dimension and metrics:
+                    queries.append((subject.get("name", ""), [time_dimension] + list(metrics), subject.get("system", "")))
+            queries = queries[:int(os.environ.get("MCP_WARMUP_MAX_QUERIES", "10"))]
+
+            for subject, select, system in queries:
+                while _foreground_fetches:
+                    await asyncio.sleep(_WARMUP_YIELD_SECONDS)
+                key = self._result_key(subject, select, [], True, system)
+                await result_cache.load(key)
+                if result_cache.get(key) is not None:
+                    continue
+                try:
+                    await self._fetch_rows(key, select, subject, driver.get_data, subject, select, [], True, system, None, background=True)
+                    warmed += 1
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    log.warning("warmup.query_failed", tenant=self.tenant, subject=subject, error=str(e))
+            log.info("warmup.done", tenant=self.tenant, queries=warmed)
+        except DeadlineExceeded as e:
+            log.warning("warmup.deadline", tenant=self.tenant, stage=e.stage, queries=warmed)
+        except Exception as e:
+            log.warning("warmup.failed", tenant=self.tenant, error=str(e))
+        return warmed
+
+    def build_dataset_rollups(
+        self,
+        duckdb_path: str,
+        dimensions: List[str],
+        metrics: List[str],
+        profile: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Materialize rollup tables for a persisted dataset (see mcp_rollups) and cache their
+        metadata next to it. Dimensions and metrics come from the subject's schema; columns the
+        schema does not know are classified by type. Distinct counts are taken from the profile
+        when there is one.
+        """
+        with self.span("rollups"):
+            con = duckdb.connect(duckdb_path)
+            try:
+                columns = con.execute("DESCRIBE my_table").fetchall()
+                numeric = {c[0] for c in columns if c[1].upper().startswith(_NUMERIC_TYPES)}
+                names = [c[0] for c in columns]
+                known = set(dimensions) | set(metrics)
+                dims = [n for n in names if n in dimensions or (n not in known and n not in numeric)]
+                facts = [n for n in names if n in numeric and (n in metrics or n not in known)]
+                if profile is not None:
+                    distinct = {n: profile["columns"][n]["distinct_approx"] for n in dims if n in profile["columns"]}
+                    row_count = profile["row_count"]
+                else:
+                    counts = con.execute(
+                        "SELECT count(*)" + "".join(f", approx_count_distinct({self._sql_identifier(d)})" for d in dims)
+                        + " FROM my_table"
+                    ).fetchone()
+                    row_count = counts[0]
+                    distinct = dict(zip(dims, counts[1:]))
+                meta = build_rollups(con, dims, facts, row_count, distinct)
+            finally:
+                con.close()
+        if meta is not None:
+            with open(rollups_path(duckdb_path), "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        return meta
+
+    @staticmethod
+    def _sql_identifier(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    @staticmethod
+    def _sql_literal(value: str) -> str:
+        return "'" + str(value).replace("'", "''") + "'"
+
+    async def _persist(
+        self,
+        rows: pd.DataFrame,
+        total_rows: int,
+        ctx: Optional[Any] = None,
+        subject: str = "",
+        overhead_bytes: int = 0,
+        result_key: Optional[str] = None,
+        chunks: Optional[ChunkStream] = None
+    ) -> Tuple[pd.DataFrame, str, str, Optional[Dict[str, Any]], int]:
+        """
+        save_to_duckdb in a worker thread, bounded by the call's deadline, followed by the dataset
+        profile and, when enabled, its rollup tables. A dataset whose caller has gone away is
+        deleted as soon as the write finishes. Results large enough to be persisted have their
+        sample sent to ctx first.
+        overhead_bytes: size of the rest of the response, deducted from the response budget.
+        result_key: result cache key of the request, recorded so get_top_n can rank the dataset locally.
+        chunks: the rest of a streamed result whose first chunk is rows (see stream_to_duckdb);
+        total_rows is then only known once the stream is persisted.
+        Returns (sample, path, instance_id, profile, total_rows); profile is None when nothing was persisted.
+        """
+        limit = self._sample_size(rows, overhead_bytes)
+        if chunks is not None:
+            await self._progress(ctx, 2, f"Streaming {subject} rows for query_results_fast")
+        elif total_rows > limit:
+            await self._early_sample(ctx, subject, rows.head(limit), total_rows)
+            await self._progress(ctx, 2, f"Persisting {total_rows} rows for query_results_fast")
+        def _discard(saved: Tuple[pd.DataFrame, str, str]) -> None:
+            if saved[1]:
+                remove_dataset_files(saved[1])
+                log.info("dataset.discarded", instance_id=saved[2])
+
+        if chunks is not None:
+            saved = await self._in_thread("persist", self.stream_to_duckdb, rows, chunks, limit, subject,
+                                          interrupt=chunks.close, discard=_discard)
+            total_rows = saved[3]
+        else:
+            saved = await self._in_thread("persist", self.save_to_duckdb, rows, total_rows, 10, limit, discard=_discard)
+        sample, duckdb_path, instance_id = saved[:3]
+        key = saved[-1]
+        # A dataset linked to a stored one shares its profile and rollups, and must not be written
+        shared = bool(duckdb_path) and dataset_shared(duckdb_path)
+        profile = None
+        try:
+            self.deadline.check("persist")
+            if shared and profiles_enabled():
+                try:
+                    with open(profile_path(duckdb_path), "r", encoding="utf-8") as f:
+                        profile = json.load(f)
+                except (OSError, ValueError):
+                    pass
+            if duckdb_path and profiles_enabled() and profile is None:
+                try:
+                    profile = await self._in_thread("profile", self.profile_dataset, duckdb_path,
+                                                    discard=lambda _: remove_dataset_files(duckdb_path))
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    # A profile is a convenience; the dataset is still usable without one
+                    log.warning("dataset.profile_failed", instance_id=instance_id, error=str(e))
+            if duckdb_path and not shared and rollups_enabled() and total_rows >= rollup_min_rows():
+                try:
+                    dimensions, metrics = await self._subject_fields(subject)
+                    rollups = await self._in_thread("rollups", self.build_dataset_rollups, duckdb_path, dimensions, metrics, profile,
+                                                    discard=lambda _: remove_dataset_files(duckdb_path))
+                    log.info("dataset.rollups", instance_id=instance_id, tables=len(rollups["tables"]) if rollups else 0)
+                except DeadlineExceeded:
+                    raise
+                except Exception as e:
+                    # Queries fall back to my_table without rollups
+                    log.warning("dataset.rollups_failed", instance_id=instance_id, error=str(e))
+            if duckdb_path and key is not None:
+                await self._in_thread("store", self._store_dataset, key, duckdb_path, shared)
+        except BaseException:
+            _discard(saved)
+            raise
+
+        budget = response_budget_bytes()
+        if duckdb_path and budget is not None and len(sample) > 1:
+            # The sample was sized from the leading rows and shares the budget with the profile,
+            # so fit the rows actually sampled
+            profile_bytes = len(json.dumps(profile, ensure_ascii=False).encode("utf-8")) + 12 if profile else 0
+            fit = self._rows_within_budget(sample, budget - overhead_bytes - profile_bytes)
+            sample = sample.head(fit)
+        if duckdb_path:
+            self._record_dataset(duckdb_path, instance_id, subject, total_rows, sample)
+            if result_key is not None:
+                _persisted_datasets[result_key] = (time.monotonic(), duckdb_path)
+                _persisted_datasets.move_to_end(result_key)
+                while len(_persisted_datasets) > _MAX_PERSISTED_DATASETS:
+                    _persisted_datasets.popitem(last=False)
+            await self._progress(ctx, 3, f"Persisted {total_rows} rows as instance {instance_id}")
+        return sample, duckdb_path, instance_id, profile, total_rows
     
+    @staticmethod
+    def _store_dataset(key: str, duckdb_path: str, shared: bool) -> None:
+        """Add a newly written dataset to the store and evict what the store no longer needs."""
+        if not shared:
+            publish(key, dataset_files(duckdb_path))
+        sweep(os.path.dirname(duckdb_path))
+
+    def _record_dataset(self, duckdb_path: str, instance_id: str, subject: str, total_rows: int, sample: pd.DataFrame) -> None:
+        """
+        Write the dataset's resource metadata (see dataset_info_path). Queries work without it, but the
+        dataset can't be listed, read as a resource or exported.
+        """
+        info = {
+            "instance_id": instance_id,
+            "server": self.server,
+            "tenant": self.tenant,
+            "subject": subject,
+            "row_count": int(total_rows),
+            "columns": list(map(str, sample.columns)),
+            "created_at": datetime.utcnow().replace(microsecond=0).isoformat() + "Z",
+        }
+        try:
+            with open(dataset_info_path(duckdb_path), "w", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False, separators=(",", ":"))
+        except OSError as e:
+            log.error("dataset.info_failed", instance_id=instance_id, path=duckdb_path, error=str(e))
+
+    def _dataset_path(self, instance_id: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """
+        (path, resource metadata) of a persisted dataset readable by this tenant, or (None, None).
+        Datasets without resource metadata are refused, since nothing says which tenant they belong to.
+        """
+        try:
+            instance_id = str(uuid.UUID(instance_id))
+        except (ValueError, TypeError):
+            return None, None
+        duckdb_location = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
+        duckdb_path = os.path.join(duckdb_location, f"{instance_id}.duckdb")
+        if not os.path.exists(duckdb_path):
+            return None, None
+        try:
+            with open(dataset_info_path(duckdb_path), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None, None
+        if info.get("tenant") != self.tenant or info.get("server") != self.server:
+            return None, None
+        return duckdb_path, info
+
+    def dataset_file(self, instance_id: str) -> Optional[str]:
+        """Path of a persisted dataset readable by this tenant (see _dataset_path), or None."""
+        return self._dataset_path(instance_id)[0]
+
+    def list_datasets(self) -> str:
+        """
+        JSON listing of this tenant's persisted datasets (dataset://list), newest first, with the
+        URIs of their metadata and first page of rows.
+        """
+        try:
+            duckdb_location = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
+            datasets = []
+            for name in os.listdir(duckdb_location):
+                if not name.endswith(".dataset.json"):
+                    continue
+                try:
+                    with open(os.path.join(duckdb_location, name), "r", encoding="utf-8") as f:
+                        info = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if info.get("tenant") != self.tenant or info.get("server") != self.server:
+                    continue
+                instance_id = info.get("instance_id", "")
+                datasets.append({
+                    "instance_id": instance_id,
+                    "subject": info.get("subject", ""),
+                    "row_count": info.get("row_count"),
+                    "columns": info.get("columns", []),
+                    "created_at": info.get("created_at"),
+                    "uri": f"dataset://{instance_id}",
+                    "rows_uri": f"dataset://{instance_id}/rows/0/{resource_page_rows()}",
+                })
+            datasets.sort(key=lambda d: d["created_at"] or "", reverse=True)
+            return self._respond({"datasets_count": len(datasets), "datasets": datasets})
+        except Exception as e:
+            return self._respond({"error": str(e)})
+
+    async def dataset_metadata(self, instance_id: str) -> str:
+        """
+        JSON metadata of a persisted dataset (dataset://<instance_id>): column names and types,
+        current row count, the profile when one was computed, and the URI template for row pages.
+        """
+        try:
+            self._start_deadline("read_dataset", None)
+            duckdb_path, info = self._dataset_path(instance_id)
+            if duckdb_path is None:
+                return self._respond({"error": f"Dataset {instance_id} not found"})
+
+            def _describe() -> Tuple[List[Tuple[Any, ...]], int]:
+                con = duckdb.connect(duckdb_path, read_only=True)
+                try:
+                    return con.execute("DESCRIBE my_table").fetchall(), con.execute("SELECT count(*) FROM my_table").fetchone()[0]
+                finally:
+                    con.close()
+
+            columns, row_count = await self._in_thread("describe", _describe)
+            result: Dict[str, Any] = {
+                "instance_id": instance_id,
+                "subject": info.get("subject", ""),
+                "created_at": info.get("created_at"),
+                "row_count": int(row_count),
+                "columns": [{"name": c[0], "type": c[1]} for c in columns],
+                "page_rows": resource_page_rows(),
+                "rows_uri_template": f"dataset://{instance_id}/rows/{{offset}}/{{limit}}",
+            }
+            try:
+                with open(profile_path(duckdb_path), "r", encoding="utf-8") as f:
+                    result["profile"] = json.load(f)
+            except (OSError, ValueError):
+                pass
+            return self._respond(result)
+        except DeadlineExceeded as e:
+            return self._deadline_error(e)
+        except Exception as e:
+            return self._respond({"error": str(e)})
+
+    async def dataset_rows(self, instance_id: str, offset: int, limit: int) -> str:
+        """
+        JSON page of a persisted dataset's rows in stored order (dataset://<instance_id>/rows/<offset>/<limit>).
+        limit is capped by MCP_RESOURCE_PAGE_ROWS and, like any response, by the response budget;
+        next_uri reads the following page and is null after the last row.
+        """
+        try:
+            self._start_deadline("read_dataset", None)
+            duckdb_path, _ = self._dataset_path(instance_id)
+            if duckdb_path is None:
+                return self._respond({"error": f"Dataset {instance_id} not found"})
+            offset = max(0, int(offset))
+            limit = max(1, min(int(limit), resource_page_rows()))
+
+            def _page() -> Tuple[pd.DataFrame, int]:
+                con = duckdb.connect(duckdb_path, read_only=True)
+                try:
+                    # One extra row tells whether another page follows
+                    rows = con.execute("SELECT * FROM my_table ORDER BY rowid LIMIT ? OFFSET ?", [limit + 1, offset]).df()
+                    return rows, con.execute("SELECT count(*) FROM my_table").fetchone()[0]
+                finally:
+                    con.close()
+
+            with self.span("query"):
+                rows, row_count = await self._in_thread("query", _page)
+            more = len(rows) > limit
+            rows = rows.head(limit)
+            result: Dict[str, Any] = {
+                "instance_id": instance_id,
+                "row_count": int(row_count),
+                "offset": offset,
+                "returned_rows": len(rows),
+                "columns": list(map(str, rows.columns)),
+                "data": [],
+                "next_uri": f"dataset://{instance_id}/rows/{offset + limit}/{limit}",
+            }
+            budget = response_budget_bytes()
+            if budget is not None and len(rows) > 0:
+                fit = self._rows_within_budget(rows, budget - self._payload_overhead(result))
+                if fit < len(rows):
+                    rows = rows.head(fit)
+                    more = True
+            records = self._records(rows)
+            result["returned_rows"] = len(records)
+            result["data"] = records
+            result["next_uri"] = f"dataset://{instance_id}/rows/{offset + len(records)}/{limit}" if more else None
+            return self._respond(result)
+        except DeadlineExceeded as e:
+            return self._deadline_error(e)
+        except Exception as e:
+            return self._respond({"error": str(e)})
+
     async def get_rows(
         self,
         subject: str,
         select: List[str],
         summary: bool,
         system: str,
-        where: Optional[List[Dict[str, Any]]] = None
+        where: Optional[List[Dict[str, Any]]] = None,
+        timeout_seconds: Optional[float] = None,
+        ctx: Optional[Any] = None
     ) -> str:
         """
         Retrieve rows with a simple AND-only filter list.
@@ -304,44 +1826,139 @@ class mcp_utils:
         system: "sports2000"
         Allowed ops: equals, contains, not_contains, starts_with, gt, lt, gte, lte
         Allows logical:  AND, OR (default is AND)
+        timeout_seconds: deadline for the call (see tool_deadline_seconds)
+        ctx: optional MCP Context used to report progress and deliver the sample early
         Returns records (<= limit) and total_count if available.
         """
         try:
             if not self.tenant:
-                return json.dumps({"error": "Tenant not set"})
-
-            driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key,self.type)
-            print(f"Calling get_rows with subject={subject}, fields={select}, where={where}, system={system}")
-            rows = driver.get_data(subject, select, self.parse_where(where),summary,system,None)
+                return self._respond({"error": "Tenant not set"})
+
+            self._start_deadline("get_rows", timeout_seconds)
+            driver = _sdk.StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key,self.type)
+            log.debug("get_rows.call", sample=True, tenant=self.tenant, subject=subject, fields=select, where=where, system=system)
+            filters = self.parse_where(where)
+            await self._progress(ctx, 0, f"Requesting {subject} data")
+            chunks = None
+            with self.span("fetch"):
+                await self._load_schema()
+                key = self._result_key(subject, select, where, summary, system)
+                await self._refresh_open_period(key, subject, where, summary, system, driver)
+                if not summary and streaming_ingest_enabled():
+                    rows, chunks = await self._open_ingest(key, select, subject, driver, filters, system)
+                else:
+                    rows = await self._fetch_rows(key, select, subject, driver.get_data, subject, select, filters, summary, system, None)
             if rows is None:
-                return json.dumps({"error": "No data returned from get_data"})
+                return self._respond({"error": "No data returned from get_data"})
+            self.deadline.check("fetch")
             
             total_rows = len(rows)
+            self._record_frame_size(rows)
+            if chunks is not None:
+                await self._progress(ctx, 1, f"Fetched the first {total_rows} rows x {len(rows.columns)} columns")
+            else:
+                await self._progress(ctx, 1, f"Fetched {total_rows} rows x {len(rows.columns)} columns")
             
-            rows, duckdb_file, instanceid = self.save_to_duckdb(rows=rows, total_rows=total_rows)
+            overhead = self._payload_overhead({
+                "subject": subject,
+                "row_count": total_rows if chunks is None else max(total_rows, chunks.limits.max_rows),
+                "returned_rows": total_rows,
+                "columns": list(map(str, rows.columns)),
+                "data": [],
+                "instance_id": _INSTANCE_ID_PLACEHOLDER
+            })
+            rows, duckdb_file, instanceid, profile, total_rows = await self._persist(rows, total_rows, ctx, subject, overhead, key, chunks)
             if duckdb_file != "":
-                print(f"DuckDB database saved to: {duckdb_file}")
+                log.debug("dataset.saved", sample=True, path=duckdb_file)
             else:
-                print("Data did not exceed row limit; no DuckDB file created.")
                 instanceid = ""
             
-            # Convert each cell to JSON-safe types
-            records = [
-                {str(col): self._to_json_safe(val) for col, val in row.items()}
-                for row in rows.to_dict(orient="records")
-            ]
+            records = self._records(rows)
             
             result = {
                 "subject": subject,
                 "row_count": total_rows,
+                "returned_rows": len(records),
                 "columns": list(map(str, rows.columns)),
                 "data": records,            
                 "instance_id": instanceid
             }
+            if profile is not None:
+                result["profile"] = profile
             
-            return json.dumps(result, ensure_ascii=False)
+            await self._progress(ctx, _PROGRESS_STEPS, f"Returning {len(records)} of {total_rows} rows")
+            return self._respond(result)
+        except DeadlineExceeded as e:
+            return self._deadline_error(e)
+        except IngestLimitExceeded as e:
+            return self._respond({"error": str(e), "reason": "ingest_limit", "limit": e.limit, "maximum": e.maximum})
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return self._respond({"error": str(e)})
+
+    async def _local_top_n(
+        self,
+        subject: str,
+        group_by: str,
+        order_by: str,
+        n: int,
+        system: str,
+        where: Optional[List[Dict[str, Any]]]
+    ) -> Optional[pd.DataFrame]:
+        """
+        Answer a Top N request from data already at hand: a cached summary, or a dataset
+        persisted by get_rows, of the same subject, filters and system grouped by group_by alone
+        with an order_by column. Returns None when there is none, or when ranking it fails.
+        """
+        if n == 0:
+            return None
+        key = self._result_key(subject, [group_by, order_by], where, True, system)
+        await result_cache.load(key)
+        cached = self._project(result_cache.get(key), [group_by, order_by])
+        path = None
+        if cached is None:
+            persisted = _persisted_datasets.get(key)
+            if persisted is None or time.monotonic() - persisted[0] > result_cache.ttl_seconds or not os.path.exists(persisted[1]):
+                return None
+            path = persisted[1]
+        try:
+            with self.span("local_top_n"):
+                rows = await self._in_thread("local_top_n", self._rank_locally, cached, path, group_by, order_by, n)
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            log.warning("get_top_n.local_failed", subject=subject, error=str(e))
+            return None
+        log.debug("get_top_n.local", sample=True, subject=subject, source="cache" if path is None else "dataset")
+        return rows
+
+    def _rank_locally(
+        self,
+        rows: Optional[pd.DataFrame],
+        duckdb_path: Optional[str],
+        group_by: str,
+        order_by: str,
+        n: int
+    ) -> pd.DataFrame:
+        """
+        Top (n>0) or bottom (n<0) abs(n) groups of rows, or of my_table in duckdb_path, by order_by.
+        DuckDB runs ORDER BY + LIMIT as a heap-based Top N. Ties are broken by the group value
+        ascending, so equal metrics always rank the same way, and NULL metrics rank last in both
+        directions.
+        """
+        g, m = self._sql_identifier(group_by), self._sql_identifier(order_by)
+        direction = "DESC" if n > 0 else "ASC"
+        con = duckdb.connect(duckdb_path, read_only=True) if duckdb_path else duckdb.connect()
+        try:
+            if duckdb_path:
+                table = "my_table"
+            else:
+                con.register("cached_rows", rows)
+                table = "cached_rows"
+            return con.execute(
+                f"SELECT {g}, {m} FROM {table} ORDER BY {m} {direction} NULLS LAST, {g} ASC NULLS LAST LIMIT {abs(int(n))}"
+            ).df()
+        finally:
+            con.close()
 
     async def get_top_n(
         self,
@@ -350,44 +1967,71 @@ class mcp_utils:
         order_by: str,
         n: int,
         system: str = "",
-        where: Optional[List[Dict[str, Any]]] = None
+        where: Optional[List[Dict[str, Any]]] = None,
+        timeout_seconds: Optional[float] = None,
+        ctx: Optional[Any] = None
     ) -> str:
        """
         Return top/bottom N groups by a metric.
         n>0 => top N, n<0 => bottom N.
         where uses the same shape as get_rows.
         system: "sports2000"
+        timeout_seconds: deadline for the call (see tool_deadline_seconds)
+        ctx: optional MCP Context used to report progress and deliver the sample early
         """
        try:
            if not self.tenant:
-               return json.dumps({"error": "Tenant not set"})
+               return self._respond({"error": "Tenant not set"})
 
-           driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
-           print(f"Calling get_top_n with subject={subject}, group_by={group_by}, order_by={order_by}, n={n}, where={where}")
+           self._start_deadline("get_top_n", timeout_seconds)
+
+           driver = _sdk.StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key)
+           log.debug("get_top_n.call", sample=True, tenant=self.tenant, subject=subject, group_by=group_by, order_by=order_by, n=n, where=where)
 
            # Build a TopN filter to only show the Top 10 Sales People based on Sales Value
-           TopN = TopNOption(order_by, n) # Field to order by and number of records to return (Positive for TopN, negative for BottomN)
+           TopN = _sdk.TopNOption(order_by, n) # Field to order by and number of records to return (Positive for TopN, negative for BottomN)
            TopNOptions = {}
            TopNOptions[group_by] = TopN # Apply the Top N option to the group_by field
 
-           rows = driver.get_data(subject, [group_by, order_by], self.parse_where(where),True,system, TopNOptions)
+           filters = self.parse_where(where)
+           await self._progress(ctx, 0, f"Requesting {subject} top {n} by {order_by}")
+           await self._load_schema()
+           rows = await self._local_top_n(subject, group_by, order_by, n, system, where)
+           local = rows is not None
+           if not local:
+               with self.span("fetch"):
+                   key = self._result_key(subject, [group_by, order_by], where, True, system,
+                                          {"group_by": group_by, "order_by": order_by, "n": n})
+                   rows = await self._fetch_rows(key, [group_by, order_by], subject, driver.get_data, subject, [group_by, order_by], filters, True, system, TopNOptions)
            if rows is None:
-               return json.dumps({"error": "No data returned from get_top_n"})
+               return self._respond({"error": "No data returned from get_top_n"})
+           self.deadline.check("fetch")
            
            total_rows = len(rows)
-           rows, duckdb_file, instanceid = self.save_to_duckdb(rows=rows, total_rows=total_rows)
+           self._record_frame_size(rows)
+           await self._progress(ctx, 1, f"Fetched {total_rows} rows")
+           result = {
+               "subject": subject,
+               "ranking_type": "top" if n > 0 else "bottom",
+               "n": abs(n),
+               "group_by": group_by,
+               "order_by": order_by,
+               "system": system,
+               "local": local,
+               "row_count": total_rows,
+               "returned_rows": total_rows,
+               "columns": list(map(str, rows.columns)),
+               "data": [],
+               "instance_id": _INSTANCE_ID_PLACEHOLDER
+           }
+           rows, duckdb_file, instanceid, profile, _ = await self._persist(rows, total_rows, ctx, subject, self._payload_overhead(result))
            
            if duckdb_file != "":
-               print(f"DuckDB database saved to: {duckdb_file}")
+               log.debug("dataset.saved", sample=True, path=duckdb_file)
            else:
-               print("Data did not exceed row limit; no DuckDB file created.")
                instanceid = ""
            
-           # Convert each cell to JSON-safe types
-           records = [
-               {str(col): self._to_json_safe(val) for col, val in row.items()}
-               for row in rows.to_dict(orient="records")
-           ]
+           records = self._records(rows)
            
            result = {
                "subject": subject,
@@ -396,21 +2040,30 @@ class mcp_utils:
                "group_by": group_by,
                "order_by": order_by,
                "system": system,
+               "local": local,
                "row_count": total_rows,
+               "returned_rows": len(records),
                "columns": list(map(str, rows.columns)),
                "data": records,
                "instance_id": instanceid
            }
+           if profile is not None:
+               result["profile"] = profile
            
-           return json.dumps(result, ensure_ascii=False)
+           await self._progress(ctx, _PROGRESS_STEPS, f"Returning {len(records)} of {total_rows} rows")
+           return self._respond(result)
+       except DeadlineExceeded as e:
+           return self._deadline_error(e)
        except Exception as e:
-           return json.dumps({"error": str(e)}) 
+           return self._respond({"error": str(e)}) 
 
        
     async def query_results(
         self,
         instance_id: str,
-        sql: str
+        sql: str,
+        timeout_seconds: Optional[float] = None,
+        profiling: bool = False
     ) -> str:
        """
         Queries data in a DuckDB database fetching and loaded into that database 
@@ -419,39 +2072,241 @@ class mcp_utils:
         this is unique per call to the tool.
         sql: Is the sql that should be executed against the duckdb database which has a single table
         call my_table in it.
+        timeout_seconds: deadline for the call (see tool_deadline_seconds)
+        profiling: add a "profiling" object with DuckDB's operator timings and cardinalities and the
+        time spent fetching the DataFrame and converting it to JSON. Calls sampled by
+        MCP_QUERY_PROFILE_SAMPLE_RATE are profiled too and logged when slower than MCP_SLOW_QUERY_MS.
         """
        try:
-           print(f"Calling query_results with instance_id={instance_id}, sql={sql}")
+           self._start_deadline("query_results", timeout_seconds)
+           started_at = time.perf_counter()
            duckdb_location = os.environ.get("MCP_DUCKDB_LOCATION", tempfile.gettempdir())
-           print(f"DuckDB file location: {os.path.join(duckdb_location, instance_id)}.duckdb")
+           log.debug("query_results.call", sample=True, instance_id=instance_id, sql=sql)
            rows = None
            # Create connection
-           con = duckdb.connect(os.path.join(duckdb_location, f"{instance_id}.duckdb"), read_only=False)
+           duckdb_path = os.path.join(duckdb_location, f"{instance_id}.duckdb")
+           shared = dataset_shared(duckdb_path)
+           if shared or query_guard_enabled():
+               # Parse on a throwaway connection, so a rejected statement touches nothing on disk
+               probe = duckdb.connect()
+               try:
+                   if query_guard_enabled():
+                       try:
+                           with self.span("guard"):
+                               check_statements(probe, sql)
+                       except QueryRejected as e:
+                           return self._query_rejected(instance_id, e)
+                       except duckdb.Error:
+                           # Unparseable SQL is left to fail with DuckDB's own error when executed
+                           pass
+                   modifies = shared and self._modifies_dataset(probe, sql)
+               finally:
+                   probe.close()
+               if modifies:
+                   # Changes go to a private copy; other instance_ids keep the stored dataset
+                   with self.span("unshare"):
+                       await self._in_thread("unshare", unshare, duckdb_path)
+           # A shared file is also open under other instance_ids, so it is only read; a query
+           # that changes it has its own copy by now
+           con = duckdb.connect(duckdb_path, read_only=shared and not modifies)
+           handed_off = False
            try:
-             # Execute 
-             result = con.execute(sql)
-             rows = result.df()   # Convert to pandas DataFrame
-           except Exception as e:
-             print(f"DuckDB query failed: {str(e)}"  )
+               sampled = random.random() < query_profile_sample_rate()
+               stats: Optional[Dict[str, Any]] = None
+               if profiling or sampled:
+                   # Before the guard locks the connection's configuration
+                   con.execute("SET enable_profiling = 'no_output'")
+                   stats = {}
+               guard = None
+               if query_guard_enabled():
+                   lock_down(con)
+               query = sql
+               if self._modifies_dataset(con, sql):
+                   self._forget_dataset(duckdb_path, instance_id)
+               else:
+                   query = self._rollup_query(con, duckdb_path, instance_id, sql)
+                   if query_guard_enabled():
+                       try:
+                           with self.span("guard"):
+                               query, guard = guard_limit(con, query)
+                           if guard is not None:
+                               # A failed rollup query falls back to the original, limited the same way
+                               sql = guard_limit(con, sql)[0] if query != sql else query
+                       except QueryRejected as e:
+                           return self._query_rejected(instance_id, e)
+                       except duckdb.Error:
+                           pass
+               # _execute_query closes con from here on
+               handed_off = True
            finally:
-             con.close()  # Always close the connection
-           
-           # Convert each cell to JSON-safe types
-           records = [
-               {str(col): self._to_json_safe(val) for col, val in row.items()}
-               for row in rows.to_dict(orient="records")
-           ]
+               if not handed_off:
+                   con.close()
+           try:
+             # Execute in a worker thread; an abandoned query is interrupted rather than left running
+             with self.span("query"):
+                 rows = await self._in_thread("query", self._execute_query, con, query, sql, stats, interrupt=con.interrupt)
+           except DeadlineExceeded:
+             raise
+           except Exception as e:
+             log.warning("query_results.failed", instance_id=instance_id, error=str(e))
+           self.deadline.check("query")
            
+           total_rows = len(rows)
            result = {           
-               "row_count": len(rows),
+               "row_count": total_rows,
+               "returned_rows": total_rows,
+               "truncated": False,
                "columns": list(map(str, rows.columns)),
-               "data": records,               
+               "data": [],               
                "instance_id": instance_id
            }
+           if guard is not None:
+               result["guard"] = guard
+           # Only as many result rows as fit in the response budget are returned inline
+           budget = response_budget_bytes()
+           if budget is not None and total_rows > 0:
+               fit = self._rows_within_budget(rows, budget - self._payload_overhead(result))
+               if fit < total_rows:
+                   rows = rows.head(fit)
+                   result["truncated"] = True
+                   result["hint"] = "Result exceeds the response budget; aggregate or add a LIMIT/OFFSET to see the remaining rows"
            
-           return json.dumps(result, ensure_ascii=False)
+           records_started = time.perf_counter()
+           records = self._records(rows)
+           result["returned_rows"] = len(records)
+           result["data"] = records
+           if stats is not None:
+               stats["json_ms"] = round((time.perf_counter() - records_started) * 1000, 3)
+               report = self._profiling_report(stats)
+               if profiling:
+                   result["profiling"] = report
+               elapsed_ms = (time.perf_counter() - started_at) * 1000
+               if sampled and elapsed_ms >= slow_query_ms():
+                   slow_log.warning("query.slow", instance_id=instance_id, tenant=self.tenant, sql=sql,
+                                    total_ms=round(elapsed_ms, 3), row_count=total_rows, profiling=report)
+           
+           return self._respond(result)
+       except DeadlineExceeded as e:
+           return self._deadline_error(e)
        except Exception as e:
-           return json.dumps({"errorX": str(e)}) 
+           return self._respond({"errorX": str(e)}) 
+
+    def _query_rejected(self, instance_id: str, e: QueryRejected) -> str:
+        log.info("query_results.rejected", instance_id=instance_id, reason=str(e))
+        return self._respond({"error": str(e), "reason": "query_rejected", "instance_id": instance_id})
+
+    @staticmethod
+    def _modifies_dataset(con: duckdb.DuckDBPyConnection, sql: str) -> bool:
+        """True when sql contains a statement other than SELECT, which may change my_table."""
+        try:
+            return any(s.type != duckdb.StatementType.SELECT for s in con.extract_statements(sql))
+        except Exception:
+            # Unparseable SQL fails when executed and changes nothing
+            return False
+
+    def _forget_dataset(self, duckdb_path: str, instance_id: str) -> None:
+        """
+        Stop deriving answers from a dataset that may no longer match the upstream result:
+        its rollups are dropped and get_top_n no longer ranks it locally.
+        """
+        for key in [k for k, (_, path) in _persisted_datasets.items() if path == duckdb_path]:
+            del _persisted_datasets[key]
+        try:
+            os.remove(rollups_path(duckdb_path))
+            log.info("dataset.rollups_invalidated", instance_id=instance_id)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log.warning("dataset.cleanup_failed", path=duckdb_path, error=str(e))
+
+    def _rollup_query(self, con: duckdb.DuckDBPyConnection, duckdb_path: str, instance_id: str, sql: str) -> str:
+        """
+        The SQL to run for a query_results call: sql rewritten to read a rollup table when the
+        dataset has rollups that answer it, otherwise sql unchanged.
+        """
+        meta = load_rollups(duckdb_path)
+        if meta is None:
+            return sql
+        try:
+            with self.span("rollup_rewrite"):
+                rewritten = rewrite_query(con, sql, meta)
+        except Exception as e:
+            log.debug("query_results.rollup_skipped", instance_id=instance_id, error=str(e))
+            return sql
+        if rewritten is None:
+            return sql
+        log.debug("query_results.rollup", sample=True, instance_id=instance_id, table=rewritten[1])
+        if self.timings is not None:
+            self.timings.set("rollup", rewritten[1])
+        return rewritten[0]
+
+    @staticmethod
+    def _execute_query(
+        con: duckdb.DuckDBPyConnection,
+        sql: str,
+        original_sql: Optional[str] = None,
+        stats: Optional[Dict[str, Any]] = None
+    ) -> pd.DataFrame:
+        """
+        Run sql and fetch its result as a DataFrame, then close con.
+        stats: filled with the execute and fetch times and DuckDB's profile of the query that ran
+        (profiling must already be enabled on con).
+        """
+        try:
+            started = time.perf_counter()
+            try:
+                result = con.execute(sql)
+            except duckdb.Error:
+                # A rewritten query that fails is retried as written
+                if original_sql is None or original_sql == sql:
+                    raise
+                result = con.execute(original_sql)
+            executed = time.perf_counter()
+            rows = result.df()   # Convert to pandas DataFrame
+            if stats is not None:
+                stats["execute_ms"] = round((executed - started) * 1000, 3)
+                stats["fetch_df_ms"] = round((time.perf_counter() - executed) * 1000, 3)
+                try:
+                    stats["duckdb"] = json.loads(con.get_profiling_information(format="json"))
+                except (duckdb.Error, ValueError):
+                    pass
+            return rows
+        finally:
+            con.close()  # Always close the connection
+
+    @staticmethod
+    def _profiling_report(stats: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Compact form of a profiled query: wall-clock stages plus DuckDB's latency, CPU time, rows
+        scanned, peak buffer memory and, per plan operator (depth first), its time and output rows.
+        """
+        report = {k: stats[k] for k in ("execute_ms", "fetch_df_ms", "json_ms") if k in stats}
+        profile = stats.get("duckdb")
+        if not profile or "latency" not in profile:
+            # e.g. count(*) answered from table statistics has no profile ({"result": "error"})
+            return report
+        report["latency_ms"] = round(float(profile.get("latency", 0)) * 1000, 3)
+        report["cpu_ms"] = round(float(profile.get("cpu_time", 0)) * 1000, 3)
+        report["rows_scanned"] = profile.get("cumulative_rows_scanned")
+        report["peak_buffer_bytes"] = profile.get("system_peak_buffer_memory")
+        operators: List[Dict[str, Any]] = []
+
+        def _walk(node: Dict[str, Any], depth: int) -> None:
+            for child in node.get("children") or []:
+                if len(operators) >= _PROFILE_MAX_OPERATORS:
+                    return
+                operators.append({
+                    "depth": depth,
+                    "operator": child.get("operator_name") or child.get("operator_type"),
+                    "ms": round(float(child.get("operator_timing", 0)) * 1000, 3),
+                    "rows": child.get("operator_cardinality"),
+                    "rows_scanned": child.get("operator_rows_scanned"),
+                })
+                _walk(child, depth + 1)
+
+        _walk(profile, 0)
+        report["operators"] = operators
+        return report
 
     def get_schema(self) -> str:
         """
@@ -489,12 +2344,13 @@ class mcp_utils:
         """
         try:
             if not self.tenant:
-               return json.dumps({"error": "Tenant not set"})
+               return self._respond({"error": "Tenant not set"})
 
-            driver = StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key, self.type)
-            schema_json = driver.get_schema("inmydata.MCP.Server")
+            driver = _sdk.StructuredDataDriver(self.tenant, self.server, self.user, self.session_id, self.api_key, self.type)
+            with self.span("fetch"):
+                schema_json = driver.get_schema("inmydata.MCP.Server")
             if schema_json is None:
-                return json.dumps({"error": "No schema returned from get_schema"})
+                return self._respond({"error": "No schema returned from get_schema"})
             
             # Parse the schema and enhance it with dashboard hints
             try:
@@ -504,8 +2360,11 @@ class mcp_utils:
                 if "subjects" in schema:
                     for subject in schema["subjects"]:
                         self._add_dashboard_hints(subject)
+                _cache_schema(self.server, self.tenant, schema)
+                if warmup_enabled():
+                    schedule_warmup(self, schema)
                 
-                return json.dumps(schema, ensure_ascii=False, separators=(",", ":"))
+                return self._respond(schema, separators=(",", ":"))
             except json.JSONDecodeError:
                 # If schema is not valid JSON, return as-is
                 return schema_json
@@ -514,6 +2373,11 @@ class mcp_utils:
             # Mirror your C# error string style
             return f"Error retrieving subjects: {e}"
 
+    @staticmethod
+    def _time_fields(fact_fields: Dict[str, Any]) -> List[str]:
+        """Fact fields named like a time attribute (date, week, year, ...), the timeFields of _add_dashboard_hints."""
+        return [f for f in fact_fields if any(k in f.lower() for k in _TIME_KEYWORDS)]
+
     def _add_dashboard_hints(self, subject: Dict[str, Any]) -> None:
         """
         Add dashboard hints and field groups to a subject based on field analysis.
@@ -530,7 +2394,7 @@ class mcp_utils:
         identifier_fields = []
         
         # Common time field patterns
-        time_keywords = ["date", "time", "year", "month", "week", "quarter", "period", "day"]
+        time_keywords = _TIME_KEYWORDS
         # Common location field patterns
         location_keywords = ["region", "country", "state", "city", "location", "store", "branch", "site", "territory"]
         # Common product field patterns
@@ -650,9 +2514,9 @@ class mcp_utils:
 
         try:
             if not self.tenant or not self.calendar:
-                return json.dumps({"error": "Tenant and calendar must be set"})
+                return self._respond({"error": "Tenant and calendar must be set"})
 
-            print("Getting financial periods. API key =", self.api_key)
+            log.debug("get_financial_periods.call", sample=True, tenant=self.tenant, calendar=self.calendar)
             assistant = CalendarAssistant(self.tenant, self.calendar, self.server, self.api_key)
 
             if target_date:
@@ -660,7 +2524,8 @@ class mcp_utils:
             else:
                 dt = date.today()
 
-            periods = assistant.get_financial_periods(dt)
+            with self.span("fetch"):
+                periods = assistant.get_financial_periods(dt)
 
             # Convert SDK/domain objects to JSON-serializable primitives
             try:
@@ -668,10 +2533,10 @@ class mcp_utils:
             except Exception:
                 serializable = str(periods)
 
-            return json.dumps({"periods": serializable, "date": dt.isoformat()})
+            return self._respond({"periods": serializable, "date": dt.isoformat()})
 
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return self._respond({"error": str(e)})
 
 
     async def get_calendar_period_date_range(
@@ -699,7 +2564,7 @@ class mcp_utils:
 
         try:
             if not self.tenant or not self.calendar:
-                return json.dumps({"error": "Tenant and Calendar variables must be set"})
+                return self._respond({"error": "Tenant and Calendar variables must be set"})
 
             # If any parameter is missing, use current financial period
             if financial_year is None or period_number is None or period_type is None:
@@ -735,15 +2600,15 @@ class mcp_utils:
                     elif period_type == "year":
                         period_number = 1  # Year period number is typically 1
                     else:
-                        return json.dumps({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
+                        return self._respond({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
 
             # Validate we have all required values
             if not financial_year:
-                return json.dumps({"error": "Could not determine financial_year"})
+                return self._respond({"error": "Could not determine financial_year"})
             if not period_number:
-                return json.dumps({"error": "Could not determine period_number"})
+                return self._respond({"error": "Could not determine period_number"})
             if not period_type:
-                return json.dumps({"error": "Could not determine period_type"})
+                return self._respond({"error": "Could not determine period_type"})
 
             assistant = CalendarAssistant(self.tenant, self.calendar, self.server, self.api_key)
 
@@ -756,14 +2621,15 @@ class mcp_utils:
 
             period_type_enum = period_type_map.get(period_type.lower())
             if not period_type_enum:
-                return json.dumps({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
+                return self._respond({"error": f"Invalid period_type: {period_type}. Must be one of: year, month, quarter, week"})
 
-            response = assistant.get_calendar_period_date_range(financial_year, period_number, period_type_enum)
+            with self.span("fetch"):
+                response = assistant.get_calendar_period_date_range(financial_year, period_number, period_type_enum)
 
             if response is None:
-                return json.dumps({"error": "No date range found for the specified period"})
+                return self._respond({"error": "No date range found for the specified period"})
 
-            return json.dumps({
+            return self._respond({
                 "start_date": response.StartDate.isoformat(),
                 "end_date": response.EndDate.isoformat(),
                 "financial_year": financial_year,
@@ -772,5 +2638,55 @@ class mcp_utils:
             })
 
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return self._respond({"error": str(e)})
+
+    async def resolve_calendar(
+        self,
+        dates: Optional[List[str]] = None,
+        periods: Optional[List[Any]] = None,
+        expressions: Optional[List[str]] = None,
+        as_of: Optional[str] = None
+    ) -> str:
+        """
+        Resolve a batch of calendar questions in one call (see mcp_calendar).
+
+        Args:
+            dates: Dates in ISO format (YYYY-MM-DD) to get the financial year, quarter, month and week of.
+            periods: Periods to get the start and end dates of, each
+                {"financial_year", "period_number", "period_type"} or [financial_year, period_number, period_type].
+            expressions: Relative periods such as "current month", "previous 8 quarters",
+                "next 2 weeks" or "same quarter last year".
+            as_of: Date expressions are relative to (YYYY-MM-DD), defaults to today.
+
+        Returns:
+            JSON string with "dates", "periods" and "expressions" lists in input order; items
+            that cannot be resolved have an "error"
+        """
+        from inmydata_openedge.CalendarAssistant import CalendarAssistant
+
+        try:
+            if not self.tenant or not self.calendar:
+                return self._respond({"error": "Tenant and calendar must be set"})
+            self._start_deadline("resolve_calendar", None)
+            today = datetime.fromisoformat(as_of).date() if as_of else date.today()
+            log.debug("resolve_calendar.call", sample=True, tenant=self.tenant, calendar=self.calendar,
+                      dates=len(dates or []), periods=len(periods or []), expressions=len(expressions or []))
+
+            resolver = CalendarResolver(
+                calendar_cache(self.server, self.tenant, self.calendar),
+                lambda: CalendarAssistant(self.tenant, self.calendar, self.server, self.api_key),
+                lambda func, *args: self._in_thread("calendar", func, *args),
+                fatal=(DeadlineExceeded,),
+            )
+            with self.span("fetch"):
+                result = await resolver.resolve(dates or [], periods or [], expressions or [], today)
+            if self.timings is not None:
+                self.timings.set("calendar_calls", resolver.calls)
+            result["as_of"] = today.isoformat()
+            return self._respond(result)
+
+        except DeadlineExceeded as e:
+            return self._deadline_error(e)
+        except Exception as e:
+            return self._respond({"error": str(e)})
 
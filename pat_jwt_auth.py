@@ -1,15 +1,20 @@
 """
 Custom RemoteAuthProvider that supports both JWTs and Personal Access Tokens (PATs).
 When a PAT is detected (non-JWT), performs token introspection to get a valid JWT.
-Caches introspection results to avoid repeated requests for the same PAT.
+Caches introspection results to avoid repeated requests for the same PAT, shared between
+replicas when a shared cache backend is configured (see mcp_cache_backend).
 """
 import httpx
 import os
 import time
-from typing import Optional, Dict, Tuple
+from typing import Optional
 from fastmcp.server.auth import RemoteAuthProvider
 from fastmcp.server.auth.providers.jwt import JWTVerifier, AccessToken
 from pydantic import AnyHttpUrl
+from mcp_cache_backend import TieredCache
+from mcp_logging import get_logger
+
+log = get_logger("auth")
 
 
 class PATAwareJWTVerifier(JWTVerifier):
@@ -35,8 +40,8 @@ class PATAwareJWTVerifier(JWTVerifier):
         self.client_secret = client_secret
         self.cache_ttl_seconds = cache_ttl_seconds
         
-        # Cache format: {token_hash: (AccessToken, expiry_timestamp)}
-        self._introspection_cache: Dict[str, Tuple[AccessToken, float]] = {}
+        # Cache format: {token_hash: [AccessToken fields, expiry_timestamp]}
+        self._introspection_cache = TieredCache("token", cache_ttl_seconds)
     
     async def verify_token(self, token: str) -> Optional[AccessToken]:
         """
@@ -56,14 +61,14 @@ class PATAwareJWTVerifier(JWTVerifier):
                 return access_token
         except Exception as e:
             # JWT verification failed, might be a PAT
-            print(f"JWT verification failed: {e}. Attempting token introspection...")
+            log.debug("jwt.verify_failed", sample=True, error=str(e))
         
         # If JWT verification failed and we have introspection configured, try introspection
         if self.introspection_endpoint:
             # Check cache first
-            cached_token = self._get_cached_token(token)
+            cached_token = await self._get_cached_token(token)
             if cached_token is not None:
-                print("Using cached introspection result")
+                log.debug("introspection.cache_hit", sample=True)
                 return cached_token
             
             # Cache miss, perform introspection
@@ -74,9 +79,10 @@ class PATAwareJWTVerifier(JWTVerifier):
         
         return None
     
-    def _get_cached_token(self, token: str) -> Optional[AccessToken]:
+    async def _get_cached_token(self, token: str) -> Optional[AccessToken]:
         """
-        Retrieve a cached introspection result if not expired.
+        Retrieve a cached introspection result if not expired. A local miss is read from
+        the shared cache backend in a worker thread.
         
         Args:
             token: The token to look up
@@ -88,15 +94,17 @@ class PATAwareJWTVerifier(JWTVerifier):
         import hashlib
         token_hash = hashlib.sha256(token.encode()).hexdigest()
         
-        if token_hash in self._introspection_cache:
-            cached_token, expiry = self._introspection_cache[token_hash]
+        cached = await self._introspection_cache.load(token_hash)
+        if cached is not None:
+            fields, expiry = cached
             
             # Check if cache entry has expired
             if time.time() < expiry:
-                return cached_token
+                # The token itself isn't cached; it is the one presented
+                return AccessToken.model_validate({**fields, "token": token})
             else:
                 # Remove expired entry
-                del self._introspection_cache[token_hash]
+                self._introspection_cache.delete(token_hash)
         
         return None
     
@@ -121,27 +129,10 @@ class PATAwareJWTVerifier(JWTVerifier):
                 # Don't cache beyond the token's actual expiration
                 expiry_timestamp = min(expiry_timestamp, token_exp)
         
-        self._introspection_cache[token_hash] = (access_token, expiry_timestamp)
-        
-        # Simple cache cleanup: remove expired entries periodically
-        self._cleanup_expired_cache()
-    
-    def _cleanup_expired_cache(self) -> None:
-        """
-        Remove expired entries from the cache.
-        Called periodically during cache updates.
-        """
-        current_time = time.time()
-        expired_keys = [
-            key for key, (_, expiry) in self._introspection_cache.items()
-            if current_time >= expiry
-        ]
-        
-        for key in expired_keys:
-            del self._introspection_cache[key]
-        
-        if expired_keys:
-            print(f"Cleaned up {len(expired_keys)} expired cache entries")
+        # Entries expire (and are evicted beyond 10000 tokens) by themselves
+        ttl_seconds = expiry_timestamp - time.time()
+        if ttl_seconds > 0:
+            self._introspection_cache.set(token_hash, [access_token.model_dump(mode="json", exclude={"token"}), expiry_timestamp], ttl_seconds)
     
     async def _introspect_token(self, token: str) -> Optional[AccessToken]:
         """
@@ -154,7 +145,7 @@ class PATAwareJWTVerifier(JWTVerifier):
             AccessToken if introspection succeeds and token is active, None otherwise
         """
         if not self.introspection_endpoint:
-            print("No introspection endpoint configured")
+            log.warning("introspection.not_configured")
             return None
         
         try:
@@ -183,14 +174,14 @@ class PATAwareJWTVerifier(JWTVerifier):
                 )
                 
                 if response.status_code != 200:
-                    print(f"Introspection failed with status {response.status_code}: {response.text}")
+                    log.warning("introspection.failed", status=response.status_code, body=response.text[:500])
                     return None
                 
                 introspection_result = response.json()
                 
                 # Check if token is active
                 if not introspection_result.get("active", False):
-                    print("Token is not active according to introspection")
+                    log.info("introspection.inactive_token")
                     return None
                 
                 # Convert introspection result to AccessToken format
@@ -219,10 +210,10 @@ class PATAwareJWTVerifier(JWTVerifier):
                 return access_token
                 
         except httpx.HTTPError as e:
-            print(f"HTTP error during token introspection: {e}")
+            log.warning("introspection.http_error", error=str(e))
             return None
         except Exception as e:
-            print(f"Error during token introspection: {e}")
+            log.exception("introspection.error", error=str(e))
             return None
 
 
@@ -1,11 +1,12 @@
 import os
 import json
-from typing import Optional, List, Dict, Any
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, List, Dict, Any
 from dotenv import load_dotenv
-from inmydata_openedge.StructuredData import StructuredDataDriver, AIDataFilter, LogicalOperator, ConditionOperator, TopNOption
 from mcp.server.fastmcp import FastMCP
 from mcp.server.fastmcp import Context
-from mcp_utils import mcp_utils
+from mcp_utils import mcp_utils, warm_up_tenants
 
 load_dotenv(".env", override=True)
 
@@ -17,17 +18,24 @@ if os.getenv("MCP_DEBUG", "0") == "1":
     debugpy.wait_for_client()
     print("Debugger attached. Continuing execution.")
 
-mcp = FastMCP("inmydata-agent-server")
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    # Prefetch the hinted summaries of MCP_WARMUP_TENANTS in the background
+    warm_up_tenants(utils)
+    yield
 
-def utils():
+mcp = FastMCP("inmydata-agent-server", lifespan=lifespan)
+
+def utils(tenant: Optional[str] = None):
+    started_at = time.perf_counter()
     try:
         api_key = os.environ.get('INMYDATA_API_KEY', "")
-        tenant = os.environ.get('INMYDATA_TENANT', "")
+        tenant = tenant or os.environ.get('INMYDATA_TENANT', "")
         server = os.environ.get('INMYDATA_SERVER',"inmydata.com")
         calendar = os.environ.get('INMYDATA_CALENDAR',"default")
         user = os.environ.get('INMYDATA_USER', 'mcp-agent')
         session_id = os.environ.get('INMYDATA_SESSION_ID', 'mcp-session')
-        return mcp_utils(api_key, tenant, calendar, user, session_id, server,"OpenEdge")
+        return mcp_utils(api_key, tenant, calendar, user, session_id, server,"OpenEdge", started_at=started_at)
     except Exception as e:
         raise RuntimeError(f"Error initializing mcp_utils: {e}")
 
@@ -44,13 +52,16 @@ async def get_rows_fast(
     FAST PATH (recommended).
     Use when the request names specific fields and simple filters (no free-form reasoning).
     Returns rows immediately from the warehouse; far faster and cheaper than get_answer.
-    If the output json contains property row_count wil a value less than or equal
-    to 10 then the data property can be used as the answer. 
+    If the output json contains property returned_rows equal to row_count
+    then the data property holds every row and can be used as the answer. 
     If the output json contains a non blank value for the instance_id property 
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk. 
     In that case you MUST use the query_results_fast tool to query the results with SQL
     to get the data you need to answer the question. This is the only way to access larger datasets.
+    A persisted dataset also comes with a profile property: per-column type, approximate distinct count,
+    nulls, min/max, mean/median for numbers and the most frequent values for text. Check it before
+    querying; it often answers the question without a query_results_fast call.
 
     Examples:
     - "Give me the specific average transaction value and profit margin percentage for each region in 2025"
@@ -74,7 +85,7 @@ async def get_rows_fast(
             return json.dumps({"error": "subject parameter is required"})
         if not select:
             return json.dumps({"error": "select parameter is required (list of field names)"})
-        return await utils().get_rows(subject, select, summary, system, where)
+        return await utils().get_rows(subject, select, summary, system, where, ctx=ctx)
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -92,13 +103,18 @@ async def get_top_n_fast(
     FAST PATH for rankings and leaderboards.
     Use when the user asks for "top/bottom N" by a metric (no free-form reasoning).
     Much faster and cheaper than get_answer.
-    If the output json contains property row_count wil a value less than or equal
-    to 10 then the data property can be used as the answer. 
+    If the output json contains property returned_rows equal to row_count
+    then the data property holds every row and can be used as the answer. 
     If the output json contains a non blank value for the instance_id property 
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk.  
     In that case you MUST use the query_results_fast tool to query the results with SQL
     to get the data you need to answer the question. This is the only way to access larger datasets. 
+    A persisted dataset also comes with a profile property: per-column type, approximate distinct count,
+    nulls, min/max, mean/median for numbers and the most frequent values for text. Check it before
+    querying; it often answers the question without a query_results_fast call.
+    If the output json contains local=true the ranking was computed from data already fetched by an
+    earlier call for the same subject, filters and system, without a warehouse round trip.
 
     Example:
     - "Top 10 regions by profit margin in 2025"
@@ -114,7 +130,7 @@ async def get_top_n_fast(
            return json.dumps({"error": "group_by parameter is required"})
        if not order_by:
            return json.dumps({"error": "order_by parameter is required"})
-       return await utils().get_top_n(subject, group_by, order_by, n,system, where)
+       return await utils().get_top_n(subject, group_by, order_by, n,system, where, ctx=ctx)
    except Exception as e:
        return json.dumps({"error": str(e)}) 
    
@@ -122,6 +138,7 @@ async def get_top_n_fast(
 async def query_results_fast(
     instance_id: str = "",
     sql: str = "",
+    profiling: bool = False,
     ctx: Optional[Context] = None
 ) -> str:
    """
@@ -134,6 +151,10 @@ async def query_results_fast(
     The columns will be the same as those returned by the tool that produced the dataset.
     You will have a sample of the data in the data property of the output json from the tool that
     produced the dataset.
+    If the output json contains truncated=true the result was larger than the response budget and
+    only the first returned_rows rows are included; aggregate further or page with LIMIT/OFFSET.
+    Set profiling=true to find out why a query is slow: the output json then has a profiling object
+    with DuckDB's per-operator timings and row counts and the time spent fetching and converting rows.
 
     Example:
     - "Find the biggest difference between credit limit and balance"
@@ -144,10 +165,43 @@ async def query_results_fast(
            return json.dumps({"error": "instance_id parameter is required"})
        if not sql:
            return json.dumps({"error": "sql parameter is required"})
-       return await utils().query_results(instance_id, sql)
+       return await utils().query_results(instance_id, sql, profiling=profiling)
    except Exception as e:
        return json.dumps({"error": str(e)})    
 
+@mcp.resource("dataset://list", name="datasets", mime_type="application/json")
+def list_datasets() -> str:
+    """
+    Datasets persisted for this tenant by get_rows_fast / get_top_n_fast, newest first: instance_id,
+    subject, row_count, columns, and the URIs of each dataset's metadata and first page of rows.
+    """
+    try:
+        return utils().list_datasets()
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.resource("dataset://{instance_id}", name="dataset", mime_type="application/json")
+async def dataset(instance_id: str) -> str:
+    """
+    Metadata of a persisted dataset: column names and types, row_count, the profile when one was
+    computed, and rows_uri_template for paging through its rows.
+    """
+    try:
+        return await utils().dataset_metadata(instance_id)
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.resource("dataset://{instance_id}/rows/{offset}/{limit}", name="dataset_rows", mime_type="application/json")
+async def dataset_rows(instance_id: str, offset: int, limit: int) -> str:
+    """
+    Rows offset .. offset+limit of a persisted dataset, in stored order. Fewer rows are returned when
+    the page would exceed the response budget; read next_uri for the following page (null after the last row).
+    """
+    try:
+        return await utils().dataset_rows(instance_id, offset, limit)
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
 @mcp.tool()
 def get_schema() -> str:
     """
@@ -260,5 +314,37 @@ async def get_calendar_period_date_range(
         return json.dumps({"error": str(e)})
 
 
+
+@mcp.tool()
+async def resolve_calendar_periods(
+    dates: Optional[List[str]] = None,
+    periods: Optional[List[Any]] = None,
+    expressions: Optional[List[str]] = None,
+    as_of: Optional[str] = None,
+    ctx: Optional[Context] = None
+) -> str:
+    """
+    Resolve many calendar questions in one call, instead of one get_financial_periods or
+    get_calendar_period_date_range call per period. Use it to build multi-period comparisons.
+
+    Args:
+        dates: Dates in ISO format (YYYY-MM-DD) to get the financial year, quarter, month and week of
+        periods: Periods to get the start and end dates of, each
+            {"financial_year": 2025, "period_number": 2, "period_type": "quarter"} or [2025, 2, "quarter"]
+        expressions: Relative periods, e.g. "current month", "previous 8 quarters", "last 3 months",
+            "next 2 weeks", "same quarter last year"
+        as_of: Date the expressions are relative to (YYYY-MM-DD), defaults to today
+
+    Returns:
+        JSON string with "dates", "periods" and "expressions" lists in input order (expressions list
+        their periods oldest first); items that cannot be resolved have an "error"
+    """
+    try:
+        return await utils().resolve_calendar(dates, periods, expressions, as_of)
+
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+
 if __name__ == "__main__":
     mcp.run()  # starts STDIO transport and blocks
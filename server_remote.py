@@ -1,15 +1,24 @@
+import asyncio
+import hmac
 import json
 import os
-from typing import Optional, List, Dict, Any
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, List, Dict, Any
 from dotenv import load_dotenv
 from fastapi.responses import JSONResponse
 from fastmcp import FastMCP, Context
 from fastapi import FastAPI
-from mcp_utils import mcp_utils
+from mcp_utils import mcp_utils, timings_enabled, warm_up_tenants
+from mcp_admission import admission, AdmissionRejected
+from mcp_compression import CompressionMiddleware
+from mcp_export import EXPORT_FORMATS, ExportUnavailable, open_export
 from fastmcp.server.dependencies import get_http_headers, get_http_request
 from pydantic import AnyHttpUrl
 from pat_jwt_auth import PATAwareJWTVerifier, PATSupportingRemoteAuthProvider
 from starlette.requests import Request
+from starlette.background import BackgroundTask
+from starlette.responses import PlainTextResponse, StreamingResponse
 
 #get environment variables from .env file if available
 load_dotenv(".env", override=True)
@@ -22,6 +31,7 @@ INMYDATA_USE_OAUTH = os.environ.get('INMYDATA_USE_OAUTH', 'false').lower() == 't
 INMYDATA_INTROSPECTION_CLIENT_ID = os.environ.get('INMYDATA_INTROSPECTION_CLIENT_ID', '')
 INMYDATA_INTROSPECTION_CLIENT_SECRET = os.environ.get('INMYDATA_INTROSPECTION_CLIENT_SECRET', '')
 INMYDATA_TOKEN_CACHE_TTL = int(os.environ.get('INMYDATA_TOKEN_CACHE_TTL', '300'))  # Default 5 minutes
+MCP_METRICS_ENABLED = os.environ.get('MCP_METRICS_ENABLED', 'false').lower() == 'true'
 
 # Configure token validation for your identity provider with PAT support
 token_verifier = PATAwareJWTVerifier(
@@ -59,6 +69,22 @@ class MCPPathRewriteMiddleware:
             return await self.app(new_scope, receive, send)
         return await self.app(scope, receive, send)
 
+def warmup_utils(tenant: str) -> Optional[mcp_utils]:
+    # Startup warm-up uses the tenant's API key from the environment, as the legacy flow does
+    api_key = os.environ.get(tenant.upper() + "_API_KEY", "")
+    if not api_key:
+        return None
+    return mcp_utils(api_key, tenant, 'Default', 'mcp-agent', 'mcp-warmup', INMYDATA_SERVER, "OpenEdge", False)
+
+def with_warmup(lifespan):
+    @asynccontextmanager
+    async def warmup_lifespan(app):
+        async with lifespan(app):
+            # Prefetch the hinted summaries of MCP_WARMUP_TENANTS in the background
+            warm_up_tenants(warmup_utils)
+            yield
+    return warmup_lifespan
+
 if INMYDATA_USE_OAUTH:
     # Initialise FastMCP, and mount to FastAPI app that provides custom auth endpoints
     mcp = FastMCP(name="inmydata-agent-server", auth=auth)
@@ -67,9 +93,10 @@ if INMYDATA_USE_OAUTH:
 
      # Create the main FastAPI app and mount the MCP app
 
-    app = FastAPI(lifespan=mcp_app.lifespan)
+    app = FastAPI(lifespan=with_warmup(mcp_app.lifespan))
     app.mount("/mcp", mcp_app)
     app.add_middleware(MCPPathRewriteMiddleware)
+    app.add_middleware(CompressionMiddleware)
 
     @app.get("/.well-known/mcp.json")
     async def mcp_well_known():
@@ -163,6 +190,7 @@ async def get_tenant(token: str) -> str:
     return tenant
 
 async def utils() -> mcp_utils:
+    started_at = time.perf_counter()
     try:
         if INMYDATA_USE_OAUTH:
             # OAuth flow - use bearer token and extract tenant from token
@@ -173,7 +201,8 @@ async def utils() -> mcp_utils:
             calendar = headers.get('x-inmydata-calendar', 'Default')
             user = headers.get('x-inmydata-user', 'mcp-agent')
             session_id = headers.get('x-inmydata-session-id', 'mcp-session')
-            return mcp_utils(api_key, tenant, calendar, user, session_id, server, "OpenEdge")
+            timings = timings_enabled(headers.get('x-inmydata-timings', ''))
+            return mcp_utils(api_key, tenant, calendar, user, session_id, server, "OpenEdge", timings, started_at)
         else:
             # Legacy flow - use API key from headers or environment variables
             # Fetch headers and request (if available). Preference: query parameter 'tenant' > header 'x-inmydata-tenant'
@@ -207,30 +236,105 @@ async def utils() -> mcp_utils:
                 calendar = 'Default'
             user = headers.get('x-inmydata-user', 'mcp-agent')
             session_id = headers.get('x-inmydata-session-id', 'mcp-session')
+            timings = timings_enabled(headers.get('x-inmydata-timings', ''))
 
-            return mcp_utils(api_key, tenant, calendar, user, session_id, server, "OpenEdge")
+            return mcp_utils(api_key, tenant, calendar, user, session_id, server, "OpenEdge", timings, started_at)
     except Exception as e:
         raise RuntimeError(f"Error initializing mcp_utils: {e}")
 
+@asynccontextmanager
+async def admitted(tool: str) -> AsyncIterator[mcp_utils]:
+    # Resolve the tenant, then hold one of its admission slots for the duration of the call
+    u = await utils()
+    async with admission.admit(u.tenant, tool) as waited:
+        if u.timings is not None:
+            u.timings.add("admission_wait", waited)
+        yield u
+
+async def metrics(request: Request) -> PlainTextResponse:
+    return PlainTextResponse(admission.render_metrics(), media_type="text/plain; version=0.0.4")
+
+if MCP_METRICS_ENABLED:
+    if INMYDATA_USE_OAUTH:
+        app.add_route("/metrics", metrics, methods=["GET"])
+    else:
+        mcp.custom_route("/metrics", methods=["GET"])(metrics)
+
+async def verified_tenant(request: Request) -> str:
+    # Tenant whose persisted datasets the caller may read, for the export route and dataset:// resources.
+    # OAuth: the tenant of the verified bearer token, never a header. Legacy: the tenant from the query
+    # or header, whose <TENANT>_API_KEY must be configured and be the bearer token
+    token = request.headers.get('authorization', '').replace('Bearer ', '')
+    if not token:
+        raise PermissionError("Authorization header is required")
+    if INMYDATA_USE_OAUTH:
+        return await get_tenant(token)
+    tenant = request.query_params.get('tenant', '') or request.headers.get('x-inmydata-tenant', '')
+    if not tenant:
+        raise PermissionError("tenant query parameter or x-inmydata-tenant header is required")
+    expected = os.environ.get(tenant.upper() + "_API_KEY", "")
+    if not expected:
+        raise PermissionError(f"No API key is configured for tenant '{tenant}'; set {tenant.upper()}_API_KEY")
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        raise PermissionError("Invalid API key")
+    return tenant
+
+async def export_dataset(request: Request):
+    """
+    Stream the dataset behind an instance_id as gzip CSV, Parquet or Arrow IPC:
+    GET /datasets/{instance_id}/export?format=csv|parquet|arrow (default parquet)
+    """
+    instance_id = request.path_params["instance_id"]
+    fmt = request.query_params.get('format', 'parquet').lower()
+    if fmt not in EXPORT_FORMATS:
+        return JSONResponse(status_code=400, content={"error": f"Unsupported format '{fmt}'; use one of {', '.join(EXPORT_FORMATS)}"})
+    try:
+        tenant = await verified_tenant(request)
+    except Exception as e:
+        return JSONResponse(status_code=401, content={"error": str(e)})
+    server = request.headers.get('x-inmydata-server', '') or INMYDATA_SERVER
+    duckdb_path = mcp_utils("", tenant, 'Default', 'mcp-agent', 'mcp-export', server, "OpenEdge", False).dataset_file(instance_id)
+    if duckdb_path is None:
+        return JSONResponse(status_code=404, content={"error": f"Dataset {instance_id} not found"})
+    try:
+        export = await asyncio.to_thread(open_export, duckdb_path, fmt)
+    except ExportUnavailable as e:
+        return JSONResponse(status_code=501, content={"error": str(e)})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"error": str(e)})
+    # The export's files and connection are released when the stream ends; the background task
+    # covers a response that never starts streaming
+    return StreamingResponse(export.chunks(), media_type=export.media_type, headers=export.headers(instance_id),
+                             background=BackgroundTask(export.close))
+
+if INMYDATA_USE_OAUTH:
+    app.add_route("/datasets/{instance_id}/export", export_dataset, methods=["GET"])
+else:
+    mcp.custom_route("/datasets/{instance_id}/export", methods=["GET"])(export_dataset)
+
 @mcp.tool()
 async def get_rows_fast(
     subject: str = "",
     select: List[str] = [],
     where: List[Dict[str, Any]] = [],
     summary: bool = True,
-    system: str = ""    
+    system: str = "",
+    ctx: Optional[Context] = None
 ) -> str:
     """
     FAST PATH (recommended).
     Use when the request names specific fields and simple filters (no free-form reasoning).
     Returns rows immediately from the warehouse; far faster and cheaper than get_answer.
-    If the output json contains property row_count wil a value less than or equal
-    to 10 then the data property can be used as the answer. 
+    If the output json contains property returned_rows equal to row_count
+    then the data property holds every row and can be used as the answer. 
     If the output json contains a non blank value for the instance_id property 
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk. 
     In that case you MUST use the query_results_fast tool to query the results with SQL
     to get the data you need to answer the question. This is the only way to access larger datasets.
+    A persisted dataset also comes with a profile property: per-column type, approximate distinct count,
+    nulls, min/max, mean/median for numbers and the most frequent values for text. Check it before
+    querying; it often answers the question without a query_results_fast call.
 
     Examples:
     - "Give me the specific average transaction value and profit margin percentage for each region in 2025"
@@ -252,7 +356,10 @@ async def get_rows_fast(
             return json.dumps({"error": "subject parameter is required"})
         if not select:
             return json.dumps({"error": "select parameter is required (list of field names)"})
-        return await (await utils()).get_rows(subject, select,summary,system, where)
+        async with admitted("get_rows_fast") as u:
+            return await u.get_rows(subject, select,summary,system, where, ctx=ctx)
+    except AdmissionRejected as e:
+        return e.to_json()
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -263,19 +370,25 @@ async def get_top_n_fast(
     order_by: str = "",
     n: int = 10,
     system: str = "",
-    where: List[Dict[str, Any]] = []
+    where: List[Dict[str, Any]] = [],
+    ctx: Optional[Context] = None
 ) -> str:
    """
     FAST PATH for rankings and leaderboards.
     Use when the user asks for "top/bottom N" by a metric (no free-form reasoning).
     Much faster and cheaper than get_answer.
-    If the output json contains property row_count wil a value less than or equal
-    to 10 then the data property can be used as the answer. 
+    If the output json contains property returned_rows equal to row_count
+    then the data property holds every row and can be used as the answer. 
     If the output json contains a non blank value for the instance_id property 
     then the data property will only contain a sample of the data and the full data set 
     can be found in a table named my_table in a DuckDB database file saved on disk.  
     In that case you MUST use the query_results_fast tool to query the results with SQL
     to get the data you need to answer the question. This is the only way to access larger datasets. 
+    A persisted dataset also comes with a profile property: per-column type, approximate distinct count,
+    nulls, min/max, mean/median for numbers and the most frequent values for text. Check it before
+    querying; it often answers the question without a query_results_fast call.
+    If the output json contains local=true the ranking was computed from data already fetched by an
+    earlier call for the same subject, filters and system, without a warehouse round trip.
 
     Example:
     - "Top 10 regions by profit margin in 2025"
@@ -289,7 +402,10 @@ async def get_top_n_fast(
            return json.dumps({"error": "group_by parameter is required"})
        if not order_by:
            return json.dumps({"error": "order_by parameter is required"})
-       return await (await utils()).get_top_n(subject, group_by, order_by, n,system, where)
+       async with admitted("get_top_n_fast") as u:
+           return await u.get_top_n(subject, group_by, order_by, n,system, where, ctx=ctx)
+   except AdmissionRejected as e:
+       return e.to_json()
    except Exception as e:
        return json.dumps({"error": str(e)}) 
       
@@ -297,6 +413,7 @@ async def get_top_n_fast(
 async def query_results_fast(
     instance_id: str = "",
     sql: str = "",
+    profiling: bool = False,
     ctx: Optional[Context] = None
 ) -> str:
    """
@@ -309,6 +426,10 @@ async def query_results_fast(
     The columns will be the same as those returned by the tool that produced the dataset.
     You will have a sample of the data in the data property of the output json from the tool that
     produced the dataset.
+    If the output json contains truncated=true the result was larger than the response budget and
+    only the first returned_rows rows are included; aggregate further or page with LIMIT/OFFSET.
+    Set profiling=true to find out why a query is slow: the output json then has a profiling object
+    with DuckDB's per-operator timings and row counts and the time spent fetching and converting rows.
 
     Example:
     - "Find the biggest difference between credit limit and balance"
@@ -319,10 +440,50 @@ async def query_results_fast(
            return json.dumps({"error": "instance_id parameter is required"})
        if not sql:
            return json.dumps({"error": "sql parameter is required"})
-       return await (await utils()).query_results(instance_id, sql)
+       return await (await utils()).query_results(instance_id, sql, profiling=profiling)
    except Exception as e:
        return json.dumps({"error": str(e)})   
 
+async def dataset_utils() -> mcp_utils:
+    # Datasets are read from this server's disk rather than through inmydata, so the tenant
+    # must be one the caller was verified for
+    u = await utils()
+    u.tenant = await verified_tenant(get_http_request())
+    return u
+
+@mcp.resource("dataset://list", name="datasets", mime_type="application/json")
+async def list_datasets() -> str:
+    """
+    Datasets persisted for this tenant by get_rows_fast / get_top_n_fast, newest first: instance_id,
+    subject, row_count, columns, and the URIs of each dataset's metadata and first page of rows.
+    """
+    try:
+        return (await dataset_utils()).list_datasets()
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.resource("dataset://{instance_id}", name="dataset", mime_type="application/json")
+async def dataset(instance_id: str) -> str:
+    """
+    Metadata of a persisted dataset: column names and types, row_count, the profile when one was
+    computed, and rows_uri_template for paging through its rows.
+    """
+    try:
+        return await (await dataset_utils()).dataset_metadata(instance_id)
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+@mcp.resource("dataset://{instance_id}/rows/{offset}/{limit}", name="dataset_rows", mime_type="application/json")
+async def dataset_rows(instance_id: str, offset: int, limit: int) -> str:
+    """
+    Rows offset .. offset+limit of a persisted dataset, in stored order. Fewer rows are returned when
+    the page would exceed the response budget; read next_uri for the following page (null after the last row).
+    """
+    try:
+        return await (await dataset_utils()).dataset_rows(instance_id, offset, limit)
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
 @mcp.tool()
 async def get_schema() -> str:
     """
@@ -346,8 +507,11 @@ async def get_schema() -> str:
         ]
     """
     try:
-        return (await utils()).get_schema()
+        async with admitted("get_schema") as u:
+            return u.get_schema()
 
+    except AdmissionRejected as e:
+        return e.to_json()
     except Exception as e:
         # Mirror your C# error string style
         return f"Error retrieving subjects: {e}"
@@ -366,8 +530,11 @@ async def get_financial_periods(
         JSON string with all financial periods
     """
     try:
-        return await (await utils()).get_financial_periods(target_date)
+        async with admitted("get_financial_periods") as u:
+            return await u.get_financial_periods(target_date)
     
+    except AdmissionRejected as e:
+        return e.to_json()
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -394,41 +561,79 @@ async def get_calendar_period_date_range(
         JSON string with start_date and end_date
     """
     try:
-        # If any parameter is None, fetch current financial periods
-        if financial_year is None or period_number is None or period_type is None:
-            periods_result = await (await utils()).get_financial_periods(None)
-            periods_data = json.loads(periods_result)
-            
-            if "error" in periods_data:
-                return periods_result
-            
-            # Parse the periods JSON
-            periods_str = periods_data.get("periods", "{}")
-            try:
-                periods = json.loads(periods_str) if isinstance(periods_str, str) else periods_str
-            except:
-                periods = {}
-            
-            # Auto-fill missing parameters from current periods
-            if financial_year is None:
-                financial_year = periods.get("FinancialYear", periods.get("Year", 0))
-            
-            if period_number is None:
-                # Default to current month if not specified
-                period_number = periods.get("Month", periods.get("Period", 1))
-            
-            if period_type is None:
-                period_type = "month"  # Default to month
-        
-        if not financial_year:
-            return json.dumps({"error": "Could not determine financial_year"})
-        if not period_number:
-            return json.dumps({"error": "Could not determine period_number"})
-        if not period_type:
-            return json.dumps({"error": "period_type parameter is required"})
-            
-        return await (await utils()).get_calendar_period_date_range(financial_year, period_number, period_type)
-    
+        # One admission covers the lookup of the current periods and the range itself
+        async with admitted("get_calendar_period_date_range") as u:
+            # If any parameter is None, fetch current financial periods
+            if financial_year is None or period_number is None or period_type is None:
+                periods_result = await u.get_financial_periods(None)
+                periods_data = json.loads(periods_result)
+
+                if "error" in periods_data:
+                    return periods_result
+
+                # Parse the periods JSON
+                periods_str = periods_data.get("periods", "{}")
+                try:
+                    periods = json.loads(periods_str) if isinstance(periods_str, str) else periods_str
+                except:
+                    periods = {}
+
+                # Auto-fill missing parameters from current periods
+                if financial_year is None:
+                    financial_year = periods.get("FinancialYear", periods.get("Year", 0))
+
+                if period_number is None:
+                    # Default to current month if not specified
+                    period_number = periods.get("Month", periods.get("Period", 1))
+
+                if period_type is None:
+                    period_type = "month"  # Default to month
+
+            if not financial_year:
+                return json.dumps({"error": "Could not determine financial_year"})
+            if not period_number:
+                return json.dumps({"error": "Could not determine period_number"})
+            if not period_type:
+                return json.dumps({"error": "period_type parameter is required"})
+
+            return await u.get_calendar_period_date_range(financial_year, period_number, period_type)
+
+    except AdmissionRejected as e:
+        return e.to_json()
+    except Exception as e:
+        return json.dumps({"error": str(e)})
+
+
+
+@mcp.tool()
+async def resolve_calendar_periods(
+    dates: Optional[List[str]] = None,
+    periods: Optional[List[Any]] = None,
+    expressions: Optional[List[str]] = None,
+    as_of: Optional[str] = None
+) -> str:
+    """
+    Resolve many calendar questions in one call, instead of one get_financial_periods or
+    get_calendar_period_date_range call per period. Use it to build multi-period comparisons.
+
+    Args:
+        dates: Dates in ISO format (YYYY-MM-DD) to get the financial year, quarter, month and week of
+        periods: Periods to get the start and end dates of, each
+            {"financial_year": 2025, "period_number": 2, "period_type": "quarter"} or [2025, 2, "quarter"]
+        expressions: Relative periods, e.g. "current month", "previous 8 quarters", "last 3 months",
+            "next 2 weeks", "same quarter last year"
+        as_of: Date the expressions are relative to (YYYY-MM-DD), defaults to today
+
+    Returns:
+        JSON string with "dates", "periods" and "expressions" lists in input order (expressions list
+        their periods oldest first); items that cannot be resolved have an "error"
+    """
+    try:
+        async with admitted("resolve_calendar_periods") as u:
+            return await u.resolve_calendar(dates, periods, expressions, as_of)
+
+    except AdmissionRejected as e:
+        return e.to_json()
     except Exception as e:
         return json.dumps({"error": str(e)})
 
@@ -452,6 +657,8 @@ if __name__ == "__main__":
     else:
         # Create the app after tools are registered
         app = mcp.streamable_http_app()
+        app.router.lifespan_context = with_warmup(app.router.lifespan_context)
+        app.add_middleware(CompressionMiddleware)
         print(f"Starting MCP server with streamable-http transport on port {port}")
         print("Credentials should be passed via headers:")
         print("  Authorization: Your API key, prefixed with 'Bearer '")
@@ -460,6 +667,7 @@ if __name__ == "__main__":
         print("  x-inmydata-calendar: Your calendar name")
         print("  x-inmydata-user: User for events (optional, default: mcp-agent)")
         print("  x-inmydata-session-id: Session ID (optional, default: mcp-session)")
+        print("  x-inmydata-timings: 1 to embed per-call timings in tool responses (optional)")
     
     uvicorn.run(app, host="0.0.0.0", port=port, ws="none")
 